@@ -0,0 +1,223 @@
+import math
+import threading
+import time
+
+# --- Sprotna analitika časov cikla škatle ---
+#
+# Robot (UR5/David.txt) za vsako škatlo pošlje fiksno zaporedje stanj.
+# Iz zaporednih dogodkov istega robota računamo trajanje posameznih faz in
+# celotnega cikla. Zadnje stanje (ODPRAVLJENA) robot pošlje le, če je škatla še
+# pri senzorju; če za predzadnjim stanjem pride že prvo stanje nove škatle, je
+# bila prejšnja odpravljena ob predzadnjem stanju. Vsaka posodobitev je O(1): percentile ocenjujemo z
+# algoritmom P² (Jain & Chlamtac, 1985), ki hrani le pet markerjev na
+# percentil, zato ni treba hraniti ali ponovno pregledovati zgodovine.
+
+KVANTILI = (0.5, 0.95, 0.99)
+EWMA_ALFA = 0.1  # Utež zadnje meritve pri drsečem povprečju
+URE_PRETOKA = 24  # Toliko zadnjih ur (vključno s tekočo) prikažemo v pretoku odpravljenih škatel
+
+
+class P2Quantile:
+    """Ocena enega kvantila po algoritmu P² s konstantnim pomnilnikom."""
+
+    def __init__(self, p):
+        self.p = p
+        self._n = 0
+        self._q = []  # Višine markerjev
+        self._pozicije = [1, 2, 3, 4, 5]
+        self._zelene = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self._prirastki = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def dodaj(self, x):
+        self._n += 1
+        if self._n <= 5:
+            self._q.append(x)
+            self._q.sort()
+            return
+
+        q, n = self._q, self._pozicije
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._zelene[i] += self._prirastki[i]
+
+        for i in (1, 2, 3):
+            d = self._zelene[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                nova = self._parabolicno(i, d)
+                if not q[i - 1] < nova < q[i + 1]:
+                    nova = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = nova
+                n[i] += d
+
+    def _parabolicno(self, i, d):
+        q, n = self._q, self._pozicije
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    def vrednost(self):
+        if not self._n:
+            return None
+        if self._n <= 5:
+            # Premalo meritev za markerje - vrni točen kvantil
+            urejeni = self._q
+            return urejeni[min(len(urejeni) - 1, max(0, math.ceil(self.p * len(urejeni)) - 1))]
+        return self._q[2]
+
+
+class StreamingStats:
+    """Število, povprečje, drseče povprečje, min/max in kvantili trajanj (v sekundah)."""
+
+    def __init__(self):
+        self.stevilo = 0
+        self.vsota = 0.0
+        self.ewma = None
+        self.minimum = None
+        self.maksimum = None
+        self.zadnje = None
+        self._kvantili = [P2Quantile(p) for p in KVANTILI]
+
+    def dodaj(self, x):
+        self.stevilo += 1
+        self.vsota += x
+        self.zadnje = x
+        self.ewma = x if self.ewma is None else EWMA_ALFA * x + (1 - EWMA_ALFA) * self.ewma
+        self.minimum = x if self.minimum is None else min(self.minimum, x)
+        self.maksimum = x if self.maksimum is None else max(self.maksimum, x)
+        for kvantil in self._kvantili:
+            kvantil.dodaj(x)
+
+    def povzetek(self):
+        povzetek = {
+            "stevilo": self.stevilo,
+            "povprecje_s": _zaokrozi(self.vsota / self.stevilo) if self.stevilo else None,
+            "drsece_povprecje_s": _zaokrozi(self.ewma),
+            "min_s": _zaokrozi(self.minimum),
+            "max_s": _zaokrozi(self.maksimum),
+            "zadnje_s": _zaokrozi(self.zadnje),
+        }
+        for kvantil in self._kvantili:
+            povzetek[f"p{round(kvantil.p * 100)}_s"] = _zaokrozi(kvantil.vrednost())
+        return povzetek
+
+
+class _RobotCikel:
+    """Stanje analitike za enega robota."""
+
+    def __init__(self):
+        self.zadnji_kljuc = None
+        self.zadnji_cas_ns = None
+        self.zacetek_skatle_ns = None
+        self.cikel = StreamingStats()
+        self.faze = {}
+
+
+class CycleAnalytics:
+    """Sprotni izračun trajanja faz in ciklov škatle ter pretoka po urah."""
+
+    def __init__(self, zaporedje):
+        self.zaporedje = list(zaporedje)
+        self.prvo_stanje = self.zaporedje[0]
+        self.zadnje_stanje = self.zaporedje[-1]
+        self.predzadnje_stanje = self.zaporedje[-2] if len(self.zaporedje) > 2 else None
+        # Pari zaporednih stanj, katerih razmik je trajanje faze
+        self._faze = {(a, b): f"{a}→{b}" for a, b in zip(self.zaporedje, self.zaporedje[1:])}
+
+        self._lock = threading.Lock()
+        self._roboti = {}
+        self._cikel = StreamingStats()
+        self._faze_skupaj = {ime: StreamingStats() for ime in self._faze.values()}
+        self._po_urah = {}  # Začetek ure v s -> število odpravljenih škatel; ure brez škatel manjkajo
+
+    def dodaj(self, robot, kljuc, cas_ns):
+        """Obdela en dogodek robota. Kliče ga nit za sprejem ob vsakem veljavnem stanju."""
+        with self._lock:
+            r = self._roboti.get(robot)
+            if r is None:
+                r = self._roboti[robot] = _RobotCikel()
+
+            faza = self._faze.get((r.zadnji_kljuc, kljuc))
+            if faza is not None:
+                trajanje = (cas_ns - r.zadnji_cas_ns) / 1e9
+                self._faze_skupaj[faza].dodaj(trajanje)
+                stat = r.faze.get(faza)
+                if stat is None:
+                    stat = r.faze[faza] = StreamingStats()
+                stat.dodaj(trajanje)
+
+            if kljuc == self.prvo_stanje:
+                if r.zadnji_kljuc == self.predzadnje_stanje:
+                    # Škatla je odšla brez zadnjega stanja - cikel se je končal ob predzadnjem
+                    self._koncaj_cikel(r, r.zadnji_cas_ns)
+                r.zacetek_skatle_ns = cas_ns
+            elif kljuc == self.zadnje_stanje:
+                self._koncaj_cikel(r, cas_ns)
+
+            r.zadnji_kljuc = kljuc
+            r.zadnji_cas_ns = cas_ns
+
+    def _koncaj_cikel(self, r, cas_ns):
+        if r.zacetek_skatle_ns is not None:
+            trajanje = (cas_ns - r.zacetek_skatle_ns) / 1e9
+            self._cikel.dodaj(trajanje)
+            r.cikel.dodaj(trajanje)
+            r.zacetek_skatle_ns = None
+        self._prestej_odpravljeno(cas_ns)
+
+    def _prestej_odpravljeno(self, cas_ns):
+        ura = _ura(cas_ns)
+        po_urah = self._po_urah
+        po_urah[ura] = po_urah.get(ura, 0) + 1
+        if len(po_urah) > URE_PRETOKA:
+            meja = max(po_urah) - URE_PRETOKA * 3600
+            for stara in [u for u in po_urah if u <= meja]:
+                del po_urah[stara]
+
+    def povzetek(self, robot=None):
+        """Povzetek za vse robote skupaj ali (z robot=) za enega. None, če robot ni znan."""
+        with self._lock:
+            if robot is not None:
+                r = self._roboti.get(robot)
+                if r is None:
+                    return None
+                return {
+                    "robot": robot,
+                    "cikel": r.cikel.povzetek(),
+                    "faze": {ime: stat.povzetek() for ime, stat in r.faze.items()},
+                    "zadnje_stanje": r.zadnji_kljuc,
+                }
+
+            # Zadnjih URE_PRETOKA ur do tekoče, tudi tiste brez odpravljenih škatel
+            ta_ura = _ura(time.time_ns())
+            ure = range(ta_ura - (URE_PRETOKA - 1) * 3600, ta_ura + 1, 3600)
+            return {
+                "cikel": self._cikel.povzetek(),
+                "faze": {ime: stat.povzetek() for ime, stat in self._faze_skupaj.items()},
+                "pretok": {
+                    "po_urah": [{"ura": ura, "odpravljenih": self._po_urah.get(ura, 0)} for ura in ure],
+                    "ta_ura": self._po_urah.get(ta_ura, 0),
+                },
+                "roboti": {ime: r.cikel.povzetek() for ime, r in self._roboti.items()},
+            }
+
+
+def _ura(cas_ns):
+    """Začetek ure (sekunde od epohe), v kateri je cas_ns."""
+    return cas_ns // 1_000_000_000 // 3600 * 3600
+
+
+def _zaokrozi(x):
+    return None if x is None else round(x, 3)
@@ -0,0 +1,155 @@
+import atexit
+import json
+import sys
+import threading
+import time
+from collections import deque
+
+# --- Asinhrono beleženje (izpis na konzolo ne zavira sprejema) ---
+#
+# Nit za sprejem zapis le doda v vrsto (deque.append je v CPythonu atomaren,
+# zato brez zaklepanja). Ločena pisalna nit zapise pobira v paketih in jih
+# izpiše z enim write()/flush(). Če se vrsta polni hitreje, kot jih konzola
+# sprejme, najprej vzorčimo, nato zavržemo zapise pod nivojem WARNING;
+# število izpuščenih zapisov izpišemo, ko se vrsta sprazni.
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+NIVOJI = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+IMENA_NIVOJEV = {v: k for k, v in NIVOJI.items()}
+
+FORMAT_BESEDILO = "besedilo"
+FORMAT_JSON = "json"
+
+
+class AsyncLog:
+    """Strukturiran dnevnik z ločeno pisalno nitjo in omejeno vrsto."""
+
+    def __init__(self, nivo=INFO, kapaciteta=10_000, velikost_paketa=512, interval_s=0.1,
+                 vzorcenje=10, format=FORMAT_BESEDILO, izhod=None):
+        self.nivo = nivo
+        self.kapaciteta = kapaciteta
+        self.velikost_paketa = velikost_paketa
+        self.interval_s = interval_s
+        self.vzorcenje = vzorcenje  # Nad polovico kapacitete ohranimo le vsak n-ti zapis pod WARNING
+        self.format = format
+        self.izhod = izhod
+
+        self._vrsta = deque()
+        self._zbudi = threading.Event()
+        self._izpusceni = 0
+        self._stevec_vzorcenja = 0
+        self._nit = None
+        self._tece = False
+        self._start_lock = threading.Lock()
+
+    def nastavi(self, nivo=None, format=None, izhod=None):
+        if nivo is not None:
+            self.nivo = NIVOJI[nivo.upper()] if isinstance(nivo, str) else nivo
+        if format is not None:
+            self.format = format
+        if izhod is not None:
+            self.izhod = izhod
+
+    def debug(self, sporocilo, /, **polja):
+        if self.nivo <= DEBUG:
+            self._dodaj(DEBUG, sporocilo, polja)
+
+    def info(self, sporocilo, /, **polja):
+        if self.nivo <= INFO:
+            self._dodaj(INFO, sporocilo, polja)
+
+    def warning(self, sporocilo, /, **polja):
+        if self.nivo <= WARNING:
+            self._dodaj(WARNING, sporocilo, polja)
+
+    def error(self, sporocilo, /, **polja):
+        self._dodaj(ERROR, sporocilo, polja)
+
+    @property
+    def izpusceni(self):
+        """Število zapisov, ki smo jih zaradi polne vrste zavrgli ali izpustili pri vzorčenju."""
+        return self._izpusceni
+
+    def _dodaj(self, nivo, sporocilo, polja):
+        if not self._tece:
+            self.start()
+
+        dolzina = len(self._vrsta)
+        if nivo < WARNING and dolzina >= self.kapaciteta // 2:
+            if dolzina >= self.kapaciteta:
+                self._izpusceni += 1
+                return
+            self._stevec_vzorcenja += 1
+            if self._stevec_vzorcenja % self.vzorcenje:
+                self._izpusceni += 1
+                return
+        elif dolzina >= 2 * self.kapaciteta:
+            # Tudi napake ne smejo porabiti neomejeno pomnilnika
+            self._izpusceni += 1
+            return
+
+        self._vrsta.append((time.time(), nivo, sporocilo, polja))
+        if dolzina + 1 >= self.velikost_paketa:
+            self._zbudi.set()
+
+    def start(self):
+        with self._start_lock:
+            if self._tece:
+                return
+            self._tece = True
+            self._nit = threading.Thread(target=self._pisalna_nit, name="async_log", daemon=True)
+            self._nit.start()
+            atexit.register(self.zapri)
+
+    def zapri(self):
+        """Izpiše vse čakajoče zapise in ustavi pisalno nit."""
+        self._tece = False
+        self._zbudi.set()
+        if self._nit is not None and self._nit is not threading.current_thread():
+            self._nit.join(timeout=5)
+            self._nit = None
+
+    def _pisalna_nit(self):
+        while True:
+            self._zbudi.wait(self.interval_s)
+            self._zbudi.clear()
+            tece = self._tece
+            while self._vrsta:
+                self._izpisi_paket()
+            if self._izpusceni:
+                izpusceni, self._izpusceni = self._izpusceni, 0
+                self._izpisi([(time.time(), WARNING, "Izpuščeni zapisi dnevnika zaradi preobremenitve",
+                               {"stevilo": izpusceni})])
+            if not tece:
+                return
+
+    def _izpisi_paket(self):
+        paket = []
+        vrsta = self._vrsta
+        while vrsta and len(paket) < self.velikost_paketa:
+            paket.append(vrsta.popleft())
+        self._izpisi(paket)
+
+    def _izpisi(self, paket):
+        if self.format == FORMAT_JSON:
+            vrstice = [json.dumps({"cas": cas, "nivo": IMENA_NIVOJEV[nivo], "dogodek": sporocilo, **polja},
+                                  ensure_ascii=False, default=str)
+                       for cas, nivo, sporocilo, polja in paket]
+        else:
+            vrstice = [_oblikuj(cas, nivo, sporocilo, polja) for cas, nivo, sporocilo, polja in paket]
+        izhod = self.izhod or sys.stdout
+        try:
+            izhod.write("\n".join(vrstice) + "\n")
+            izhod.flush()
+        except (OSError, ValueError):
+            pass  # Izhod ni več na voljo (npr. zaprt ob izhodu iz programa)
+
+
+def _oblikuj(cas, nivo, sporocilo, polja):
+    cas_niz = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(cas))
+    dodatno = "".join(f" {k}={v}" for k, v in polja.items())
+    return f"{cas_niz} {IMENA_NIVOJEV[nivo]:<7} {sporocilo}{dodatno}"
+
+
+# Skupni dnevnik procesa; main.py ga nastavi iz konfiguracije
+log = AsyncLog()
@@ -0,0 +1,202 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+from async_log import log
+from metrics import Registry
+
+# --- Vodilo dogodkov znotraj procesa (objavi/naroči) ---
+#
+# Nit za sprejem vsak nov dogodek objavi enkrat; vodilo ga doda v vrsto vsakega
+# naročnika, obdela pa ga naročnikova nit. Potrdilo robotu tako ne čaka na
+# statistiko, preverjanje ali obveščanje nadzornih plošč, počasen naročnik pa
+# ne zadrži drugih. Vsaka vrsta je omejena; kaj se zgodi, ko je polna, določa
+# politika naročnika:
+#
+#   POLITIKA_ZAVRZI_NAJSTAREJSE  najstarejši dogodek v vrsti se zavrže (števec zavrženih)
+#   POLITIKA_CAKAJ               objava počaka na prostor (največ cakaj_s, nato zavrže);
+#                                za naročnike, ki morajo videti vse dogodke - čaka nit, ki
+#                                objavlja, zato je ne uporabljaj na poti potrdila robotu
+#   POLITIKA_ZADNJI              za vsak ključ (privzeto robota) se hrani le zadnji dogodek;
+#                                vrsta je tako omejena s številom ključev, zamenjani
+#                                dogodki pa se štejejo med zavržene
+#
+# Zamik naročnika merimo v dogodkih (objavljeni - obdelani) in v sekundah
+# (od objave do začetka obdelave zadnjega dogodka).
+
+POLITIKA_ZAVRZI_NAJSTAREJSE = "zavrzi_najstarejse"
+POLITIKA_CAKAJ = "cakaj"
+POLITIKA_ZADNJI = "zadnji"
+
+POLITIKE = (POLITIKA_ZAVRZI_NAJSTAREJSE, POLITIKA_CAKAJ, POLITIKA_ZADNJI)
+
+Dogodek = namedtuple("Dogodek", ["seq", "cas_ns", "robot", "kljuc", "koda"])
+
+
+def _po_robotu(dogodek):
+    return dogodek.robot
+
+
+class Narocnik:
+    """En naročnik vodila: omejena vrsta, politika ob prepolni vrsti in lastna nit.
+
+    obdelaj prejme en dogodek ali (s paketno=True) seznam vseh dogodkov, ki so
+    se nabrali v vrsti. Izjeme v obdelaj se zabeležijo, nit pa teče naprej.
+    """
+
+    def __init__(self, ime, obdelaj, kapaciteta=10_000, politika=POLITIKA_ZAVRZI_NAJSTAREJSE,
+                 cakaj_s=1.0, kljuc=_po_robotu, paketno=False, metrike=None):
+        if politika not in POLITIKE:
+            raise ValueError(f"Neznana politika '{politika}' (možne: {', '.join(POLITIKE)}).")
+        self.ime = ime
+        self.obdelaj = obdelaj
+        self.kapaciteta = kapaciteta
+        self.politika = politika
+        self.cakaj_s = cakaj_s
+        self.kljuc = kljuc
+        self.paketno = paketno
+
+        # Pri POLITIKA_ZADNJI je vrsta slovar ključ -> dogodek (vrstni red vstavljanja)
+        self._vrsta = {} if politika == POLITIKA_ZADNJI else deque()
+        self._pogoj = threading.Condition(threading.Lock())
+        self._nit = None
+        self._tece = False
+        self.objavljenih = 0
+        self.obdelanih = 0
+        self.zavrzenih = 0
+        self.napak = 0
+        self.zamik_s = 0.0
+
+        if metrike is None:
+            metrike = Registry(False)
+        predpona = f"ur5_bus_{ime}"
+        self._m_globina = metrike.gauge(f"{predpona}_queue_depth", f"Dogodki, ki čakajo v vrsti naročnika '{ime}'")
+        self._m_zamik_dogodkov = metrike.gauge(f"{predpona}_lag_events", f"Objavljeni, a še neobdelani dogodki naročnika '{ime}'")
+        self._m_zamik_s = metrike.gauge(f"{predpona}_lag_seconds", f"Čas od objave do obdelave zadnjega dogodka naročnika '{ime}'")
+        self._m_obdelani = metrike.counter(f"{predpona}_delivered_total", f"Dogodki, ki jih je obdelal naročnik '{ime}'")
+        self._m_zavrzeni = metrike.counter(f"{predpona}_dropped_total", f"Dogodki, zavrženi zaradi polne vrste naročnika '{ime}'")
+        self._m_napake = metrike.counter(f"{predpona}_errors_total", f"Napake pri obdelavi dogodkov naročnika '{ime}'")
+
+    def start(self):
+        with self._pogoj:
+            if self._tece:
+                return
+            self._tece = True
+            self._nit = threading.Thread(target=self._nit_narocnika, name=f"vodilo-{self.ime}", daemon=True)
+            self._nit.start()
+
+    def objavi(self, dogodek):
+        """Doda dogodek v vrsto po politiki naročnika. Kliče ga le nit za sprejem."""
+        if not self._tece:
+            self.start()
+        cas = time.perf_counter()
+        with self._pogoj:
+            vrsta = self._vrsta
+            self.objavljenih += 1
+            if self.politika == POLITIKA_ZADNJI:
+                kljuc = self.kljuc(dogodek)
+                if kljuc in vrsta:
+                    del vrsta[kljuc]  # Zamenjani dogodek gre na konec vrste
+                    self._zavrzi()
+                vrsta[kljuc] = (cas, dogodek)
+            else:
+                if len(vrsta) >= self.kapaciteta:
+                    if self.politika == POLITIKA_CAKAJ:
+                        self._pogoj.wait_for(lambda: len(vrsta) < self.kapaciteta or not self._tece, self.cakaj_s)
+                    if len(vrsta) >= self.kapaciteta:
+                        vrsta.popleft()
+                        self._zavrzi()
+                vrsta.append((cas, dogodek))
+            self._m_globina.set(len(vrsta))
+            self._pogoj.notify_all()
+
+    def _zavrzi(self):
+        self.zavrzenih += 1
+        self._m_zavrzeni.inc()
+
+    def _poberi(self):
+        with self._pogoj:
+            self._pogoj.wait_for(lambda: self._vrsta or not self._tece)
+            paket = list(self._vrsta.values() if isinstance(self._vrsta, dict) else self._vrsta)
+            self._vrsta.clear()
+            self._pogoj.notify_all()  # Sprosti objavo, ki čaka na prostor (POLITIKA_CAKAJ)
+            self._m_globina.set(0)
+            return paket
+
+    def _nit_narocnika(self):
+        while True:
+            paket = self._poberi()
+            if not paket:
+                return  # Ustavljen in prazen
+            self.zamik_s = time.perf_counter() - paket[-1][0]
+            self._m_zamik_s.set(self.zamik_s)
+            dogodki = [dogodek for _cas, dogodek in paket]
+            for vnos in ((dogodki,) if self.paketno else dogodki):
+                try:
+                    self.obdelaj(vnos)
+                except Exception as e:
+                    self.napak += 1
+                    self._m_napake.inc()
+                    log.error("❌ Napaka pri obdelavi dogodka na vodilu", narocnik=self.ime, napaka=e)
+            self.obdelanih += len(dogodki)
+            self._m_obdelani.inc(len(dogodki))
+            self._m_zamik_dogodkov.set(self.zamik_dogodkov)
+
+    @property
+    def zamik_dogodkov(self):
+        """Objavljeni dogodki, ki jih naročnik še ni obdelal (zavrženi se ne štejejo)."""
+        return self.objavljenih - self.zavrzenih - self.obdelanih
+
+    def zapri(self, rok_s=5.0):
+        """Počaka, da nit obdela dogodke v vrsti (največ rok_s sekund), in jo ustavi."""
+        with self._pogoj:
+            self._tece = False
+            self._pogoj.notify_all()
+        if self._nit is not None and self._nit is not threading.current_thread():
+            self._nit.join(rok_s)
+            self._nit = None
+
+    def stanje(self):
+        return {
+            "politika": self.politika,
+            "kapaciteta": self.kapaciteta,
+            "v_vrsti": len(self._vrsta),
+            "objavljenih": self.objavljenih,
+            "obdelanih": self.obdelanih,
+            "zavrzenih": self.zavrzenih,
+            "napak": self.napak,
+            "zamik_dogodkov": self.zamik_dogodkov,
+            "zamik_ms": round(self.zamik_s * 1000, 3),
+        }
+
+
+class EventBus:
+    """Vodilo, ki vsak objavljeni dogodek posreduje vsem naročnikom."""
+
+    def __init__(self, metrike=None):
+        self.metrike = metrike
+        self._narocniki = ()  # Terka se ob naročilu zamenja v celoti, zato objava ne potrebuje locka
+        self._lock = threading.Lock()
+        self._m_objave = metrike.counter("ur5_bus_published_total", "Dogodki, objavljeni na vodilu") if metrike else None
+
+    def naroci(self, ime, obdelaj, **nastavitve):
+        """Doda naročnika (nastavitve glej Narocnik) in ga vrne."""
+        narocnik = Narocnik(ime, obdelaj, metrike=self.metrike, **nastavitve)
+        with self._lock:
+            if any(n.ime == ime for n in self._narocniki):
+                raise ValueError(f"Naročnik '{ime}' je že prijavljen.")
+            self._narocniki = self._narocniki + (narocnik,)
+        return narocnik
+
+    def objavi(self, dogodek):
+        for narocnik in self._narocniki:
+            narocnik.objavi(dogodek)
+        if self._m_objave is not None:
+            self._m_objave.inc()
+
+    def narocniki(self):
+        return {narocnik.ime: narocnik.stanje() for narocnik in self._narocniki}
+
+    def zapri(self, rok_s=5.0):
+        for narocnik in self._narocniki:
+            narocnik.zapri(rok_s)
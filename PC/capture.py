@@ -0,0 +1,123 @@
+import atexit
+import struct
+import threading
+import time
+from collections import deque
+
+from async_log import log
+
+# --- Zajem surovih sej robotov (za ponovitev s test/replay_capture.py) ---
+#
+# Zapišemo vsak kos bajtov, kot ga je vrnil recv(), skupaj z monotonim časom
+# prejema ter začetkom in koncem vsake povezave. Iz zajema lahko tako znova
+# ustvarimo enak tok (tudi enako razdeljen na kose), kot ga je poslal robot.
+# Nit za sprejem zapise le doda v vrsto (deque.append brez zaklepanja, kot v
+# async_log.py); na disk jih v paketih zapiše ločena nit. Vrsta je omejena:
+# če disk ne dohaja, kose podatkov zavržemo in jih štejemo (izpusceni), začetke
+# in konce povezav pa hranimo do dvojne kapacitete. Zajem z izpuščenimi kosi ni
+# več zvesta ponovitev seje, zato ob zaprtju izpišemo opozorilo.
+#
+# Oblika datoteke: GLAVA_ZAJEMA, nato zapisi ZAPIS_ZAJEMA + vsebina dolžine
+# "dolzina". Pri POVEZAVA je vsebina naslov robota "ip:vrata" (UTF-8).
+
+GLAVA_ZAJEMA = b"UR5ZAJEM\x01\x00"  # Oznaka in različica oblike
+ZAPIS_ZAJEMA = struct.Struct("<qIBI")  # cas_ns (monotoni), številka povezave, tip, dolžina vsebine
+
+TIP_POVEZAVA = 0
+TIP_PODATKI = 1
+TIP_ZAPRTO = 2
+
+
+class SessionCapture:
+    """Zapisovalnik zajema v datoteko z ločeno pisalno nitjo."""
+
+    def __init__(self, pot, interval_s=0.1, kapaciteta=16_384):
+        self.pot = pot
+        self.interval_s = interval_s
+        self.kapaciteta = kapaciteta  # Kosov v vrsti (recv vrne največ 4 KiB, torej do ~64 MiB)
+        self._vrsta = deque()
+        self._izpusceni = 0
+        self._zbudi = threading.Event()
+        self._datoteka = None
+        self._nit = None
+        self._tece = False
+
+    def start(self):
+        self._datoteka = open(self.pot, "wb")
+        self._datoteka.write(GLAVA_ZAJEMA)
+        self._tece = True
+        self._nit = threading.Thread(target=self._pisalna_nit, name="zajem", daemon=True)
+        self._nit.start()
+        atexit.register(self.zapri)
+
+    @property
+    def izpusceni(self):
+        """Število kosov (in morebitnih začetkov/koncev povezav), ki smo jih zaradi polne vrste zavrgli."""
+        return self._izpusceni
+
+    def povezava(self, stevilka, addr):
+        self._dodaj((time.monotonic_ns(), stevilka, TIP_POVEZAVA, f"{addr[0]}:{addr[1]}".encode("utf-8")),
+                    2 * self.kapaciteta)
+
+    def podatki(self, stevilka, data):
+        self._dodaj((time.monotonic_ns(), stevilka, TIP_PODATKI, data), self.kapaciteta)
+
+    def zaprto(self, stevilka):
+        self._dodaj((time.monotonic_ns(), stevilka, TIP_ZAPRTO, b""), 2 * self.kapaciteta)
+
+    def _dodaj(self, zapis, meja):
+        if len(self._vrsta) >= meja:
+            self._izpusceni += 1
+            return
+        self._vrsta.append(zapis)
+
+    def zapri(self):
+        """Zapiše vse čakajoče zapise in zapre datoteko."""
+        self._tece = False
+        self._zbudi.set()
+        if self._nit is not None and self._nit is not threading.current_thread():
+            self._nit.join(timeout=5)
+            self._nit = None
+        if self._datoteka is not None:
+            self._datoteka.close()
+            self._datoteka = None
+            if self._izpusceni:
+                log.warning("⚠️ Zajem ni popoln: disk ni dohajal sprejema", pot=self.pot, izpusceni=self._izpusceni)
+
+    def _pisalna_nit(self):
+        while True:
+            self._zbudi.wait(self.interval_s)
+            tece = self._tece
+            deli = []
+            vrsta = self._vrsta
+            while vrsta:
+                cas_ns, stevilka, tip, data = vrsta.popleft()
+                deli.append(ZAPIS_ZAJEMA.pack(cas_ns, stevilka, tip, len(data)))
+                deli.append(data)
+            if deli:
+                try:
+                    self._datoteka.write(b"".join(deli))
+                    self._datoteka.flush()
+                except (OSError, ValueError) as e:
+                    log.error("❌ Napaka pri pisanju zajema", pot=self.pot, napaka=e)
+                    return
+            if not tece:
+                return
+
+
+def preberi_zajem(pot):
+    """Vrne zapise zajema kot (cas_ns, stevilka_povezave, tip, vsebina) po vrsti prejema."""
+    with open(pot, "rb") as f:
+        vsebina = f.read()
+    if not vsebina.startswith(GLAVA_ZAJEMA):
+        raise ValueError(f"'{pot}' ni datoteka zajema (ali je druge različice).")
+    zapisi = []
+    odmik = len(GLAVA_ZAJEMA)
+    while odmik + ZAPIS_ZAJEMA.size <= len(vsebina):
+        cas_ns, stevilka, tip, dolzina = ZAPIS_ZAJEMA.unpack_from(vsebina, odmik)
+        odmik += ZAPIS_ZAJEMA.size
+        if odmik + dolzina > len(vsebina):
+            break  # Odrezan zadnji zapis (npr. ob prekinitvi programa)
+        zapisi.append((cas_ns, stevilka, tip, vsebina[odmik:odmik + dolzina]))
+        odmik += dolzina
+    return zapisi
@@ -0,0 +1,86 @@
+import time
+from concurrent.futures import Future
+
+from framing import OZNAKA_UKAZA, UKAZ
+
+# --- Ukazi PC -> robot po obstoječi povezavi robota ---
+#
+# Ukaz pošlje nit REST API-ja, vtičnice pa se dotika le nit za sprejem: ukaz
+# doda v vrsto in zbudi zanko IngestServer (glej ingest.py), ki ga zapiše v
+# izhod povezave kot potrdila. Vsak ukaz ima svoj id, zato je lahko na eni
+# povezavi hkrati na poti več ukazov, robot pa nanje odgovori v poljubnem
+# vrstnem redu. Odgovor poišče ukaz po id-ju in izpolni njegov Future.
+#
+# Nizovni protokol:
+#   PC -> robot:  "UKAZ;<id>;<ime>;<argument>\n"
+#   robot -> PC:  "ODGOVOR=<id>;<besedilo>\n"  (socket_send_line; besedilo brez presledkov)
+#
+#   Robot ukaz prebere v ločeni niti, npr.:
+#     ukaz = socket_read_string("student", prefix="UKAZ;", suffix="\n")
+#   (podatki pred predpono - npr. potrdila "OK" - se zavržejo).
+#
+# Binarni protokol:
+#   PC -> robot:  UKAZ (OZNAKA_UKAZA, id, koda ukaza, argument); potrdila so vedno >= 0,
+#                 zato robot po prvem številu ve, ali bere potrdilo ali ukaz
+#   robot -> PC:  OKVIR (KODA_ODGOVOR, id, rezultat)
+
+PREDPONA_UKAZ = "UKAZ;"
+PREDPONA_ODGOVOR = "ODGOVOR="
+
+
+class RobotNiPovezan(LookupError):
+    """Robot, ki mu želimo poslati ukaz, trenutno ni povezan."""
+
+
+class PovezavaPrekinjena(ConnectionError):
+    """Povezava z robotom se je zaprla, preden je robot odgovoril na ukaz."""
+
+
+class Ukaz:
+    """En poslan ukaz: id, cilj, rok in Future, ki se izpolni z odgovorom robota."""
+
+    __slots__ = ("id", "robot", "ime", "koda", "argument", "rok", "poslano", "povezava", "future")
+
+    def __init__(self, id, robot, ime, koda, argument, rok_s):
+        self.id = id
+        self.robot = robot
+        self.ime = ime
+        self.koda = koda
+        self.argument = argument
+        self.rok = time.monotonic() + rok_s
+        self.poslano = None  # perf_counter ob zapisu v vtičnico
+        self.povezava = None
+        self.future = Future()
+
+    def zakodiraj(self, binarno):
+        if binarno:
+            return UKAZ.pack(OZNAKA_UKAZA, self.id, self.koda, self.argument)
+        return f"{PREDPONA_UKAZ}{self.id};{self.ime};{self.argument}\n".encode("utf-8")
+
+    def odgovor(self, besedilo):
+        """Izpolni Future z odgovorom robota in časom povratne poti."""
+        if self.future.done():
+            return None
+        rtt_s = time.perf_counter() - self.poslano
+        self.future.set_result({
+            "id": self.id,
+            "robot": self.robot,
+            "ukaz": self.ime,
+            "argument": self.argument,
+            "odgovor": besedilo,
+            "rtt_ms": round(rtt_s * 1000, 3),
+        })
+        return rtt_s
+
+    def napaka(self, izjema):
+        if not self.future.done():
+            self.future.set_exception(izjema)
+
+
+def razcleni_odgovor(sporocilo):
+    """'ODGOVOR=<id>;<besedilo>' -> (id, besedilo); None, če oblika ni pravilna."""
+    id_niz, _locilo, besedilo = sporocilo[len(PREDPONA_ODGOVOR):].partition(";")
+    try:
+        return int(id_niz), besedilo
+    except ValueError:
+        return None
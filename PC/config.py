@@ -0,0 +1,40 @@
+import os
+
+from framing import NACIN_KLJUCNE_BESEDE
+
+# --- Skupna konfiguracija sprejema (main.py in headless.py) ---
+# Modul je namenoma lahek (brez Flaska), ker ga headless.py uvozi še pred odprtjem vrat za robota.
+
+HOST = "192.168.65.102"  # Poslušaj na vseh vmesnikih
+TCP_PORT = 50000  # Vrata za komunikacijo z robotom
+LOG_NIVO = "INFO"  # DEBUG, INFO, WARNING ali ERROR; NOVO STANJE se izpiše na nivoju INFO
+LOG_FORMAT = "besedilo"  # "besedilo" ali "json" (strukturirani zapisi, ena vrstica na dogodek)
+FRAMING_MODE = NACIN_KLJUCNE_BESEDE  # Način razčlenjevanja sporočil robota (glej framing.py)
+DNEVNIK_MAPA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dnevnik_dogodkov")  # Trajni dnevnik dogodkov
+DNEVNIK_ZAPISOV_NA_SEGMENT = 100_000  # Po toliko zapisih začnemo nov segment
+DNEVNIK_MAKS_SEGMENTOV = 8  # Starejše segmente stisnemo (omeji porabo diska)
+DNEVNIK_INTERVAL_FSYNC = 0.05  # Sekunde, v katerih se dogodki zberejo za en fsync
+KEEPALIVE = (5, 1, 3)  # TCP keepalive: (sekund tišine, sekund med poskusi, poskusov); mrtvo povezavo zaznamo v ~8 s
+ROK_UTRIPA_S = 5.0  # Robot, ki pošilja utrip (ZIVO), mora kaj poslati vsaj na toliko sekund
+ROK_NEDEJAVNOSTI_S = None  # Rok za robote brez utripa (None = le keepalive; faze trajajo tudi več minut)
+IZLOCAJ_ZASTARELE_POVEZAVE = True  # Ponovna povezava robota zapre njegovo prejšnjo (zastarelo) povezavo
+ROK_ZAUSTAVITVE_S = 10.0  # Ob SIGTERM/Ctrl+C toliko sekund počakamo na zahteve v teku in potrdila robotom
+
+# Stanja škatle (Ključi so sporočila, ki jih mora poslati robot)
+STANJA_SKATLE = {
+    "PRISPELA": "Prispela škatla",
+    "ODPRAVLJENA": "Odpravljena škatla",
+    "ZAKLENJENA": "Zaklenjena škatla",
+    "ODKLENJENA": "Odklenjena škatla",
+    "ODPRTA": "Odprta škatla",
+    "ZAPRTA": "Zaprta škatla"
+}
+ZACETNO_STANJE = "NI_PODATKOV_ROBOT_SE_NI_POVEZAL"
+
+# Zgodovina hrani stanja kot kodo (indeks v OPISI_STANJ) namesto niza.
+# Kode se zapisujejo tudi v trajni dnevnik, robot pa jih pošilja v binarnem protokolu (framing.py),
+# zato novih stanj ne vrivaj med obstoječa - dodaj jih na konec.
+OPISI_STANJ = list(STANJA_SKATLE.values()) + [ZACETNO_STANJE]
+KLJUCI_STANJ = list(STANJA_SKATLE) + [ZACETNO_STANJE]
+KODE_STANJ = {kljuc: koda for koda, kljuc in enumerate(STANJA_SKATLE)}
+KODA_ZACETNEGA_STANJA = len(STANJA_SKATLE)
@@ -0,0 +1,280 @@
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+from async_log import log
+from framing import MAKS_DOLZINA_IMENA
+
+# --- Trajni dnevnik dogodkov (binarni segmenti, samo dodajanje) ---
+#
+# Vsak dogodek je zapis fiksne dolžine (64 bajtov): seq, čas v ns, koda stanja,
+# ime robota in CRC32. Zapise zbiramo v pomnilniku in jih pisalna nit zapiše
+# v paketih z enim fsync() na paket (group commit), zato potrdilo robotu ne
+# čaka na disk. Ob zagonu zadnje segmente preberemo z mmap, brez razčlenjevanja
+# besedila. Ko segment doseže zapisov_na_segment, začnemo novega; ko je
+# segmentov več kot maks_segmentov, najstarejše stisnemo v en segment z zadnjim
+# zapisom vsakega robota.
+#
+# Ob vsaki rotaciji in ob zaprtju pisalna nit zapiše še kontrolno točko: zadnji
+# zapis vsakega robota v enakem formatu. Obnova zato ne bere celega dnevnika,
+# le rep - zapise, novejše od kontrolne točke, in toliko zadnjih, kolikor jih
+# potrebuje zgodovina. Vsak zapis ima svoj CRC, zato pokvarjene zapise (npr. ob
+# izpadu napajanja med pisanjem) preskočimo, pokvarjen rep segmenta pa odrežemo.
+
+ZAPIS = struct.Struct(f"<QqB{MAKS_DOLZINA_IMENA}sI")  # seq, cas_ns, koda, robot, crc32
+VELIKOST_ZAPISA = ZAPIS.size
+_BREZ_CRC = struct.Struct(f"<QqB{MAKS_DOLZINA_IMENA}s")
+_ROBOT = slice(struct.calcsize("<QqB"), _BREZ_CRC.size)  # Bajti imena robota v zapakiranem zapisu
+
+PREDPONA_SEGMENTA = "segment_"
+KONCNICA_SEGMENTA = ".log"
+KONTROLNA_TOCKA = "stanja.kontrolna"  # Zadnji zapis vsakega robota ob zadnji rotaciji ali zaprtju
+
+
+def _ime_segmenta(prvi_seq):
+    return f"{PREDPONA_SEGMENTA}{prvi_seq:020d}{KONCNICA_SEGMENTA}"
+
+
+def zapakiraj(seq, cas_ns, koda, robot):
+    robot_b = robot.encode("utf-8")
+    if len(robot_b) > MAKS_DOLZINA_IMENA:
+        raise ValueError(f"Ime robota je predolgo za dnevnik (največ {MAKS_DOLZINA_IMENA} bajtov).")
+    glava = _BREZ_CRC.pack(seq, cas_ns, koda, robot_b)
+    return glava + struct.pack("<I", zlib.crc32(glava))
+
+
+def _razpakiraj(buf, odmik):
+    """Vrne (seq, cas_ns, koda, robot) ali None, če zapis ni veljaven (npr. napol zapisan)."""
+    seq, cas_ns, koda, robot_b, crc = ZAPIS.unpack_from(buf, odmik)
+    if zlib.crc32(buf[odmik:odmik + _BREZ_CRC.size]) != crc:
+        return None
+    # Starejši dnevniki imajo lahko ime, odrezano sredi znaka UTF-8 - ta del izpustimo, da se ime znova zapakira
+    return seq, cas_ns, koda, robot_b.rstrip(b"\x00").decode("utf-8", errors="ignore")
+
+
+class EventLog:
+    """Trajni dnevnik dogodkov v mapi z rotacijo in stiskanjem segmentov."""
+
+    def __init__(self, mapa, zapisov_na_segment=100_000, maks_segmentov=8, interval_fsync_s=0.05):
+        if maks_segmentov < 2:
+            raise ValueError("Potrebna sta vsaj dva segmenta (stisnjen in trenutni).")
+        self.mapa = mapa
+        self.zapisov_na_segment = zapisov_na_segment
+        self.maks_segmentov = maks_segmentov
+        self.interval_fsync_s = interval_fsync_s
+
+        os.makedirs(mapa, exist_ok=True)
+        self._cakajoci = []
+        self._pogoj = threading.Condition()
+        self._tece = False
+        self._nit = None
+        self._datoteka = None
+        self._zapisov_v_segmentu = 0
+        self._zadnji = None  # Ime robota (bajti) -> zadnji zapisani zapis; vodi ga pisalna nit
+
+    # --- Branje ob zagonu ---
+
+    def segmenti(self):
+        """Seznam poti do segmentov, od najstarejšega do najnovejšega."""
+        imena = sorted(f for f in os.listdir(self.mapa)
+                       if f.startswith(PREDPONA_SEGMENTA) and f.endswith(KONCNICA_SEGMENTA))
+        return [os.path.join(self.mapa, f) for f in imena]
+
+    def obnovi(self, maks_zapisov):
+        """Prebere rep dnevnika od konca proti začetku.
+
+        Vrne (zapisi, stanja): zadnjih največ maks_zapisov zapisov
+        (seq, cas_ns, koda, robot) v naraščajočem vrstnem redu in slovar
+        robot -> zadnji zapis tega robota. Stanja vzame iz kontrolne točke in
+        jih dopolni z novejšimi zapisi; branje konča, ko je za kontrolno točko
+        in ima maks_zapisov zapisov. Brez veljavne kontrolne točke prebere ves
+        dnevnik.
+        """
+        tocka = self._beri_kontrolno_tocko()
+        meja = max((zapis[0] for zapis in tocka.values()), default=-1) if tocka is not None else None
+        zapisi = []
+        novejsi = {}
+        for zapis in self._zapisi_od_konca():
+            za_tocko = meja is None or zapis[0] > meja
+            if not za_tocko and len(zapisi) >= maks_zapisov:
+                break
+            if len(zapisi) < maks_zapisov:
+                zapisi.append(zapis)
+            if za_tocko:
+                novejsi.setdefault(zapis[3], zapis)
+        zapisi.reverse()
+
+        stanja = dict(tocka or {})
+        stanja.update(novejsi)
+        self._zadnji = {}
+        for zapis in stanja.values():
+            zapakiran = zapakiraj(*zapis)
+            self._zadnji[zapakiran[_ROBOT]] = zapakiran
+        return zapisi, stanja
+
+    def _zapisi_od_konca(self):
+        """Zapisi vseh segmentov od najnovejšega proti najstarejšemu; rep zadnjega segmenta popravi."""
+        for i, pot in enumerate(reversed(self.segmenti())):
+            yield from self._beri_segment(pot, popravi_rep=(i == 0))
+
+    def _beri_segment(self, pot, popravi_rep):
+        """Veljavne zapise segmenta vrača od zadnjega proti prvemu (generator); pokvarjene preskoči.
+
+        S popravi_rep najprej odreže nepopoln ali pokvarjen rep (npr. izpad
+        napajanja med pisanjem), da se novi zapisi poravnajo za zadnjim veljavnim.
+        """
+        velikost = os.path.getsize(pot)
+        n = velikost // VELIKOST_ZAPISA
+        if popravi_rep and velikost:
+            if n:
+                with open(pot, "rb") as f, mmap.mmap(f.fileno(), n * VELIKOST_ZAPISA, access=mmap.ACCESS_READ) as mm:
+                    while n and _razpakiraj(mm, (n - 1) * VELIKOST_ZAPISA) is None:
+                        n -= 1
+            if n * VELIKOST_ZAPISA != velikost:
+                log.warning("⚠️ Dnevnik: odrezan nepopoln rep segmenta", segment=os.path.basename(pot))
+                os.truncate(pot, n * VELIKOST_ZAPISA)
+        if n == 0:
+            return
+
+        with open(pot, "rb") as f, mmap.mmap(f.fileno(), n * VELIKOST_ZAPISA, access=mmap.ACCESS_READ) as mm:
+            for j in range(n - 1, -1, -1):
+                zapis = _razpakiraj(mm, j * VELIKOST_ZAPISA)
+                if zapis is None:
+                    log.warning("⚠️ Dnevnik: preskočen pokvarjen zapis", segment=os.path.basename(pot), zapis=j)
+                    continue
+                yield zapis
+
+    def _beri_kontrolno_tocko(self):
+        """Slovar robot -> zadnji zapis iz kontrolne točke ali None, če je ni ali ni veljavna."""
+        pot = os.path.join(self.mapa, KONTROLNA_TOCKA)
+        try:
+            with open(pot, "rb") as f:
+                vsebina = f.read()
+        except FileNotFoundError:
+            return None
+        if len(vsebina) % VELIKOST_ZAPISA:
+            return None
+        tocka = {}
+        for odmik in range(0, len(vsebina), VELIKOST_ZAPISA):
+            zapis = _razpakiraj(vsebina, odmik)
+            if zapis is None:
+                log.warning("⚠️ Dnevnik: kontrolna točka ni veljavna - berem ves dnevnik")
+                return None
+            tocka[zapis[3]] = zapis
+        return tocka
+
+    # --- Pisanje ---
+
+    def start(self):
+        if self._zadnji is None:
+            self.obnovi(0)  # Pisalna nit potrebuje zadnje zapise robotov za kontrolno točko
+        segmenti = self.segmenti()
+        if segmenti:
+            pot = segmenti[-1]
+            self._zapisov_v_segmentu = os.path.getsize(pot) // VELIKOST_ZAPISA
+            self._datoteka = open(pot, "ab")
+        self._tece = True
+        self._nit = threading.Thread(target=self._pisalna_nit, name="eventlog", daemon=True)
+        self._nit.start()
+
+    def dodaj(self, seq, cas_ns, koda, robot):
+        """Doda dogodek v čakalno vrsto za zapis. Ne čaka na disk."""
+        zapis = zapakiraj(seq, cas_ns, koda, robot)
+        with self._pogoj:
+            self._cakajoci.append((seq, zapis))
+            self._pogoj.notify()
+
+    def zapri(self):
+        """Zapiše vse čakajoče dogodke in ustavi pisalno nit."""
+        with self._pogoj:
+            self._tece = False
+            self._pogoj.notify()
+        if self._nit is not None:
+            self._nit.join()
+            self._nit = None
+        if self._datoteka is not None:
+            self._datoteka.close()
+            self._datoteka = None
+            try:
+                self._zapisi_kontrolno_tocko()
+            except OSError as e:
+                log.error("❌ Napaka pri pisanju kontrolne točke dnevnika", napaka=e)
+
+    def _pisalna_nit(self):
+        while True:
+            with self._pogoj:
+                while self._tece and not self._cakajoci:
+                    self._pogoj.wait()
+                if self._tece:
+                    # Počakaj še interval_fsync_s, da se za en fsync nabere več dogodkov
+                    self._pogoj.wait_for(lambda: not self._tece, self.interval_fsync_s)
+                paket, self._cakajoci = self._cakajoci, []
+                tece = self._tece
+            if paket:
+                try:
+                    self._zapisi_paket(paket)
+                except OSError as e:
+                    log.error("❌ Napaka pri pisanju dnevnika dogodkov", napaka=e)
+            if not tece:
+                return
+
+    def _zapisi_paket(self, paket):
+        i = 0
+        while i < len(paket):
+            if self._datoteka is None or self._zapisov_v_segmentu >= self.zapisov_na_segment:
+                self._rotiraj(paket[i][0])
+            prostora = self.zapisov_na_segment - self._zapisov_v_segmentu
+            kos = paket[i:i + prostora]
+            self._datoteka.write(b"".join(zapis for _seq, zapis in kos))
+            self._zapisov_v_segmentu += len(kos)
+            for _seq, zapis in kos:
+                self._zadnji[zapis[_ROBOT]] = zapis
+            i += len(kos)
+        self._datoteka.flush()
+        os.fsync(self._datoteka.fileno())
+
+    def _rotiraj(self, prvi_seq):
+        if self._datoteka is not None:
+            self._datoteka.flush()
+            os.fsync(self._datoteka.fileno())
+            self._datoteka.close()
+            self._zapisi_kontrolno_tocko()  # Obnova po izpadu tako prebere največ trenutni segment
+        self._datoteka = open(os.path.join(self.mapa, _ime_segmenta(prvi_seq)), "ab")
+        self._zapisov_v_segmentu = 0
+        self._stisni()
+
+    def _zapisi_kontrolno_tocko(self):
+        """Atomarno zapiše zadnji zapis vsakega robota; vsi so že sinhronizirani v segmentih."""
+        pot = os.path.join(self.mapa, KONTROLNA_TOCKA)
+        zacasna = pot + ".tmp"
+        with open(zacasna, "wb") as f:
+            f.write(b"".join(self._zadnji.values()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(zacasna, pot)
+
+    def _stisni(self):
+        """Najstarejše segmente združi v enega z zadnjim zapisom vsakega robota."""
+        segmenti = self.segmenti()
+        odvec = len(segmenti) - self.maks_segmentov
+        if odvec <= 0:
+            return
+        stari = segmenti[:odvec + 1]
+
+        zadnji = {}
+        for pot in reversed(stari):
+            for zapis in self._beri_segment(pot, popravi_rep=False):
+                zadnji.setdefault(zapis[3], zapis)
+        zapisi = sorted(zadnji.values())
+
+        cilj = stari[0]
+        zacasna = cilj + ".tmp"
+        with open(zacasna, "wb") as f:
+            f.write(b"".join(zapakiraj(*zapis) for zapis in zapisi))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(zacasna, cilj)
+        for pot in stari[1:]:
+            os.remove(pot)
@@ -0,0 +1,126 @@
+import json
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+# --- Izvoz zgodovine po kosih (CSV, NDJSON, stolpčna binarna oblika) ---
+#
+# Vsi izvozi berejo zgodovino s PogledZgodovine.stolpci(), ki vrača izreze
+# tipiziranih polj po kosih, zato je poraba pomnilnika omejena z velikostjo
+# kosa ne glede na obseg izvoza. Nizi robotov in stanj se pripravijo enkrat
+# (tabele so majhne), čas se pretvori v niz le enkrat na sekundo.
+#
+# Stolpčna oblika: MAGIC_STOLPCI, dolžina glave (<I) in glava v JSON (imena
+# stanj in robotov, opis stolpcev), nato bloki: število vrstic (<I) in za tem
+# stolpci seq (<q), cas_ns (<q), koda (<B), robot (<H) - vsak v celoti. Blok z
+# nič vrsticami označuje konec. Stolpce lahko beremo npr. z numpy.frombuffer.
+
+MAGIC_STOLPCI = b"UR5STOLP\x01\x00"
+STOLPCI = (("seq", "q"), ("cas_ns", "q"), ("koda", "B"), ("robot", "H"))
+_STEVILO = struct.Struct("<I")
+
+CSV_GLAVA = "seq,cas_ns,cas,robot,kljuc,stanje\n"
+
+
+def _csv_polje(niz):
+    if any(znak in niz for znak in ',"\n\r'):
+        return '"' + niz.replace('"', '""') + '"'
+    return niz
+
+
+def _filtriraj(kos, kode, indeks_robota):
+    """Iz kosa stolpcev obdrži vrstice, ki ustrezajo filtroma (kode, indeks robota)."""
+    prvi_seq, casi, kode_k, roboti_k = kos
+    if kode is None and indeks_robota is None:
+        return array('q', range(prvi_seq, prvi_seq + len(casi))), casi, kode_k, roboti_k
+    izbrani = [i for i in range(len(casi))
+               if (kode is None or kode_k[i] in kode) and (indeks_robota is None or roboti_k[i] == indeks_robota)]
+    return (array('q', (prvi_seq + i for i in izbrani)), array('q', (casi[i] for i in izbrani)),
+            array('B', (kode_k[i] for i in izbrani)), array('H', (roboti_k[i] for i in izbrani)))
+
+
+class _CasovniNizi:
+    """Pretvorba ns v niz 'YYYY-MM-DD HH:MM:SS' z enim klicem strftime na sekundo."""
+
+    def __init__(self):
+        self._sekunda = None
+        self._niz = ""
+
+    def __call__(self, cas_ns):
+        sekunda = cas_ns // 1_000_000_000
+        if sekunda != self._sekunda:
+            self._sekunda = sekunda
+            self._niz = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sekunda))
+        return self._niz
+
+
+def csv_kosi(zgodovina, od_seq, do_seq, kljuci, opisi, kode=None, robot=None, velikost_kosa=5000):
+    indeks_robota = zgodovina.indeks_robota(robot) if robot is not None else None
+    if robot is not None and indeks_robota is None:
+        yield CSV_GLAVA.encode("utf-8")
+        return
+    roboti = [_csv_polje(r) for r in zgodovina.roboti()]
+    stanja = [f"{_csv_polje(k)},{_csv_polje(o)}" for k, o in zip(kljuci, opisi)]
+    cas_niz = _CasovniNizi()
+    yield CSV_GLAVA.encode("utf-8")
+    for kos in zgodovina.stolpci(od_seq, do_seq, velikost_kosa):
+        seqi, casi, kode_k, roboti_k = _filtriraj(kos, kode, indeks_robota)
+        yield "".join([f"{s},{c},{cas_niz(c)},{roboti[r]},{stanja[k]}\n"
+                       for s, c, k, r in zip(seqi, casi, kode_k, roboti_k)]).encode("utf-8")
+
+
+def ndjson_kosi(zgodovina, od_seq, do_seq, kljuci, opisi, kode=None, robot=None, velikost_kosa=5000):
+    indeks_robota = zgodovina.indeks_robota(robot) if robot is not None else None
+    if robot is not None and indeks_robota is None:
+        return
+    # Nize JSON pripravimo enkrat; vrstica je nato le sestavljanje
+    roboti = [json.dumps(r, ensure_ascii=False) for r in zgodovina.roboti()]
+    stanja = [f'"kljuc":{json.dumps(k, ensure_ascii=False)},"stanje":{json.dumps(o, ensure_ascii=False)}'
+              for k, o in zip(kljuci, opisi)]
+    cas_niz = _CasovniNizi()
+    for kos in zgodovina.stolpci(od_seq, do_seq, velikost_kosa):
+        seqi, casi, kode_k, roboti_k = _filtriraj(kos, kode, indeks_robota)
+        yield "".join([f'{{"seq":{s},"cas_ns":{c},"cas":"{cas_niz(c)}","robot":{roboti[r]},{stanja[k]}}}\n'
+                       for s, c, k, r in zip(seqi, casi, kode_k, roboti_k)]).encode("utf-8")
+
+
+def stolpcni_kosi(zgodovina, od_seq, do_seq, kljuci, opisi, kode=None, robot=None, velikost_kosa=5000):
+    indeks_robota = zgodovina.indeks_robota(robot) if robot is not None else None
+    glava = json.dumps({
+        "stanja": list(kljuci),
+        "opisi": list(opisi),
+        "roboti": zgodovina.roboti(),
+        "stolpci": [{"ime": ime, "tip": tip} for ime, tip in STOLPCI],
+        "vrstni_red_bajtov": "little",
+    }, ensure_ascii=False).encode("utf-8")
+    yield MAGIC_STOLPCI + _STEVILO.pack(len(glava)) + glava
+    if robot is None or indeks_robota is not None:
+        for kos in zgodovina.stolpci(od_seq, do_seq, velikost_kosa):
+            stolpci = _filtriraj(kos, kode, indeks_robota)
+            if not len(stolpci[0]):
+                continue
+            if sys.byteorder != "little":
+                for stolpec in stolpci:
+                    stolpec.byteswap()
+            yield _STEVILO.pack(len(stolpci[0])) + b"".join(stolpec.tobytes() for stolpec in stolpci)
+    yield _STEVILO.pack(0)
+
+
+def gzip_tok(kosi, stopnja=6):
+    """Stisne tok kosov v obliko gzip sproti, brez zbiranja celotnega izvoza v pomnilniku."""
+    stiskalnik = zlib.compressobj(stopnja, zlib.DEFLATED, 31)
+    for kos in kosi:
+        stisnjeno = stiskalnik.compress(kos)
+        if stisnjeno:
+            yield stisnjeno
+    yield stiskalnik.flush()
+
+
+OBLIKE_IZVOZA = {
+    # oblika -> (funkcija, vrsta vsebine, končnica)
+    "csv": (csv_kosi, "text/csv; charset=utf-8", "csv"),
+    "ndjson": (ndjson_kosi, "application/x-ndjson", "ndjson"),
+    "stolpci": (stolpcni_kosi, "application/octet-stream", "ur5stolp"),
+}
@@ -0,0 +1,264 @@
+import struct
+
+# --- Razčlenjevanje toka bajtov od robota v posamezna sporočila ---
+#
+# TCP ne ohranja meja med sporočili. Robot (UR5/David.script) pošilja gole
+# nize brez ločila, zato lahko dve zaporedni sporočili prispeta v enem klicu
+# recv() (npr. "ODKLENJENAODPRTA"), eno sporočilo pa se lahko razdeli na več
+# klicev. MessageFramer hrani medpomnilnik za vsako povezavo posebej in vrača
+# samo cela sporočila.
+#
+# Sporočila s predpono (npr. "ROBOT=<id>\n", "ODGOVOR=<id>;<besedilo>\n") imajo
+# poljubno vsebino, ki lahko vsebuje tudi ključno besedo, zato jih v načinu
+# ključnih besed beremo do '\n' in jih nikoli ne delimo po ključnih besedah.
+
+NACIN_VRSTICA = "vrstica"                # Sporočila so zaključena z '\n'
+NACIN_DOLZINA = "dolzina"                # 4-bajtna dolžina (big-endian, kot socket_send_int) + vsebina
+NACIN_KLJUCNE_BESEDE = "kljucne_besede"  # Stari način: gole ključne besede brez ločila
+
+NACINI = (NACIN_VRSTICA, NACIN_DOLZINA, NACIN_KLJUCNE_BESEDE)
+
+MAKS_DOLZINA_SPOROCILA = 1024  # Daljši nepopolni ostanki se zavržejo kot neveljavno sporočilo
+LOCILA = b" \t\r\n\x00"  # Znaki, ki jih v načinu ključnih besed preskočimo
+
+_DOLZINA = struct.Struct(">i")
+
+# Ime robota (ROBOT=<id>) se izpiše na spletni strani in zapiše v trajni dnevnik, zato sprejmemo le
+# kratka imena iz varnih znakov; IP naslovi (privzeto ime) ustrezajo tudi sami.
+# MAKS_DOLZINA_IMENA je skupna meja vseh, ki ime hranijo: zgodovine (history.py), deljenega pomnilnika
+# (shm.py) in zapisa trajnega dnevnika (eventlog.py), ki ima zanj 43 bajtov - sprememba spremeni format dnevnika.
+MAKS_DOLZINA_IMENA = 43
+ZNAKI_IMENA = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789._:-")
+
+# --- Binarni protokol (neobvezen, robot ga izbere ob povezavi) ---
+#
+# Vsa števila so 32-bitna, big-endian, kot jih pošilja socket_send_int in bere
+# socket_read_binary_integer. Robot na začetku povezave pošlje POZDRAV, nato pa
+# okvirje fiksne dolžine. PC ne potrjuje vsakega okvirja posebej, temveč po
+# vsakem prejetem kosu pošlje kumulativno POTRDILO z največjo zabeleženo seq,
+# zato lahko robot pošlje več dogodkov, preden počaka na potrdilo. Povezave,
+# ki se ne začnejo s pozdravom, ostanejo v nizovnem načinu (stari programi).
+
+MAGIC_BINARNO = 0x7F553542  # Prvi bajt (0x7F) ni v nobeni ključni besedi, zato način ločimo že po enem bajtu
+POZDRAV = struct.Struct(">ii")  # robot -> PC: (MAGIC_BINARNO, številka robota; 0 = robot določen z IP)
+                                # PC -> robot: (MAGIC_BINARNO, zadnja zabeležena seq tega robota)
+OKVIR = struct.Struct(">iii")   # koda stanja (indeks v STANJA_SKATLE), seq robota (od 1 naprej), čas robota v ms
+POTRDILO = struct.Struct(">i")  # Vsi okvirji do vključno te seq so zabeleženi
+KODA_UTRIP = -1  # Okvir s to kodo je srčni utrip: ni dogodek, PC nanj odgovori s POTRDILO
+KODA_ODGOVOR = -2  # Okvir s to kodo je odgovor na ukaz: (KODA_ODGOVOR, id ukaza, rezultat) - glej commands.py
+UKAZ = struct.Struct(">iiii")  # PC -> robot: (OZNAKA_UKAZA, id ukaza, koda ukaza, argument)
+OZNAKA_UKAZA = -2  # Potrdila so >= 0, zato robot ukaz loči od potrdila po prvem številu
+MAGIC_BAJTI = struct.pack(">i", MAGIC_BINARNO)
+
+
+def je_veljavno_ime(ime):
+    """Ali je ime robota neprazno, največ MAKS_DOLZINA_IMENA znakov in le iz ZNAKI_IMENA."""
+    return 0 < len(ime) <= MAKS_DOLZINA_IMENA and ZNAKI_IMENA.issuperset(ime)
+
+
+class FramingError(ValueError):
+    """Tok bajtov ni več mogoče razčleniti (npr. neveljavna dolžina sporočila)."""
+
+
+class MessageFramer:
+    """Inkrementalni razčlenjevalnik sporočil za eno TCP povezavo.
+
+    feed() sprejme poljuben kos prejetih bajtov in vrne seznam celih sporočil
+    (nizov). Nepopoln ostanek ostane v medpomnilniku do naslednjega klica.
+    """
+
+    def __init__(self, nacin=NACIN_KLJUCNE_BESEDE, kljucne_besede=(), maks_dolzina=MAKS_DOLZINA_SPOROCILA,
+                 predpone_vrstic=()):
+        if nacin not in NACINI:
+            raise ValueError(f"Neznan način razčlenjevanja: '{nacin}' (možni: {', '.join(NACINI)})")
+        if nacin == NACIN_KLJUCNE_BESEDE and not kljucne_besede:
+            raise ValueError("Način ključnih besed potrebuje seznam ključnih besed (npr. STANJA_SKATLE).")
+
+        self.nacin = nacin
+        self.maks_dolzina = maks_dolzina
+        self._buffer = bytearray()
+        # Najdaljše besede najprej, da je ujemanje vedno najdaljše možno
+        self._kljuci = sorted((k.encode("utf-8") for k in kljucne_besede), key=len, reverse=True)
+        # Sporočila s temi predponami v načinu ključnih besed beremo do '\n'
+        self._predpone = [p.encode("utf-8") for p in predpone_vrstic]
+        # Za čakanje na nepopoln začetek sta ključna beseda in predpona enaki
+        self._zacetki = self._kljuci + self._predpone
+        self._najdaljsi_kljuc = max(map(len, self._zacetki), default=0)
+
+    def feed(self, data):
+        """Doda prejete bajte v medpomnilnik in vrne seznam celih sporočil."""
+        self._buffer += data
+        if self.nacin == NACIN_VRSTICA:
+            return self._razcleni_vrstice()
+        if self.nacin == NACIN_DOLZINA:
+            return self._razcleni_dolzine()
+        return self._razcleni_kljucne_besede(koncno=False)
+
+    def flush(self):
+        """Ob zaprtju povezave vrne še morebiten nepopoln ostanek (kot neveljavno sporočilo)."""
+        if self.nacin == NACIN_KLJUCNE_BESEDE:
+            sporocila = self._razcleni_kljucne_besede(koncno=True)
+        else:
+            ostanek = bytes(self._buffer).strip(LOCILA)
+            sporocila = [_dekodiraj(ostanek)] if ostanek and self.nacin == NACIN_VRSTICA else []
+        self._buffer.clear()
+        return sporocila
+
+    @property
+    def v_medpomnilniku(self):
+        """Število bajtov, ki še čakajo na dokončanje sporočila."""
+        return len(self._buffer)
+
+    # --- Posamezni načini ---
+
+    def _razcleni_vrstice(self):
+        buf = self._buffer
+        sporocila = []
+        zacetek = 0
+        while True:
+            konec = buf.find(b"\n", zacetek)
+            if konec < 0:
+                break
+            vrstica = bytes(buf[zacetek:konec]).strip(LOCILA)
+            if vrstica:
+                sporocila.append(_dekodiraj(vrstica))
+            zacetek = konec + 1
+        del buf[:zacetek]
+
+        if len(buf) > self.maks_dolzina:
+            # Predolga vrstica brez '\n' - zavrži, da medpomnilnik ne raste v nedogled
+            sporocila.append(_dekodiraj(bytes(buf[:self.maks_dolzina])))
+            buf.clear()
+        return sporocila
+
+    def _razcleni_dolzine(self):
+        buf = self._buffer
+        sporocila = []
+        zacetek = 0
+        while len(buf) - zacetek >= _DOLZINA.size:
+            (dolzina,) = _DOLZINA.unpack_from(buf, zacetek)
+            if dolzina < 0 or dolzina > self.maks_dolzina:
+                buf.clear()
+                raise FramingError(f"Neveljavna dolžina sporočila: {dolzina}")
+            konec = zacetek + _DOLZINA.size + dolzina
+            if len(buf) < konec:
+                break
+            sporocila.append(_dekodiraj(bytes(buf[zacetek + _DOLZINA.size:konec]).strip(LOCILA)))
+            zacetek = konec
+        del buf[:zacetek]
+        return sporocila
+
+    def _razcleni_kljucne_besede(self, koncno):
+        buf = self._buffer
+        sporocila = []
+        i = 0
+        n = len(buf)
+        smeti_od = None  # Začetek zaporedja bajtov, ki ni nobena ključna beseda
+
+        while i < n:
+            if buf[i] in LOCILA:
+                if smeti_od is not None:
+                    sporocila.append(_dekodiraj(bytes(buf[smeti_od:i])))
+                    smeti_od = None
+                i += 1
+                continue
+
+            if any(buf.startswith(p, i) for p in self._predpone):
+                konec = buf.find(b"\n", i)
+                if konec < 0 and not koncno:
+                    break  # Vrstica s predpono še ni v celoti prispela
+                konec = n if konec < 0 else konec
+                if smeti_od is not None:
+                    sporocila.append(_dekodiraj(bytes(buf[smeti_od:i])))
+                    smeti_od = None
+                sporocila.append(_dekodiraj(bytes(buf[i:konec]).strip(LOCILA)))
+                i = konec
+                continue
+
+            kljuc = self._ujemanje(buf, i)
+            if kljuc is None and not koncno and self._je_zacetek_kljuca(buf, i):
+                break  # Ključna beseda še ni v celoti prispela
+            if kljuc is not None and not koncno and self._lahko_daljse(buf, i, len(kljuc)):
+                break  # Počakaj, morda prispe daljša ključna beseda z enakim začetkom
+
+            if kljuc is None:
+                if smeti_od is None:
+                    smeti_od = i
+                i += 1
+                continue
+
+            if smeti_od is not None:
+                sporocila.append(_dekodiraj(bytes(buf[smeti_od:i])))
+                smeti_od = None
+            sporocila.append(kljuc.decode("utf-8"))
+            i += len(kljuc)
+
+        if smeti_od is not None:
+            sporocila.append(_dekodiraj(bytes(buf[smeti_od:i])))
+        del buf[:i]
+
+        if len(buf) > self.maks_dolzina:
+            sporocila.append(_dekodiraj(bytes(buf)))
+            buf.clear()
+        return sporocila
+
+    def _ujemanje(self, buf, i):
+        for kljuc in self._kljuci:
+            if buf.startswith(kljuc, i):
+                return kljuc
+        return None
+
+    def _je_zacetek_kljuca(self, buf, i):
+        """Ali je ostanek medpomnilnika od i naprej pravi začetek katere od ključnih besed ali predpon."""
+        if len(buf) - i >= self._najdaljsi_kljuc:
+            return False
+        ostanek = bytes(buf[i:])
+        return any(len(k) > len(ostanek) and k.startswith(ostanek) for k in self._zacetki)
+
+    def _lahko_daljse(self, buf, i, dolzina):
+        """Ali bi se ob več podatkih lahko ujela daljša ključna beseda od že najdene."""
+        if len(buf) - i >= self._najdaljsi_kljuc:
+            return False
+        ostanek = bytes(buf[i:])
+        return any(len(k) > max(dolzina, len(ostanek)) and k.startswith(ostanek) for k in self._zacetki)
+
+
+class BinaryFramer:
+    """Razčlenjevalnik binarnih okvirjev (OKVIR) za eno povezavo.
+
+    feed() vrne seznam celih okvirjev kot (koda, seq, cas_robota).
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        buf = self._buffer
+        buf += data
+        celih = len(buf) - len(buf) % OKVIR.size
+        if not celih:
+            return []
+        okvirji = list(OKVIR.iter_unpack(bytes(buf[:celih])))
+        del buf[:celih]
+        return okvirji
+
+    def flush(self):
+        """Nepopoln okvir ob zaprtju povezave zavržemo (robot ga ponovno pošlje, ker ni potrjen)."""
+        self._buffer.clear()
+        return []
+
+    @property
+    def v_medpomnilniku(self):
+        return len(self._buffer)
+
+
+def je_binarni_pozdrav(zacetek):
+    """Ali se povezava začne s pozdravom binarnega protokola (True/False); None, če je bajtov še premalo."""
+    n = min(len(zacetek), len(MAGIC_BAJTI))
+    if zacetek[:n] != MAGIC_BAJTI[:n]:
+        return False
+    return True if len(zacetek) >= POZDRAV.size else None
+
+
+def _dekodiraj(data):
+    return data.decode("utf-8", errors="replace")
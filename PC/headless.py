@@ -0,0 +1,203 @@
+import time
+
+_ZACETEK = time.perf_counter()  # Čas do poslušanja merimo od tu, pred vsemi ostalimi uvozi
+
+import os  # noqa: E402
+import socket  # noqa: E402
+import sys  # noqa: E402
+from collections import namedtuple  # noqa: E402
+
+from config import (HOST, TCP_PORT, LOG_NIVO, LOG_FORMAT, FRAMING_MODE, DNEVNIK_MAPA,  # noqa: E402
+                    DNEVNIK_ZAPISOV_NA_SEGMENT, DNEVNIK_MAKS_SEGMENTOV, DNEVNIK_INTERVAL_FSYNC, KEEPALIVE,
+                    ROK_UTRIPA_S, ROK_NEDEJAVNOSTI_S, IZLOCAJ_ZASTARELE_POVEZAVE, ROK_ZAUSTAVITVE_S, STANJA_SKATLE,
+                    ZACETNO_STANJE, OPISI_STANJ, KODE_STANJ)
+
+# --- Sprejem brez spletnega vmesnika (headless) ---
+#
+# main.py pred odprtjem vrat za robota uvozi Flask in ostali spletni del (na
+# celičnem računalniku ~200 ms in ~30 MB), zato lahko robotov socket_open ob
+# hkratnem zagonu naleti na zaprta vrata. headless.py vrata odpre takoj - pred
+# tem uvozi le socket in config - šele nato preveri argumente (argparse) in
+# uvozi sprejem. Povezave, ki pridejo vmes, čakajo v vrsti jedra in dobijo
+# potrdila, ko zanka steče.
+#
+# Spletnega vmesnika, statistike ciklov, preverjanja prehodov in zgodovine v
+# pomnilniku ni: beležimo zadnje stanje vsakega robota in vse dogodke v trajni
+# dnevnik, iz katerega main.py ob naslednjem zagonu obnovi zgodovino. Stanje
+# objavimo v datoteko JSON (enaka polja kot /stanje), ki jo lahko bere lokalni
+# nadzor. Datoteko piše naročnik vodila s politiko zadnji: potrdilo robotu ne
+# čaka na disk, ob hitrih spremembah pa se zapiše le zadnje stanje. Zamenjamo
+# jo z os.replace, zato bralec nikoli ne vidi napol zapisane.
+
+# --- Konfiguracija ---
+STANJE_DATOTEKA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stanje.json")  # Objavljeno stanje
+LISTEN_BACKLOG = 128  # Enako kot v ingest.py, ki ga pred odprtjem vrat še ne uvozimo
+
+# Stanje zamenjamo z eno referenco (kot Posnetek v main.py), zato ga pisalec datoteke bere brez zaklepanja
+StanjeSprejema = namedtuple("StanjeSprejema", ["verzija", "seq", "trenutno_stanje", "stanja_robotov", "casi_stanj"])
+
+
+def poslusaj(host, port):
+    """Odpre poslušajočo vtičnico za robote (le s socket, brez uvoza sprejema)."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind((host, port))
+    s.listen(LISTEN_BACKLOG)
+    return s
+
+
+def naslov_iz_argumentov(argv):
+    """(host, vrata) iz --host in --tcp-port brez argparse, ki z re stane ~10 ms.
+
+    Upošteva le polni imeni (--tcp-port 50000 ali --tcp-port=50000); ostale
+    argumente preveri parse_args() po odprtju vrat. Vrne None, če vrata niso
+    število - takrat napako najprej izpiše parse_args().
+    """
+    naslov = {"--host": HOST, "--tcp-port": TCP_PORT}
+    for i, arg in enumerate(argv):
+        ime, enacaj, vrednost = arg.partition("=")
+        if ime not in naslov:
+            continue
+        if not enacaj:
+            if i + 1 >= len(argv):
+                continue
+            vrednost = argv[i + 1]
+        if ime == "--tcp-port":
+            try:
+                vrednost = int(vrednost)
+            except ValueError:
+                return None
+        naslov[ime] = vrednost
+    return naslov["--host"], naslov["--tcp-port"]
+
+
+def najvecji_rss_mb():
+    """Največja poraba pomnilnika (RSS) procesa v MB; None, kjer je ne znamo prebrati (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # Linux: ru_maxrss je v kB
+
+
+def zazeni(args, vticnica, cas_do_poslusanja_ms):
+    """Sprejem na že odprti vtičnici; teče do SIGTERM/Ctrl+C in se nato urejeno zaustavi."""
+    # Uvozimo šele zdaj, ko vrata že sprejemajo povezave
+    import json
+    import signal
+
+    from async_log import log
+    from bus import Dogodek, EventBus, POLITIKA_ZADNJI
+    from eventlog import EventLog
+    from history import oblikuj_cas
+    from ingest import IngestServer
+
+    log.nastavi(nivo=args.log_nivo, format=args.log_format)
+    dnevnik = EventLog(args.dnevnik, DNEVNIK_ZAPISOV_NA_SEGMENT, DNEVNIK_MAKS_SEGMENTOV, DNEVNIK_INTERVAL_FSYNC)
+
+    # Zadnja stanja robotov obnovimo iz dnevnika; zaporedne številke se nadaljujejo za zadnjo zapisano
+    _zapisi, zadnji_po_robotih = dnevnik.obnovi(0)
+    stanja_robotov = {robot: OPISI_STANJ[koda] for robot, (_seq, _cas, koda, _r) in zadnji_po_robotih.items()}
+    casi_stanj = {robot: cas_ns for robot, (_seq, cas_ns, _koda, _r) in zadnji_po_robotih.items()}
+    trenutno_stanje, zadnji_seq = ZACETNO_STANJE, -1
+    if zadnji_po_robotih:
+        zadnji_seq, cas_ns, koda, _robot = max(zadnji_po_robotih.values())
+        trenutno_stanje = OPISI_STANJ[koda]
+        casi_stanj[None] = cas_ns
+    stanje = StanjeSprejema(0, zadnji_seq, trenutno_stanje, stanja_robotov, casi_stanj)
+
+    def objavi_stanje(_dogodek=None):
+        p = stanje
+        cas_ns = p.casi_stanj.get(None)
+        vsebina = {
+            "status": "OK",
+            "stanje_skatle": p.trenutno_stanje,
+            "roboti": p.stanja_robotov,
+            "cas_prejema": oblikuj_cas(cas_ns) if cas_ns else None,
+            "verzija": p.verzija,
+            "seq": p.seq,
+            "pid": os.getpid(),
+            "cas_do_poslusanja_ms": round(cas_do_poslusanja_ms, 2),
+        }
+        zacasna = f"{args.stanje}.{os.getpid()}.tmp"
+        with open(zacasna, "w", encoding="utf-8") as f:
+            json.dump(vsebina, f, ensure_ascii=False)
+        os.replace(zacasna, args.stanje)
+
+    def zabelezi_sporocilo(robot_id, sporocilo):
+        """Obdela eno sporočilo robota: posodobi stanje in ga zapiše v dnevnik. Vrne potrdilo za robota."""
+        nonlocal stanje
+
+        if sporocilo in STANJA_SKATLE:
+            novo_stanje = STANJA_SKATLE[sporocilo]
+            koda = KODE_STANJ[sporocilo]
+            p = stanje
+            cas_ns = max(time.time_ns(), p.casi_stanj.get(None, 0))  # Kot HistoryRing: čas ne gre nazaj
+            seq = p.seq + 1
+            stanja = dict(p.stanja_robotov)
+            stanja[robot_id] = novo_stanje
+            casi = dict(p.casi_stanj)
+            casi[robot_id] = casi[None] = cas_ns
+            stanje = StanjeSprejema(p.verzija + 1, seq, novo_stanje, stanja, casi)
+
+            vodilo.objavi(Dogodek(seq, cas_ns, robot_id, sporocilo, koda))
+            dnevnik.dodaj(seq, cas_ns, koda, robot_id)
+            log.info(f"✅ NOVO STANJE: {novo_stanje}", robot=robot_id, sporocilo=sporocilo, seq=seq)
+        else:
+            log.warning("⚠️ Neveljavno sporočilo od robota", robot=robot_id, sporocilo=sporocilo)
+        return b"OK"
+
+    vodilo = EventBus()
+    vodilo.naroci("stanje", objavi_stanje, politika=POLITIKA_ZADNJI, kljuc=lambda d: None)
+    streznik = IngestServer(args.host, args.tcp_port, zabelezi_sporocilo, FRAMING_MODE, STANJA_SKATLE,
+                            keepalive=KEEPALIVE, rok_utripa_s=ROK_UTRIPA_S, rok_nedejavnosti_s=ROK_NEDEJAVNOSTI_S,
+                            izlocaj_zastarele=not args.brez_izlocanja and IZLOCAJ_ZASTARELE_POVEZAVE)
+    streznik.bind(vticnica)
+    dnevnik.start()
+    objavi_stanje()
+
+    def ob_signalu(_signum, _okvir):
+        streznik.stop(ROK_ZAUSTAVITVE_S)  # Potrdila za že prejeto pošljemo, nove povezave zavrnemo
+    signal.signal(signal.SIGTERM, ob_signalu)
+    signal.signal(signal.SIGINT, ob_signalu)
+
+    print(f"🤖 Sprejem brez spletnega vmesnika na vratih {args.tcp_port}: vrata odprta po "
+          f"{cas_do_poslusanja_ms:.1f} ms, pripravljen po {(time.perf_counter() - _ZACETEK) * 1000:.1f} ms, "
+          f"RSS {najvecji_rss_mb()} MB, stanje v {args.stanje}")
+    try:
+        streznik.serve_forever()
+    finally:
+        vodilo.zapri()
+        dnevnik.zapri()  # Zapiše in sinhronizira (fsync) še nezapisane dogodke
+        log.info("🛑 Sprejem zaustavljen", seq=stanje.seq, rss_mb=najvecji_rss_mb())
+        log.zapri()
+
+
+def parse_args():
+    """Argumenti ukazne vrstice; privzete vrednosti so iz config.py."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sprejem stanj robota UR5 brez spletnega vmesnika (hiter zagon).")
+    parser.add_argument("--host", default=HOST, help="Naslov, na katerem posluša TCP strežnik za robote")
+    parser.add_argument("--tcp-port", type=int, default=TCP_PORT, help="Vrata za komunikacijo z robotom")
+    parser.add_argument("--dnevnik", default=DNEVNIK_MAPA, help="Mapa trajnega dnevnika dogodkov (skupna z main.py)")
+    parser.add_argument("--stanje", default=STANJE_DATOTEKA, help="Datoteka JSON, v katero objavljamo trenutno stanje")
+    parser.add_argument("--log-nivo", default=LOG_NIVO, choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Najnižji nivo zapisov, ki se izpišejo na konzolo")
+    parser.add_argument("--log-format", default=LOG_FORMAT, choices=["besedilo", "json"], help="Oblika izpisa dnevnika")
+    parser.add_argument("--brez-izlocanja", action="store_true",
+                        help="Nova povezava robota ne zapre prejšnje z istim imenom (ponovitev anonimnih sej z enega naslova)")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    naslov = naslov_iz_argumentov(sys.argv[1:])
+    args = parse_args() if naslov is None else None
+    host, port = naslov or (args.host, args.tcp_port)
+    try:
+        vticnica = poslusaj(host, port)
+    except OSError as e:
+        raise SystemExit(f"FATALNA NAPAKA: Ne morem odpreti vrat {port} za robote. Napaka: {e}")
+    cas_do_poslusanja_ms = (time.perf_counter() - _ZACETEK) * 1000
+    args = args or parse_args()
+    zazeni(args, vticnica, cas_do_poslusanja_ms)
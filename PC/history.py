@@ -0,0 +1,284 @@
+import bisect
+import time
+from array import array
+
+from framing import MAKS_DOLZINA_IMENA
+
+# --- Zgodovina stanj v krožnem medpomnilniku s fiksno kapaciteto ---
+#
+# Vsak dogodek zasede 11 bajtov: čas (int64, ns od epohe), koda stanja
+# (uint8, indeks v seznam opisov) in indeks robota (uint16). Nizi se sestavijo
+# šele, ko jih kdo prikaže, poraba pomnilnika pa je po zapolnitvi konstantna.
+# Časi v medpomnilniku nikoli ne padajo, zato je zgodovina hkrati urejen indeks
+# po času in po zaporedni številki: iskanje začetka obsega je bisekcija v O(log n).
+
+MAKS_ROBOTOV = 1 << 16  # Indeks robota je uint16
+MAKS_STANJ = 1 << 8     # Koda stanja je uint8
+
+
+def oblikuj_cas(cas_ns):
+    """Pretvori čas v ns od epohe v niz, kot ga prikazuje nadzorna plošča."""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(cas_ns / 1e9))
+
+
+class HistoryRing:
+    """Krožni medpomnilnik dogodkov (čas, stanje, robot) z dodajanjem v O(1).
+
+    Vsak dogodek dobi zaporedno številko (seq), ki narašča ves čas delovanja.
+    Ko je medpomnilnik poln, novi dogodki prepišejo najstarejše; dogodke,
+    starejše od maks_starost_s, zavržemo ob dodajanju.
+    """
+
+    def __init__(self, kapaciteta, opisi_stanj, maks_starost_s=None):
+        if kapaciteta <= 0:
+            raise ValueError("Kapaciteta zgodovine mora biti pozitivna.")
+        if len(opisi_stanj) > MAKS_STANJ:
+            raise ValueError(f"Največ {MAKS_STANJ} različnih stanj.")
+
+        self.kapaciteta = kapaciteta
+        self.opisi_stanj = list(opisi_stanj)
+        self.maks_starost_ns = int(maks_starost_s * 1e9) if maks_starost_s else None
+
+        self._cas = array('q', bytes(8 * kapaciteta))
+        self._koda = array('B', bytes(kapaciteta))
+        self._robot = array('H', bytes(2 * kapaciteta))
+        self._roboti = []        # indeks -> ime robota
+        self._indeksi_robotov = {}  # ime robota -> indeks
+
+        self._prvi_seq = 0   # seq najstarejšega ohranjenega dogodka
+        self._naslednji_seq = 0  # seq, ki ga dobi naslednji dodani dogodek
+
+    def __len__(self):
+        return self._naslednji_seq - self._prvi_seq
+
+    @property
+    def prvi_seq(self):
+        return self._prvi_seq
+
+    @property
+    def naslednji_seq(self):
+        """Skupno število vseh kdajkoli dodanih dogodkov."""
+        return self._naslednji_seq
+
+    def append(self, koda, robot, cas_ns=None, seq=None):
+        """Doda dogodek in vrne (seq, cas_ns), kot sta zapisana v zgodovino.
+
+        seq podamo le pri obnovi iz trajnega dnevnika; če je večji od
+        naslednjega pričakovanega, se zgodovina začne znova od njega. cas_ns
+        ne gre nazaj (glej spodaj), zato ga klicatelj za posnetek, vodilo in
+        dnevnik vzame iz vrnjene vrednosti, ne iz svoje ure.
+        """
+        indeks_robota = self._indeks_robota(robot)  # Pred spremembami, da neveljavno ime ne pokvari obsega
+        if cas_ns is None:
+            cas_ns = time.time_ns()
+        if self._naslednji_seq > self._prvi_seq:
+            # Če se ura sistema premakne nazaj, obdržimo naraščajoč vrstni red časov
+            cas_ns = max(cas_ns, self._cas[(self._naslednji_seq - 1) % self.kapaciteta])
+        if seq is None:
+            seq = self._naslednji_seq
+        elif seq < self._naslednji_seq:
+            raise ValueError(f"Zaporedna številka {seq} je manjša od pričakovane {self._naslednji_seq}.")
+        elif seq > self._naslednji_seq:
+            self._prvi_seq = self._naslednji_seq = seq
+        # Dogodek, ki ga bomo prepisali, najprej umaknemo iz obsega in šele nato
+        # pišemo - bralci brez zaklepanja (PogledZgodovine) tako zaznajo prepis
+        if seq - self._prvi_seq >= self.kapaciteta:
+            self._prvi_seq = seq - self.kapaciteta + 1
+        i = seq % self.kapaciteta
+        self._cas[i] = cas_ns
+        self._koda[i] = koda
+        self._robot[i] = indeks_robota
+        self._naslednji_seq = seq + 1
+
+        if self.maks_starost_ns is not None:
+            meja = cas_ns - self.maks_starost_ns
+            while self._prvi_seq < seq and self._cas[self._prvi_seq % self.kapaciteta] < meja:
+                self._prvi_seq += 1
+        return seq, cas_ns
+
+    def pogled(self):
+        """Nespremenljiv pogled na trenutno vsebino, ki ga lahko bralci uporabljajo brez zaklepanja."""
+        return PogledZgodovine(self, self._prvi_seq, self._naslednji_seq)
+
+    def zapis(self, seq):
+        """Vrne (seq, cas_ns, koda, robot) za dogodek s podano zaporedno številko."""
+        if not self._prvi_seq <= seq < self._naslednji_seq:
+            raise IndexError(f"Dogodek {seq} ni več (ali še ni) v zgodovini.")
+        return self._preberi(seq)
+
+    def _preberi(self, seq):
+        i = seq % self.kapaciteta
+        return seq, self._cas[i], self._koda[i], self._roboti[self._robot[i]]
+
+    def zapisi(self, od_seq=None, do_seq=None):
+        """Vrne seznam surovih zapisov (seq, cas_ns, koda, robot) v obsegu [od_seq, do_seq)."""
+        od_seq = self._prvi_seq if od_seq is None else max(od_seq, self._prvi_seq)
+        do_seq = self._naslednji_seq if do_seq is None else min(do_seq, self._naslednji_seq)
+        return [self.zapis(seq) for seq in range(od_seq, do_seq)]
+
+    def seq_od_casa(self, cas_ns):
+        """Zaporedna številka prvega ohranjenega dogodka s časom >= cas_ns (bisekcija)."""
+        return self._prvi_seq + bisect.bisect_left(_CasovniPogled(self, self._prvi_seq, self._naslednji_seq), cas_ns)
+
+    def poizvedba(self, od_seq=None, do_seq=None, kode=None, robot=None, limit=None):
+        """Vrne surove zapise v obsegu [od_seq, do_seq), ki ustrezajo filtroma.
+
+        kode je množica dovoljenih kod stanj, robot ime robota; None pomeni brez
+        filtra. Pregledamo le obseg, brez kopiranja celotne zgodovine.
+        """
+        od_seq = self._prvi_seq if od_seq is None else max(od_seq, self._prvi_seq)
+        do_seq = self._naslednji_seq if do_seq is None else min(do_seq, self._naslednji_seq)
+        indeks_robota = None
+        if robot is not None:
+            indeks_robota = self._indeksi_robotov.get(robot)
+            if indeks_robota is None:
+                return []
+
+        rezultat = []
+        for seq in range(od_seq, do_seq):
+            i = seq % self.kapaciteta
+            if kode is not None and self._koda[i] not in kode:
+                continue
+            if indeks_robota is not None and self._robot[i] != indeks_robota:
+                continue
+            rezultat.append((seq, self._cas[i], self._koda[i], self._roboti[self._robot[i]]))
+            if limit is not None and len(rezultat) >= limit:
+                break
+        return rezultat
+
+    def vrstice(self, zapisi):
+        """Iz surovih zapisov sestavi nize (cas, opis stanja, robot) za prikaz."""
+        opisi = self.opisi_stanj
+        for _seq, cas_ns, koda, robot in zapisi:
+            yield oblikuj_cas(cas_ns), opisi[koda], robot
+
+    def zadnji(self):
+        """Zadnji dodani zapis ali None, če je zgodovina prazna."""
+        if not len(self):
+            return None
+        return self.zapis(self._naslednji_seq - 1)
+
+    def _indeks_robota(self, robot):
+        indeks = self._indeksi_robotov.get(robot)
+        if indeks is None:
+            if len(self._roboti) >= MAKS_ROBOTOV:
+                raise ValueError(f"Preveč različnih robotov (največ {MAKS_ROBOTOV}).")
+            if len(robot.encode("utf-8")) > MAKS_DOLZINA_IMENA:
+                raise ValueError(f"Ime robota je predolgo (največ {MAKS_DOLZINA_IMENA} bajtov).")
+            indeks = len(self._roboti)
+            self._roboti.append(robot)
+            self._indeksi_robotov[robot] = indeks
+        return indeks
+
+    def _izrez(self, i, j):
+        """Kopije stolpcev (casi, kode, indeksi robotov) za indekse polj [i, j); pri j <= i čez konec polja."""
+        if i < j:
+            return self._cas[i:j], self._koda[i:j], self._robot[i:j]
+        return self._cas[i:] + self._cas[:j], self._koda[i:] + self._koda[:j], self._robot[i:] + self._robot[:j]
+
+    def nbytes(self):
+        """Velikost tipiziranih polj v bajtih (brez tabele imen robotov)."""
+        return sum(a.itemsize * len(a) for a in (self._cas, self._koda, self._robot))
+
+
+class PogledZgodovine:
+    """Dogodki [prvi_seq, naslednji_seq) zgodovine, kot so bili ob objavi pogleda.
+
+    Pogled ne kopira podatkov in se ne spreminja: novejših dogodkov ne vidi,
+    tudi ko jih nit za sprejem medtem doda. Ker lahko pisalec najstarejše
+    dogodke prepiše med branjem, pogled po branju preveri, ali so prebrani
+    dogodki še v obsegu zgodovine, in prepisane izpusti (kot bralec pri seqlocku).
+    """
+
+    __slots__ = ("_zgodovina", "prvi_seq", "naslednji_seq")
+
+    def __init__(self, zgodovina, prvi_seq, naslednji_seq):
+        self._zgodovina = zgodovina
+        self.prvi_seq = prvi_seq
+        self.naslednji_seq = naslednji_seq
+
+    def __len__(self):
+        return self.naslednji_seq - self.prvi_seq
+
+    def _obseg(self, od_seq, do_seq):
+        od_seq = self.prvi_seq if od_seq is None else max(od_seq, self.prvi_seq)
+        od_seq = max(od_seq, self._zgodovina.prvi_seq)
+        do_seq = self.naslednji_seq if do_seq is None else min(do_seq, self.naslednji_seq)
+        return od_seq, do_seq
+
+    def _veljavni(self, zapisi):
+        # Meja se med branjem lahko le premakne naprej, zato jo preverimo na koncu
+        meja = self._zgodovina.prvi_seq
+        if zapisi and zapisi[0][0] < meja:
+            return [z for z in zapisi if z[0] >= meja]
+        return zapisi
+
+    def zapisi(self, od_seq=None, do_seq=None):
+        """Vrne seznam surovih zapisov (seq, cas_ns, koda, robot) v obsegu [od_seq, do_seq)."""
+        od_seq, do_seq = self._obseg(od_seq, do_seq)
+        preberi = self._zgodovina._preberi
+        return self._veljavni([preberi(seq) for seq in range(od_seq, do_seq)])
+
+    def poizvedba(self, od_seq=None, do_seq=None, kode=None, robot=None, limit=None):
+        """Kot HistoryRing.poizvedba, omejeno na dogodke tega pogleda."""
+        od_seq, do_seq = self._obseg(od_seq, do_seq)
+        return self._veljavni(self._zgodovina.poizvedba(od_seq, do_seq, kode, robot, limit))
+
+    def seq_od_casa(self, cas_ns):
+        """Zaporedna številka prvega dogodka pogleda s časom >= cas_ns (bisekcija)."""
+        od_seq, do_seq = self._obseg(None, None)
+        return od_seq + bisect.bisect_left(_CasovniPogled(self._zgodovina, od_seq, do_seq), cas_ns)
+
+    def stolpci(self, od_seq=None, do_seq=None, velikost_kosa=5000):
+        """Po kosih vrača (prvi_seq, casi, kode, indeksi_robotov) - izreze iz tipiziranih polj, brez pretvorbe v nize.
+
+        Pomnilnik je omejen z velikostjo kosa ne glede na obseg. Indekse robotov
+        pretvorimo v imena s seznamom roboti().
+        """
+        od_seq, do_seq = self._obseg(od_seq, do_seq)
+        z = self._zgodovina
+        while od_seq < do_seq:
+            od_seq = max(od_seq, z.prvi_seq)
+            konec = min(do_seq, od_seq + velikost_kosa)
+            if od_seq >= konec:
+                return
+            kos = z._izrez(od_seq % z.kapaciteta, (konec - 1) % z.kapaciteta + 1)
+            prepisanih = z.prvi_seq - od_seq
+            if prepisanih > 0:
+                # Pisalec je med branjem prepisal začetek kosa
+                kos = tuple(stolpec[prepisanih:] for stolpec in kos)
+                od_seq += prepisanih
+            if len(kos[0]):
+                yield (od_seq,) + kos
+            od_seq = konec
+
+    def roboti(self):
+        """Imena robotov po indeksih (za stolpci())."""
+        return list(self._zgodovina._roboti)
+
+    def indeks_robota(self, robot):
+        return self._zgodovina._indeksi_robotov.get(robot)
+
+    def vrstice(self, zapisi):
+        return self._zgodovina.vrstice(zapisi)
+
+    def zadnji(self):
+        """Zadnji zapis pogleda ali None, če je prazen (ali že prepisan)."""
+        zapisi = self.zapisi(self.naslednji_seq - 1)
+        return zapisi[0] if zapisi else None
+
+
+class _CasovniPogled:
+    """Zaporedje časov dogodkov [prvi_seq, naslednji_seq), primerno za modul bisect."""
+
+    def __init__(self, zgodovina, prvi_seq, naslednji_seq):
+        self._zgodovina = zgodovina
+        self._prvi_seq = prvi_seq
+        self._dolzina = max(0, naslednji_seq - prvi_seq)
+
+    def __len__(self):
+        return self._dolzina
+
+    def __getitem__(self, i):
+        z = self._zgodovina
+        return z._cas[(self._prvi_seq + i) % z.kapaciteta]
@@ -0,0 +1,630 @@
+import itertools
+import selectors
+import socket
+import time
+from collections import deque
+
+from async_log import log
+from commands import PREDPONA_ODGOVOR, PovezavaPrekinjena, RobotNiPovezan, Ukaz, razcleni_odgovor
+from framing import (BinaryFramer, MessageFramer, NACIN_KLJUCNE_BESEDE, KODA_ODGOVOR, KODA_UTRIP, MAGIC_BINARNO,
+                     POTRDILO, POZDRAV, je_binarni_pozdrav, je_veljavno_ime)
+from metrics import Registry
+
+# --- Sprejem sporočil več robotov hkrati (ena nit, selectors) ---
+#
+# Prejšnji tcp_server_thread je po accept() blokiral v zanki recv(), zato je
+# drugi robot čakal, dokler se prvi ni odklopil. IngestServer vse povezave
+# obdela v eni niti z neblokirajočimi vtičnicami, tako da število robotov ne
+# poveča števila niti.
+#
+# Mrtve povezave (robot brez napajanja, izvlečen kabel) zaznamo na dva načina:
+# TCP keepalive s kratkimi časi in TCP_USER_TIMEOUT (jedro zapre povezavo, ko
+# robot ne odgovarja, tudi če čaka nepotrjeno potrdilo), in z utripom na ravni
+# aplikacije - povezava, ki je enkrat poslala utrip, mora nato kaj poslati vsaj
+# na rok_utripa_s. Ko se robot z istim imenom poveže znova (npr. po ponovnem
+# zagonu programa), staro povezavo takoj zapremo, ne da bi čakali na zaznavo.
+#
+# Ukaze robotu (commands.py) druge niti oddajo s poslji_ukaz(); ta jih doda v
+# vrsto in zanko zbudi prek para vtičnic, zato pošiljanje ukazov ne zaklepa
+# ničesar na poti sprejema.
+
+VELIKOST_BRANJA = 4096  # Bajtov na en recv()
+LISTEN_BACKLOG = 128
+PREDPONA_ID = "ROBOT="  # Sporočilo "ROBOT=<id>\n" nastavi ime robota za to povezavo
+SPOROCILO_UTRIP = "ZIVO"  # Srčni utrip v nizovnem protokolu; ni dogodek in nanj ne odgovorimo
+# Sporočila, ki jih razčlenjevalnik bere do '\n' (vsebina lahko vsebuje ključno besedo, glej framing.py)
+PREDPONE_VRSTIC = (PREDPONA_ID, PREDPONA_ODGOVOR)
+MAKS_ID_UKAZA = 2**31 - 1  # Id ukaza mora biti 32-bitno število (binarni protokol)
+MAKS_PONOVNIH_POVEZAV = 200  # Toliko zadnjih ponovnih povezav hranimo za /api/povezave
+
+# Meje razredov za čas med prekinitvijo in ponovno povezavo (sekunde)
+MEJE_PREKINITEV = (0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+_BUDILKA = object()  # Oznaka vtičnice, s katero druge niti zbudijo zanko (key.data v selectorju)
+
+PROTOKOL_NIZI = "nizi"        # Ključne besede / vrstice (glej framing.py), potrdilo "OK" za vsako sporočilo
+PROTOKOL_BINARNO = "binarno"  # Okvirji OKVIR s kumulativnim potrdilom (glej framing.py)
+
+
+class RobotConnection:
+    """Stanje ene povezave z robotom: vtičnica, razčlenjevalnik in čakajoči odgovori."""
+
+    def __init__(self, sock, addr, framer, stevilka=0):
+        self.sock = sock
+        self.addr = addr
+        self.stevilka = stevilka  # Zaporedna številka povezave (za zajem)
+        self.robot_id = privzeto_ime(addr, stevilka)
+        self.framer = framer
+        self.protokol = None  # Določi se po prvih prejetih bajtih (glej IngestServer._pogajanje)
+        self.zacetek = bytearray()  # Prvi bajti povezave, dokler protokol še ni določen
+        self.zadnji_seq = 0  # Binarni protokol: največja zabeležena seq robota (tudi iz prejšnjih povezav)
+        self.cas_robota = None  # Binarni protokol: čas robota (ms) iz zadnjega okvirja
+        self.izhod = bytearray()  # Odgovori, ki jih še nismo uspeli poslati
+        self.prijavljen = False  # Ali smo robota že šteli med znane (za štetje ponovnih povezav)
+        self.zadnja_aktivnost = time.monotonic()  # Čas zadnjih prejetih bajtov
+        self.utrip = False  # Robot pošilja utrip, zato zanj velja rok_utripa_s
+
+    def __repr__(self):
+        return f"<RobotConnection {self.robot_id} {self.addr}>"
+
+
+def privzeto_ime(addr, stevilka):
+    """Ime robota, ki se ni predstavil: IP naslov ali "povezava-<n>", če naslov ni veljavno ime (IPv6 z %vmesnik)."""
+    return addr[0] if je_veljavno_ime(addr[0]) else f"povezava-{stevilka}"
+
+
+def nastavi_keepalive(sock, cakanje_s, interval_s, poskusov):
+    """Vklopi TCP keepalive z danimi časi in omeji čas čakanja na potrditev poslanih podatkov.
+
+    Mrtvo povezavo tako jedro zazna po približno cakanje_s + interval_s * poskusov
+    sekundah namesto po privzetih dveh urah (keepalive) oziroma ~15 minutah
+    (ponovno pošiljanje). Možnosti, ki jih sistem ne pozna, preskočimo.
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    moznosti = []
+    if hasattr(socket, "TCP_KEEPIDLE"):
+        moznosti.append((socket.TCP_KEEPIDLE, cakanje_s))
+    elif hasattr(socket, "TCP_KEEPALIVE"):  # macOS
+        moznosti.append((socket.TCP_KEEPALIVE, cakanje_s))
+    if hasattr(socket, "TCP_KEEPINTVL"):
+        moznosti.append((socket.TCP_KEEPINTVL, interval_s))
+    if hasattr(socket, "TCP_KEEPCNT"):
+        moznosti.append((socket.TCP_KEEPCNT, poskusov))
+    if hasattr(socket, "TCP_USER_TIMEOUT"):  # Linux, v ms
+        moznosti.append((socket.TCP_USER_TIMEOUT, (cakanje_s + interval_s * poskusov) * 1000))
+    for moznost, vrednost in moznosti:
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, moznost, max(1, int(vrednost)))
+        except OSError as e:
+            log.debug("Možnosti keepalive ni mogoče nastaviti", moznost=moznost, napaka=e)
+
+
+class IngestServer:
+    """TCP strežnik za sprejem stanj od poljubnega števila robotov v eni niti.
+
+    Za vsako celo sporočilo pokliče obdelaj_sporocilo(robot_id, sporocilo),
+    ki vrne bajte odgovora (npr. b"OK") ali None, če odgovora ni. Pri
+    binarnem protokolu se koda stanja pretvori v ključno besedo (indeks v
+    kljucne_besede), odgovor pa nadomesti kumulativno potrdilo.
+
+    Če podamo zajem (capture.SessionCapture), se vanj zapiše vsak prejeti kos.
+
+    keepalive je (cakanje_s, interval_s, poskusov) ali None (brez keepalive).
+    rok_utripa_s velja za povezave, ki pošiljajo utrip, rok_nedejavnosti_s
+    (None = brez) za vse ostale. Z izlocaj_zastarele=False nova povezava
+    robota ne zapre prejšnje z istim imenom (npr. ponovitev več anonimnih sej
+    z enega naslova). ukazi so imena ukazov, ki jih sprejme poslji_ukaz();
+    koda ukaza v binarnem protokolu je indeks + 1.
+    """
+
+    def __init__(self, host, port, obdelaj_sporocilo, framing_mode=NACIN_KLJUCNE_BESEDE, kljucne_besede=(),
+                 metrike=None, zajem=None, keepalive=(5, 1, 3), rok_utripa_s=5.0, rok_nedejavnosti_s=None,
+                 izlocaj_zastarele=True, ukazi=()):
+        self.host = host
+        self.port = port
+        self.obdelaj_sporocilo = obdelaj_sporocilo
+        self.framing_mode = framing_mode
+        self.kljucne_besede = tuple(kljucne_besede)
+        self._kljuci_framerja = self.kljucne_besede + (SPOROCILO_UTRIP,)
+        self.keepalive = keepalive
+        self.rok_utripa_s = rok_utripa_s
+        self.rok_nedejavnosti_s = rok_nedejavnosti_s
+        self.izlocaj_zastarele = izlocaj_zastarele
+        self._znani_roboti = set()
+        self._po_robotih = {}  # robot_id -> trenutna povezava
+        self._zadnje_videni = {}  # robot_id -> čas zadnjih bajtov (monotonic) zaprte povezave
+        self.ponovne_povezave = deque(maxlen=MAKS_PONOVNIH_POVEZAV)
+        self.ukazi = {ime: koda for koda, ime in enumerate(ukazi, 1)}
+        self._vrsta_ukazov = deque()  # Ukazi drugih niti, ki jih zanka še ni poslala
+        self._cakajoci_ukazi = {}  # id -> poslan Ukaz, ki čaka na odgovor
+        self._id_ukazov = itertools.count()  # next() je pod GIL atomaren, zato ga lahko kliče več niti
+        self._budilka = None  # (bralna, pisalna) vtičnica za bujenje zanke
+        self._zadnji_seq_robotov = {}  # robot_id -> zadnja zabeležena seq (binarni protokol)
+        self.zajem = zajem
+        self._stevec_povezav = 0
+
+        metrike = metrike or Registry(omogoceno=False)
+        self._merim_case = metrike.omogoceno
+        self._m_bajti = metrike.counter("ur5_ingest_received_bytes_total", "Bajti, prejeti od robotov")
+        self._m_povezave = metrike.counter("ur5_ingest_connections_total", "Vse sprejete povezave robotov")
+        self._m_ponovne = metrike.counter("ur5_ingest_reconnects_total", "Ponovne povezave že znanih robotov")
+        self._m_binarne = metrike.counter("ur5_ingest_binary_connections_total",
+                                          "Povezave, ki so izbrale binarni protokol")
+        self._m_podvojeni = metrike.counter("ur5_ingest_duplicate_frames_total",
+                                            "Ponovno poslani binarni okvirji, ki jih nismo zabeležili dvakrat")
+        self._m_napake = metrike.counter("ur5_ingest_processing_errors_total",
+                                         "Povezave, zaprte zaradi napake pri obdelavi sporočila")
+        self._m_aktivne = metrike.gauge("ur5_ingest_active_connections", "Trenutno povezani roboti")
+        self._m_utripi = metrike.counter("ur5_ingest_heartbeats_total", "Prejeti srčni utripi robotov")
+        self._m_potekle = metrike.counter("ur5_ingest_timeouts_total",
+                                          "Povezave, zaprte, ker robot v roku ni poslal ničesar")
+        self._m_izlocene = metrike.counter("ur5_ingest_stale_evictions_total",
+                                           "Zastarele povezave, zaprte ob ponovni povezavi istega robota")
+        self._m_ukazi = metrike.counter("ur5_commands_sent_total", "Ukazi, poslani robotom")
+        self._m_ukazi_potekli = metrike.counter("ur5_command_timeouts_total",
+                                                "Ukazi, na katere robot ni odgovoril v roku")
+        self._m_ukaz_rtt = metrike.histogram("ur5_command_rtt_seconds",
+                                             "Čas od pošiljanja ukaza do odgovora robota")
+        self._m_prekinitev = metrike.histogram("ur5_ingest_reconnect_gap_seconds",
+                                               "Čas od zadnjih podatkov prejšnje povezave do ponovne povezave robota",
+                                               MEJE_PREKINITEV)
+        self._m_commit = metrike.histogram("ur5_ingest_recv_to_commit_seconds",
+                                           "Čas od prejema podatkov (recv) do zabeleženega stanja")
+        self._m_ack = metrike.histogram("ur5_ingest_ack_send_seconds",
+                                        "Čas od prejema podatkov (recv) do oddaje potrdila v vtičnico")
+
+        self._selector = selectors.DefaultSelector()
+        self._listener = None
+        self._povezave = {}
+        self._tece = False
+        self._rok_odtekanja = None  # monotonic; nastavi ga stop(rok_s)
+
+    @property
+    def povezave(self):
+        """Seznam trenutno povezanih robotov."""
+        return list(self._povezave.values())
+
+    @property
+    def naslov(self):
+        """(host, vrata), na katerih strežnik posluša; uporabno, če smo ga vezali na vrata 0."""
+        return self._listener.getsockname() if self._listener is not None else None
+
+    def bind(self, vticnica=None):
+        """Odpre vrata za robote; z vticnica prevzame že poslušajočo vtičnico (glej headless.py)."""
+        s = vticnica
+        if s is None:
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            s.bind((self.host, self.port))
+            s.listen(LISTEN_BACKLOG)
+        s.setblocking(False)
+        self._listener = s
+        self._selector.register(s, selectors.EVENT_READ, None)
+        self._budilka = socket.socketpair()
+        for budilka in self._budilka:
+            budilka.setblocking(False)
+        self._selector.register(self._budilka[0], selectors.EVENT_READ, _BUDILKA)
+
+    def serve_forever(self, poll_interval=0.5):
+        """Glavna zanka. Teče, dokler ne pokličemo stop() (in se povezave ne izpraznijo)."""
+        if self._listener is None:
+            self.bind()
+        self._tece = True
+        naslednje_preverjanje = time.monotonic() + 1.0
+        try:
+            while self._tece:
+                if time.monotonic() >= naslednje_preverjanje:
+                    self._preveri_zivost()
+                    self._pocisti_ukaze()
+                    naslednje_preverjanje = time.monotonic() + 1.0
+                dogodki = self._selector.select(timeout=poll_interval if self._rok_odtekanja is None else 0.05)
+                for key, mask in dogodki:
+                    if key.data is None:
+                        self._sprejmi()
+                        continue
+                    if key.data is _BUDILKA:
+                        self._poslji_ukaze()
+                        continue
+                    povezava = key.data
+                    if povezava.sock.fileno() == -1:
+                        continue  # Zaprta med obdelavo te iteracije (npr. zastarela povezava)
+                    try:
+                        if mask & selectors.EVENT_READ:
+                            self._beri(povezava)
+                        if mask & selectors.EVENT_WRITE and povezava.sock.fileno() != -1:
+                            self._pisi(povezava)
+                    except Exception as e:
+                        # Napaka pri obdelavi sporočila enega robota ne sme ustaviti sprejema za vse ostale
+                        self._napaka_povezave(povezava, e)
+                if self._rok_odtekanja is not None and self._odteklo(dogodki):
+                    break
+        finally:
+            self._zapri_vse()
+
+    def stop(self, rok_s=0.0):
+        """Ustavi zanko; varno za klic iz katere koli niti.
+
+        Z rok_s > 0 strežnik najprej neha sprejemati nove povezave, nato pa še
+        največ rok_s sekund obdeluje, kar so roboti že poslali, in odda vsa
+        potrdila. Povezave zapre, ko so vse tihe in brez neposlanih potrdil.
+        """
+        if rok_s > 0:
+            self._rok_odtekanja = time.monotonic() + rok_s
+        else:
+            self._tece = False
+        self._zbudi()
+
+    def _odteklo(self, dogodki):
+        """Med odtekanjem: ali so povezave izpraznjene (ali je rok potekel)."""
+        if self._listener is not None:
+            self._selector.unregister(self._listener)
+            self._listener.close()
+            self._listener = None
+            log.info("Nove povezave robotov zavrnjene, praznim obstoječe", povezav=len(self._povezave))
+            return False
+        if time.monotonic() >= self._rok_odtekanja:
+            log.warning("⚠️ Rok za praznjenje povezav robotov je potekel",
+                        neposlanih=sum(1 for p in self._povezave.values() if p.izhod))
+            return True
+        if any(key.data is not _BUDILKA for key, _mask in dogodki):
+            return False  # V tem krogu so prišli podatki - počakamo še en krog tišine
+        return not any(povezava.izhod for povezava in self._povezave.values())
+
+    def poslji_ukaz(self, robot, ime, argument=0, rok_s=2.0):
+        """Pošlje ukaz povezanemu robotu; varno za klic iz katere koli niti.
+
+        Vrne concurrent.futures.Future, ki se izpolni s slovarjem odgovora
+        (id, odgovor, rtt_ms ...) ali z izjemo RobotNiPovezan, PovezavaPrekinjena
+        oziroma TimeoutError (robot ni odgovoril v rok_s).
+        """
+        if ime not in self.ukazi:
+            raise ValueError(f"Neznan ukaz '{ime}' (možni: {', '.join(self.ukazi)}).")
+        ukaz = Ukaz(next(self._id_ukazov) % MAKS_ID_UKAZA + 1, robot, ime, self.ukazi[ime], int(argument), rok_s)
+        self._vrsta_ukazov.append(ukaz)
+        self._zbudi()
+        return ukaz.future
+
+    def _zbudi(self):
+        budilka = self._budilka
+        if budilka is None:
+            return
+        try:
+            budilka[1].send(b"\0")
+        except OSError:
+            pass  # Medpomnilnik je poln (zanka je že zbujena) ali je strežnik zaprt
+
+    # --- Obdelava dogodkov ---
+
+    def _sprejmi(self):
+        while True:
+            try:
+                conn, addr = self._listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            conn.setblocking(False)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            if self.keepalive:
+                nastavi_keepalive(conn, *self.keepalive)
+            self._stevec_povezav += 1
+            framer = MessageFramer(self.framing_mode, self._kljuci_framerja, predpone_vrstic=PREDPONE_VRSTIC)
+            povezava = RobotConnection(conn, addr, framer, self._stevec_povezav)
+            if self.zajem is not None:
+                self.zajem.povezava(povezava.stevilka, addr)
+            self._povezave[conn.fileno()] = povezava
+            self._selector.register(conn, selectors.EVENT_READ, povezava)
+            self._m_povezave.inc()
+            self._m_aktivne.inc()
+            log.info("Povezava vzpostavljena", naslov=addr)
+
+    def _beri(self, povezava):
+        try:
+            data = povezava.sock.recv(VELIKOST_BRANJA)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            log.warning("Napaka pri branju", naslov=povezava.addr, napaka=e)
+            self._zapri(povezava)
+            return
+
+        prejeto = time.perf_counter() if self._merim_case else 0.0
+        povezava.zadnja_aktivnost = time.monotonic()
+        self._m_bajti.inc(len(data))
+        if self.zajem is not None and data:
+            self.zajem.podatki(povezava.stevilka, data)
+
+        if not data:
+            for sporocilo in povezava.framer.flush():
+                log.warning("⚠️ Nepopolno sporočilo ob prekinitvi povezave", robot=povezava.robot_id, sporocilo=sporocilo)
+            log.info("Povezava prekinjena", robot=povezava.robot_id, naslov=povezava.addr)
+            self._zapri(povezava)
+            return
+
+        if povezava.protokol is None:
+            data = self._pogajanje(povezava, data)
+            if data is None:
+                return
+        if povezava.protokol == PROTOKOL_BINARNO:
+            self._beri_binarno(povezava, data, prejeto)
+            return
+
+        try:
+            sporocila = povezava.framer.feed(data)
+        except ValueError as e:
+            log.warning("⚠️ Napaka pri razčlenjevanju toka", robot=povezava.robot_id, napaka=e)
+            self._zapri(povezava)
+            return
+
+        for sporocilo in sporocila:
+            if sporocilo.startswith(PREDPONA_ID):
+                ime = sporocilo[len(PREDPONA_ID):]
+                if ime and not je_veljavno_ime(ime):
+                    log.warning("⚠️ Neveljavno ime robota - zapiram povezavo", naslov=povezava.addr, ime=repr(ime[:64]))
+                    self._zapri(povezava)
+                    return
+                if self._po_robotih.get(povezava.robot_id) is povezava:
+                    # Robot se je predstavil šele po prvem sporočilu - prijavimo ga znova pod novim imenom
+                    del self._po_robotih[povezava.robot_id]
+                    povezava.prijavljen = False
+                povezava.robot_id = ime or privzeto_ime(povezava.addr, povezava.stevilka)
+                log.info("Povezava se je predstavila", naslov=povezava.addr, robot=povezava.robot_id)
+                self._prijavi(povezava)
+                odgovor = b"OK"
+            elif sporocilo.startswith(PREDPONA_ODGOVOR):
+                odgovor = razcleni_odgovor(sporocilo)
+                if odgovor is None:
+                    log.warning("⚠️ Neveljaven odgovor na ukaz", robot=povezava.robot_id, sporocilo=sporocilo)
+                else:
+                    self._odgovor_na_ukaz(povezava, *odgovor)
+                continue
+            elif sporocilo == SPOROCILO_UTRIP:
+                povezava.utrip = True
+                self._m_utripi.inc()
+                self._prijavi(povezava)
+                continue
+            else:
+                self._prijavi(povezava)
+                odgovor = self.obdelaj_sporocilo(povezava.robot_id, sporocilo)
+                if self._merim_case:
+                    self._m_commit.observe(time.perf_counter() - prejeto)
+            if odgovor:
+                povezava.izhod += odgovor
+
+        if povezava.izhod:
+            self._pisi(povezava)
+            if self._merim_case:
+                self._m_ack.observe(time.perf_counter() - prejeto)
+
+    def _pogajanje(self, povezava, data):
+        """Iz prvih bajtov povezave določi protokol.
+
+        Vrne bajte, ki jih mora obdelati razčlenjevalnik izbranega protokola,
+        ali None, če pozdrav še ni v celoti prispel.
+        """
+        buf = povezava.zacetek
+        buf += data
+        binarno = je_binarni_pozdrav(buf)
+        if binarno is None:
+            return None
+        if not binarno:
+            povezava.protokol = PROTOKOL_NIZI
+            data = bytes(buf)
+            buf.clear()
+            return data
+
+        _magic, stevilka = POZDRAV.unpack_from(buf)
+        data = bytes(buf[POZDRAV.size:])
+        buf.clear()
+        povezava.protokol = PROTOKOL_BINARNO
+        povezava.framer = BinaryFramer()
+        if stevilka:
+            povezava.robot_id = str(stevilka)
+        # Okvirje, ki jih je robot poslal že po prejšnji povezavi, ob ponovnem pošiljanju zavržemo kot podvojene
+        povezava.zadnji_seq = self._zadnji_seq_robotov.get(povezava.robot_id, 0)
+        self._m_binarne.inc()
+        self._prijavi(povezava)
+        log.info("Povezava je izbrala binarni protokol", naslov=povezava.addr, robot=povezava.robot_id)
+        # Robot, ki nadaljuje po prekinitvi, iz odgovora ve, katerih dogodkov ni treba poslati znova
+        povezava.izhod += POZDRAV.pack(MAGIC_BINARNO, povezava.zadnji_seq)
+        if not data:
+            self._pisi(povezava)
+        return data
+
+    def _beri_binarno(self, povezava, data, prejeto):
+        okvirji = povezava.framer.feed(data)
+        kljucne_besede = self.kljucne_besede
+        for koda, seq, cas_robota in okvirji:
+            if koda == KODA_ODGOVOR:
+                self._odgovor_na_ukaz(povezava, seq, cas_robota)  # Okvir odgovora: (koda, id ukaza, rezultat)
+                continue
+            if koda == KODA_UTRIP:
+                # Potrdilo na koncu kosa robotu hkrati pove, da je PC živ
+                povezava.utrip = True
+                self._m_utripi.inc()
+                continue
+            if seq <= povezava.zadnji_seq:
+                # Robot je okvir poslal znova, ker potrdila ni prejel - zabeležen je že
+                self._m_podvojeni.inc()
+                continue
+            povezava.zadnji_seq = seq
+            povezava.cas_robota = cas_robota
+            sporocilo = kljucne_besede[koda] if 0 <= koda < len(kljucne_besede) else f"KODA={koda}"
+            self.obdelaj_sporocilo(povezava.robot_id, sporocilo)
+            if self._merim_case:
+                self._m_commit.observe(time.perf_counter() - prejeto)
+
+        if okvirji:
+            # Eno kumulativno potrdilo za vse okvirje tega kosa
+            self._zadnji_seq_robotov[povezava.robot_id] = povezava.zadnji_seq
+            povezava.izhod += POTRDILO.pack(povezava.zadnji_seq)
+        if povezava.izhod:
+            self._pisi(povezava)
+            if self._merim_case:
+                self._m_ack.observe(time.perf_counter() - prejeto)
+
+    def _poslji_ukaze(self):
+        """Ukaze iz vrste zapiše v izhod povezav ciljnih robotov (kliče jo le zanka)."""
+        try:
+            while self._budilka[0].recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        povezave = {}
+        while self._vrsta_ukazov:
+            ukaz = self._vrsta_ukazov.popleft()
+            povezava = self._po_robotih.get(ukaz.robot)
+            if povezava is None or povezava.protokol is None:
+                ukaz.napaka(RobotNiPovezan(f"Robot '{ukaz.robot}' ni povezan."))
+                continue
+            ukaz.povezava = povezava
+            self._cakajoci_ukazi[ukaz.id] = ukaz
+            povezava.izhod += ukaz.zakodiraj(povezava.protokol == PROTOKOL_BINARNO)
+            ukaz.poslano = time.perf_counter()
+            self._m_ukazi.inc()
+            povezave[id(povezava)] = povezava
+            log.debug("Ukaz poslan robotu", robot=ukaz.robot, ukaz=ukaz.ime, id=ukaz.id)
+        for povezava in povezave.values():
+            self._pisi(povezava)
+
+    def _odgovor_na_ukaz(self, povezava, id_ukaza, odgovor):
+        ukaz = self._cakajoci_ukazi.get(id_ukaza)
+        if ukaz is None or ukaz.povezava is not povezava:
+            log.warning("⚠️ Odgovor na neznan ali potekel ukaz", robot=povezava.robot_id, id=id_ukaza, odgovor=odgovor)
+            return
+        del self._cakajoci_ukazi[id_ukaza]
+        rtt_s = ukaz.odgovor(odgovor)
+        if rtt_s is not None:
+            self._m_ukaz_rtt.observe(rtt_s)
+
+    def _pocisti_ukaze(self):
+        """Ukazom, na katere robot ni odgovoril v roku, nastavi TimeoutError."""
+        if not self._cakajoci_ukazi:
+            return
+        zdaj = time.monotonic()
+        for id_ukaza, ukaz in list(self._cakajoci_ukazi.items()):
+            if zdaj > ukaz.rok:
+                del self._cakajoci_ukazi[id_ukaza]
+                self._m_ukazi_potekli.inc()
+                ukaz.napaka(TimeoutError(f"Robot '{ukaz.robot}' ni odgovoril na ukaz {ukaz.ime} (id {id_ukaza})."))
+
+    def _prijavi(self, povezava):
+        """Ob prvem sporočilu povezave robota zabeleži med znane; če ga že poznamo, je to ponovna povezava.
+
+        Če je robot z istim imenom še povezan, je prejšnja povezava zastarela
+        (robot ima eno samo vtičnico) in jo zapremo.
+        """
+        if povezava.prijavljen:
+            return
+        povezava.prijavljen = True
+        robot = povezava.robot_id
+        stara = self._po_robotih.get(robot)
+        izlocena = False
+        if stara is not None and stara is not povezava and self.izlocaj_zastarele:
+            log.warning("⚠️ Robot se je znova povezal - zapiram zastarelo povezavo", robot=robot,
+                        naslov=stara.addr, nov_naslov=povezava.addr)
+            self._m_izlocene.inc()
+            self._zapri(stara)
+            izlocena = True
+        self._po_robotih[robot] = povezava
+
+        if robot not in self._znani_roboti:
+            self._znani_roboti.add(robot)
+            return
+        self._m_ponovne.inc()
+        zadnje = self._zadnje_videni.get(robot)
+        prekinitev_s = round(time.monotonic() - zadnje, 3) if zadnje is not None else None
+        if prekinitev_s is not None:
+            self._m_prekinitev.observe(prekinitev_s)
+        self.ponovne_povezave.append({
+            "cas_ns": time.time_ns(),
+            "robot": robot,
+            "naslov": f"{povezava.addr[0]}:{povezava.addr[1]}",
+            "prekinitev_s": prekinitev_s,
+            "zastarela_zaprta": izlocena,
+        })
+        log.info("🔁 Ponovna povezava robota", robot=robot, naslov=povezava.addr, prekinitev_s=prekinitev_s)
+
+    def _preveri_zivost(self):
+        """Zapre povezave, ki v roku niso poslale ničesar (rok_utripa_s oz. rok_nedejavnosti_s)."""
+        zdaj = time.monotonic()
+        for povezava in list(self._povezave.values()):
+            rok = self.rok_utripa_s if povezava.utrip else self.rok_nedejavnosti_s
+            if rok is None or zdaj - povezava.zadnja_aktivnost <= rok:
+                continue
+            log.warning("⚠️ Robot se ne oglaša - zapiram povezavo", robot=povezava.robot_id, naslov=povezava.addr,
+                        tiho_s=round(zdaj - povezava.zadnja_aktivnost, 1), utrip=povezava.utrip)
+            self._m_potekle.inc()
+            self._zapri(povezava)
+
+    def stanje_povezav(self):
+        """Trenutne povezave in zadnje ponovne povezave (za /api/povezave)."""
+        zdaj = time.monotonic()
+        return {
+            "povezave": [{
+                "robot": p.robot_id,
+                "naslov": f"{p.addr[0]}:{p.addr[1]}",
+                "protokol": p.protokol,
+                "utrip": p.utrip,
+                "tiho_s": round(zdaj - p.zadnja_aktivnost, 3),
+            } for p in self.povezave],
+            "ponovne": list(self.ponovne_povezave),
+        }
+
+    def _pisi(self, povezava):
+        try:
+            poslano = povezava.sock.send(povezava.izhod)
+        except (BlockingIOError, InterruptedError):
+            poslano = 0
+        except OSError as e:
+            log.warning("Napaka pri pošiljanju", naslov=povezava.addr, napaka=e)
+            self._zapri(povezava)
+            return
+        del povezava.izhod[:poslano]
+
+        # Na pisanje čakamo samo, dokler so v izhodu še neposlani bajti
+        dogodki = selectors.EVENT_READ | (selectors.EVENT_WRITE if povezava.izhod else 0)
+        self._selector.modify(povezava.sock, dogodki, povezava)
+
+    def _napaka_povezave(self, povezava, napaka):
+        """Zapre le povezavo, pri obdelavi katere je prišlo do nepričakovane napake."""
+        log.error("❌ Napaka pri obdelavi sporočila robota - zapiram povezavo", robot=povezava.robot_id,
+                  naslov=povezava.addr, napaka=repr(napaka))
+        self._m_napake.inc()
+        if povezava.protokol == PROTOKOL_BINARNO:
+            # Okvirji do napake (vključno s tistim, ki jo je sprožil) so obdelani - robot jih po ponovni
+            # povezavi ne sme poslati znova, sicer bi se napaka ponavljala
+            self._zadnji_seq_robotov[povezava.robot_id] = povezava.zadnji_seq
+        self._zapri(povezava)
+
+    def _zapri(self, povezava):
+        if self._povezave.pop(povezava.sock.fileno(), None) is not None:
+            self._m_aktivne.dec()
+            if self._po_robotih.get(povezava.robot_id) is povezava:
+                del self._po_robotih[povezava.robot_id]
+            if povezava.prijavljen:
+                self._zadnje_videni[povezava.robot_id] = povezava.zadnja_aktivnost
+            for id_ukaza, ukaz in list(self._cakajoci_ukazi.items()):
+                if ukaz.povezava is povezava:
+                    del self._cakajoci_ukazi[id_ukaza]
+                    ukaz.napaka(PovezavaPrekinjena(f"Povezava z robotom '{ukaz.robot}' se je zaprla pred odgovorom."))
+            if self.zajem is not None:
+                self.zajem.zaprto(povezava.stevilka)
+        try:
+            self._selector.unregister(povezava.sock)
+        except (KeyError, ValueError):
+            pass
+        povezava.sock.close()
+
+    def _zapri_vse(self):
+        for povezava in list(self._povezave.values()):
+            self._zapri(povezava)
+        if self._listener is not None:
+            self._selector.unregister(self._listener)
+            self._listener.close()
+            self._listener = None
+        if self._budilka is not None:
+            self._selector.unregister(self._budilka[0])
+            budilka, self._budilka = self._budilka, None
+            for vticnica in budilka:
+                vticnica.close()
+        while self._vrsta_ukazov:
+            self._vrsta_ukazov.popleft().napaka(RobotNiPovezan("TCP strežnik ne teče."))
@@ -1,59 +1,311 @@
+import argparse
+import atexit
+import multiprocessing
+import os
+import signal
 import socket
+from concurrent.futures import TimeoutError as FutureTimeout
 from flask import Flask, jsonify, request, Response
+from markupsafe import escape
+from werkzeug.serving import make_server
 import threading
 import time
 import traceback
 
+from analytics import CycleAnalytics
+from async_log import log
+from bus import Dogodek, EventBus, POLITIKA_ZADNJI, POLITIKA_ZAVRZI_NAJSTAREJSE
+from capture import SessionCapture
+from commands import PovezavaPrekinjena, RobotNiPovezan
+from config import (HOST, TCP_PORT, LOG_NIVO, LOG_FORMAT, FRAMING_MODE, DNEVNIK_MAPA, DNEVNIK_ZAPISOV_NA_SEGMENT,
+                    DNEVNIK_MAKS_SEGMENTOV, DNEVNIK_INTERVAL_FSYNC, KEEPALIVE, ROK_UTRIPA_S, ROK_NEDEJAVNOSTI_S,
+                    IZLOCAJ_ZASTARELE_POVEZAVE, ROK_ZAUSTAVITVE_S, STANJA_SKATLE, ZACETNO_STANJE, OPISI_STANJ,
+                    KLJUCI_STANJ, KODE_STANJ, KODA_ZACETNEGA_STANJA)
+from eventlog import EventLog
+from export import OBLIKE_IZVOZA, gzip_tok
+from history import HistoryRing, oblikuj_cas
+from ingest import IngestServer
+from metrics import Registry
+from rollup import IZMENA, MINUTA, RAVNI, URA, StateRollups
+from rpc import StreznikRPC, oddaljeni_objekti
+from serving import PoolWSGIServer
+from shm import SharedHistoryRing
+from snapshot import Posnetek, nov_posnetek
+from validation import TransitionValidator
+
 # --- Konfiguracija ---
-HOST = "192.168.65.102"  # Poslušaj na vseh vmesnikih
-TCP_PORT = 50000  # Vrata za komunikacijo z robotom
+# Vrata za robota, dnevnik, izpis in stanja škatle so v config.py (skupna z headless.py)
 FLASK_PORT = 5000  # Vrata za REST API
-REFRESH_INTERVAL = 5 # Sekunde za avtomatsko osveževanje spletne strani
-
-# Stanja škatle (Ključi so sporočila, ki jih mora poslati robot)
-STANJA_SKATLE = {
-    "PRISPELA": "Prispela škatla",
-    "ODPRAVLJENA": "Odpravljena škatla",
-    "ZAKLENJENA": "Zaklenjena škatla",
-    "ODKLENJENA": "Odklenjena škatla",
-    "ODPRTA": "Odprta škatla",
-    "ZAPRTA": "Zaprta škatla"
+HTTP_STREZNIK = "razvoj"  # "razvoj" (Flaskov app.run) ali "produkcija" (nabor niti, 503 ob preobremenitvi; glej serving.py)
+HTTP_DELAVCI = 32  # Niti produkcijskega strežnika za zahteve v obdelavi (mirujoče povezave in /stream jih ne zasedajo)
+HTTP_MAKS_TOKOV = 256  # Največ toliko hkratnih /stream odjemalcev na proces (vsak ima lastno nit), ostali dobijo 503
+HTTP_VRSTA = 64  # Največ toliko sprejetih povezav čaka na prosto nit, ostale zavrnemo s 503
+HTTP_ROK_MIROVANJA_S = 5.0  # Keep-alive povezavo brez nove zahteve zapremo po toliko sekundah
+REFRESH_INTERVAL = 5 # Sekunde za avtomatsko osveževanje spletne strani (samo brskalniki brez JavaScripta)
+MAKS_CAKANJE_S = 60  # Najdaljše čakanje na spremembo pri /stanje?wait=
+SSE_PING_S = 15  # Na toliko sekund brez dogodkov pošljemo /stream odjemalcem prazen komentar
+SSE_MAKS_NA_PAKET = 500  # Največ toliko dogodkov pošljemo v enem krogu /stream
+API_ZGODOVINA_LIMIT = 1000  # Privzeto največ toliko zapisov na odgovor /api/zgodovina
+API_ZGODOVINA_MAKS_LIMIT = 10_000  # Zgornja meja za ?limit= pri /api/zgodovina
+IZVOZ_VRSTIC_NA_KOS = 5000  # /api/izvoz bere in pošilja zgodovino po toliko vrstic naenkrat
+IZVOZ_STOPNJA_STISKANJA = 1  # Stopnja gzip za /api/izvoz (1 = najhitreje; tok se stisne že ~5x)
+METRIKE_OMOGOCENE = True  # Metrike za /metrics; ko so izklopljene, vroča pot ne meri časov
+ZGODOVINA_KAPACITETA = 100_000  # Največ toliko zadnjih dogodkov hranimo v pomnilniku
+ZGODOVINA_MAKS_STAROST_S = None  # Starejše dogodke zavržemo (None = samo omejitev kapacitete)
+OPOZORILA_KAPACITETA = 1000  # Največ toliko zadnjih opozoril preverjanja prehodov hranimo v pomnilniku
+INTERVAL_PREVERJANJA_ROKOV = 1.0  # Na toliko sekund preverimo, ali je katera faza presegla rok
+UKAZI_ROBOTA = ["PAVZA", "NADALJUJ", "SPROSTI_SKATLO", "HITROST"]  # Ukazi za /api/ukaz; koda v binarnem protokolu je indeks + 1
+UKAZ_ROK_S = 2.0  # Privzeti rok za odgovor robota na ukaz
+UKAZ_MAKS_ROK_S = 30.0  # Največji rok, ki ga lahko zahteva odjemalec /api/ukaz
+VODILO_KAPACITETA = 10_000  # Največ toliko dogodkov čaka v vrsti posameznega naročnika vodila (glej bus.py)
+IZMENE = (6, 14, 22)  # Ure začetkov izmen po lokalnem času (za /api/rollup)
+ROLLUP_HRANI_S = {MINUTA: 6 * 3600, URA: 7 * 86400, IZMENA: 90 * 86400}  # Koliko časa hranimo vedra vsake ravni
+API_PROCESI = 0  # Število ločenih procesov za REST API (0 = API teče v procesu za sprejem; glej shm.py)
+INTERVAL_OSVEZEVANJA_API_S = 0.005  # Na toliko sekund proces API preveri, ali je v deljenem pomnilniku nov posnetek
+ZAJEM_POT = None  # Datoteka za zajem surovih sej robotov (None = brez zajema; glej test/replay_capture.py)
+
+# Vrstni red stanj v enem ciklu škatle, kot jih pošilja program robota (UR5/David.txt)
+ZAPOREDJE_CIKLA = ["PRISPELA", "ODKLENJENA", "ODPRTA", "ZAPRTA", "ZAKLENJENA", "ODPRAVLJENA"]
+
+# Dovoljeni prehodi (zadnje stanje -> naslednja stanja); None velja za robota, ki še ni poslal ničesar.
+# ODPRAVLJENA se pošlje le, če je škatla še pri senzorju (If digital_in[5]), zato lahko za
+# ZAKLENJENA pride tudi PRISPELA. Prvi dogodek po (ponovnem) zagonu strežnika ne preverjamo.
+PREHODI_CIKLA = {
+    "PRISPELA": {"ODKLENJENA"},
+    "ODKLENJENA": {"ODPRTA"},
+    "ODPRTA": {"ZAPRTA"},
+    "ZAPRTA": {"ZAKLENJENA"},
+    "ZAKLENJENA": {"ODPRAVLJENA", "PRISPELA"},
+    "ODPRAVLJENA": {"PRISPELA"},
 }
+# Najdaljše dovoljeno trajanje faze (sekunde v stanju, preden pride naslednje); robot normalno potrebuje 2-15 s
+ROKI_FAZ_S = {
+    "PRISPELA": 60,
+    "ODKLENJENA": 30,
+    "ODPRTA": 120,  # Škatla je odprta - predolgo odprta škatla je najpomembnejše opozorilo
+    "ZAPRTA": 30,
+    "ZAKLENJENA": 60,
+}
+
+# --- Globalne spremenljivke ---
+# Zgodovino in posnetek spreminja le nit za sprejem; bralci preberejo posnetek enkrat
+# na zahtevo in ga uporabljajo brez zaklepanja (glej snapshot.py).
+# Stanje sprejema zgradi pripravi_sprejem() ob zagonu, ne ob uvozu: procesi API (spawn) ta modul
+# znova uvozijo in stanje prevzamejo iz deljenega pomnilnika in prek RPC (proces_api), zato
+# lastne zgodovine, vodila in dnevnika (mape na disku) ne smejo ustvariti.
+zgodovina_akcij = None  # HistoryRing ali SharedHistoryRing
+posnetek = None  # Posnetek (glej snapshot.py)
+# Na ta pogoj čakajo /stream in /stanje?wait=; pisalec ga le obvesti po objavi posnetka
+obvestilo_stanja = threading.Condition()
+
+analitika = None  # CycleAnalytics
+rollup = None  # StateRollups
+metrike = None  # Registry
+m_sporocila = m_neveljavna = m_objava = None
+preverjanje = None  # TransitionValidator
+dnevnik_dogodkov = None  # EventLog
+vodilo = None  # EventBus
+zajem = None  # SessionCapture, ko je zajem vklopljen (--zajem)
+tcp_streznik = None  # Trenutni IngestServer (za /api/povezave)
+# Nastavi se ob urejeni zaustavitvi; /stream in čakajoče zahteve se takrat končajo
+ustavljanje = threading.Event()
+
+def _obvesti_cakajoce(_dogodek):
+    # Zbudi vse, ki čakajo na spremembo (/stream, /stanje?wait=); ti berejo posnetek,
+    # zato zadošča eno obvestilo za več dogodkov hkrati
+    with obvestilo_stanja:
+        obvestilo_stanja.notify_all()
+
+def pripravi_sprejem(dnevnik_mapa=DNEVNIK_MAPA, zgodovina=None):
+    """Zgradi stanje procesa za sprejem (zgodovina, posnetek, statistika, metrike, dnevnik, vodilo).
+
+    zgodovina je HistoryRing ali SharedHistoryRing (pri procesih API); privzeto nov HistoryRing.
+    Kliče se enkrat ob zagonu (ali iz test/replay_capture.py), pred obnovo iz dnevnika.
+    """
+    global zgodovina_akcij, posnetek, analitika, rollup, metrike, m_sporocila, m_neveljavna, m_objava
+    global preverjanje, dnevnik_dogodkov, vodilo
 
-# --- Globalne spremenljivke in Locki ---
-trenutno_stanje = "NI_PODATKOV_ROBOT_SE_NI_POVEZAL"
-stanje_lock = threading.Lock()
+    if zgodovina is None:
+        zgodovina = HistoryRing(ZGODOVINA_KAPACITETA, OPISI_STANJ, ZGODOVINA_MAKS_STAROST_S)
+    zgodovina_akcij = zgodovina
+    posnetek = Posnetek(0, ZACETNO_STANJE, {}, {}, zgodovina_akcij.pogled())
 
-zgodovina_akcij = []
-zgodovina_lock = threading.Lock()
+    analitika = CycleAnalytics(ZAPOREDJE_CIKLA)
+    rollup = StateRollups(STANJA_SKATLE, ROLLUP_HRANI_S, IZMENE)
+
+    # --- Metrike ---
+    metrike = Registry(METRIKE_OMOGOCENE)
+    m_sporocila = metrike.counter("ur5_messages_total", "Veljavna sporočila (stanja), prejeta od robotov")
+    m_neveljavna = metrike.counter("ur5_invalid_messages_total", "Neveljavna sporočila, prejeta od robotov")
+    m_objava = metrike.histogram("ur5_snapshot_publish_seconds", "Čas zapisa v zgodovino in objave novega posnetka stanja")
+
+    preverjanje = TransitionValidator(PREHODI_CIKLA, ROKI_FAZ_S, OPOZORILA_KAPACITETA, metrike)
+    dnevnik_dogodkov = EventLog(dnevnik_mapa, DNEVNIK_ZAPISOV_NA_SEGMENT, DNEVNIK_MAKS_SEGMENTOV, DNEVNIK_INTERVAL_FSYNC)
+
+    # --- Vodilo dogodkov ---
+    # Nit za sprejem vsak dogodek objavi enkrat; naročniki ga obdelajo v svojih nitih (glej bus.py).
+    # Statistika, preverjanje in števci po vedrih (rollup) potrebujejo vse dogodke, zato imajo veliko vrsto;
+    # če jo počasen naročnik vseeno napolni, zavržemo najstarejše (zavrženi in zamik so v /api/vodilo in
+    # metrikah), ker bi čakanje na prostor zadržalo nit za sprejem in potrdila robotom. Obveščanje
+    # nadzornih plošč potrebuje le zadnji dogodek.
+    # Trajni dnevnik in izpis imata že lastno vrsto in pisalno nit, zato ju kličemo neposredno.
+    vodilo = EventBus(metrike)
+    vodilo.naroci("analitika", lambda d: analitika.dodaj(d.robot, d.kljuc, d.cas_ns),
+                  kapaciteta=VODILO_KAPACITETA, politika=POLITIKA_ZAVRZI_NAJSTAREJSE)
+    vodilo.naroci("preverjanje", lambda d: preverjanje.dodaj(d.robot, d.kljuc, d.cas_ns),
+                  kapaciteta=VODILO_KAPACITETA, politika=POLITIKA_ZAVRZI_NAJSTAREJSE)
+    vodilo.naroci("rollup", lambda d: rollup.dodaj(d.koda, d.cas_ns),
+                  kapaciteta=VODILO_KAPACITETA, politika=POLITIKA_ZAVRZI_NAJSTAREJSE)
+    vodilo.naroci("obvestila", _obvesti_cakajoce, politika=POLITIKA_ZADNJI, kljuc=lambda d: None)
 
 # --- REST API Strežnik (Flask) ---
 app = Flask(__name__)
 
+MAKS_PREDPOMNJENIH_ODGOVOROV = 64  # Največ toliko različnih (pot, poizvedba) hranimo v predpomnilniku
+
+# Verzija se ob ponovnem zagonu začne znova, zato ETag vsebuje še oznako zagona
+_OZNAKA_ZAGONA = format(time.time_ns() // 1_000_000, "x")
+
+_odgovori_cache = {}  # (pot, poizvedba) -> (verzija, kodirano telo)
+_odgovori_cache_lock = threading.Lock()
+
+def _pogojni_odgovor(verzija, sestavi, mimetype, predpomni=True):
+    """Vrne odgovor z ETag glede na verzijo stanja.
+
+    Če ima odjemalec to verzijo že (If-None-Match), vrne 304 brez telesa.
+    Sicer telo vzame iz predpomnilnika ali ga sestavi s klicem sestavi(),
+    ki vrne bajte (ti se shranijo) ali generator (ta se pošlje pretočno).
+    """
+    etag = f"{_OZNAKA_ZAGONA}-{verzija}"
+    if request.if_none_match.contains(etag):
+        odgovor = Response(status=304)
+    else:
+        kljuc = (request.path, request.query_string)
+        # Branje slovarja je pod GIL atomarno; lock potrebujemo le pri zapisu
+        shranjen = _odgovori_cache.get(kljuc)
+        if shranjen is not None and shranjen[0] == verzija:
+            telo = shranjen[1]
+        else:
+            telo = sestavi()
+            if predpomni and isinstance(telo, bytes):
+                with _odgovori_cache_lock:
+                    if len(_odgovori_cache) >= MAKS_PREDPOMNJENIH_ODGOVOROV:
+                        # Najprej zavrzi zastarele verzije, nato najstarejši vnos
+                        for k in [k for k, (v, _t) in _odgovori_cache.items() if v != verzija]:
+                            del _odgovori_cache[k]
+                        if len(_odgovori_cache) >= MAKS_PREDPOMNJENIH_ODGOVOROV:
+                            del _odgovori_cache[next(iter(_odgovori_cache))]
+                    _odgovori_cache[kljuc] = (verzija, telo)
+        odgovor = Response(telo, mimetype=mimetype)
+    odgovor.set_etag(etag)
+    odgovor.headers['Cache-Control'] = 'no-cache'
+    return odgovor
+
 @app.route('/stanje', methods=['GET'])
 def get_stanje():
-    """Vrne trenutno stanje škatle (JSON)."""
-    with stanje_lock:
-        status = trenutno_stanje
-    return jsonify({
-        "status": "OK",
-        "stanje_skatle": status,
-        "cas_prejema": time.strftime("%Y-%m-%d %H:%M:%S")
-    })
+    """Vrne trenutno stanje škatle (JSON). Z ?robot=<id> vrne stanje izbranega robota.
 
-@app.route('/zgodovina', methods=['GET'])
-def get_zgodovina():
-    """Vrne zgodovino akcij v HTML formatu (tabela)."""
-    try:
-        # Varno preberi podatke
-        with zgodovina_lock:
-            history = list(zgodovina_akcij) 
-        
-        with stanje_lock:
-            current_status = trenutno_stanje
-            
-        # Sestavljanje HTML
-        html_table = f"""
+    Odgovor se spremeni le ob novem stanju, zato podpira If-None-Match (304).
+    Z ?wait=<s> zahteva počaka (long-poll), dokler ni stanje novejše od
+    odjemalčeve verzije (?verzija= ali ETag v If-None-Match), a največ s sekund.
+    """
+    robot = request.args.get('robot')
+    if 'wait' in request.args:
+        try:
+            cakanje = max(0.0, min(MAKS_CAKANJE_S, float(request.args['wait'])))
+        except ValueError:
+            cakanje = 0.0
+        pocakaj_na_spremembo(_znana_verzija(), cakanje)
+
+    p = posnetek
+    if robot is not None and robot not in p.stanja_robotov:
+        return jsonify({
+            "status": "NAPAKA",
+            "sporocilo": f"Robot '{robot}' ni znan.",
+            "roboti": sorted(p.stanja_robotov)
+        }), 404
+
+    def sestavi():
+        cas_ns = p.casi_stanj.get(robot)
+        return app.json.dumps({
+            "status": "OK",
+            "robot": robot,
+            "stanje_skatle": p.trenutno_stanje if robot is None else p.stanja_robotov[robot],
+            "roboti": p.stanja_robotov,
+            "cas_prejema": oblikuj_cas(cas_ns) if cas_ns else None,
+            "verzija": p.verzija
+        }).encode("utf-8") + b"\n"
+
+    return _pogojni_odgovor(p.verzija, sestavi, 'application/json')
+
+def _znana_verzija():
+    """Verzija stanja, ki jo odjemalec že ima (?verzija= ali naš ETag v If-None-Match)."""
+    if 'verzija' in request.args:
+        try:
+            return int(request.args['verzija'])
+        except ValueError:
+            pass
+    for etag in request.if_none_match.as_set():
+        oznaka, _, verzija = etag.rpartition("-")
+        if oznaka == _OZNAKA_ZAGONA and verzija.isdigit():
+            return int(verzija)
+    return posnetek.verzija
+
+def pocakaj_na_spremembo(znana_verzija, timeout):
+    """Počaka, da verzija stanja preseže znano, ali da poteče timeout. Vrne True ob spremembi."""
+    with obvestilo_stanja:
+        return obvestilo_stanja.wait_for(lambda: posnetek.verzija > znana_verzija or ustavljanje.is_set(), timeout)
+
+@app.route('/stream', methods=['GET'])
+def get_stream():
+    """Potisni kanal (Server-Sent Events) z vsemi novimi dogodki iz zgodovine.
+
+    Vsak dogodek ima id enak zaporedni številki (seq), zato brskalnik po
+    prekinitvi nadaljuje z Last-Event-ID. Z ?od=<seq> začnemo pri podanem
+    dogodku, z ?robot=<id> prejemamo le dogodke izbranega robota.
+    """
+    robot_filter = request.args.get('robot')
+    zacetek = request.headers.get('Last-Event-ID')
+    zacetek = int(zacetek) + 1 if zacetek and zacetek.isdigit() else None
+    if zacetek is None and request.args.get('od', '').isdigit():
+        zacetek = int(request.args['od'])
+
+    def generiraj():
+        p = posnetek
+        naslednji = p.zgodovina.naslednji_seq
+        od = naslednji if zacetek is None else min(zacetek, naslednji)
+
+        zacetni = {"trenutno_stanje": p.trenutno_stanje, "roboti": p.stanja_robotov, "verzija": p.verzija}
+        yield f"retry: 2000\nevent: posnetek\ndata: {app.json.dumps(zacetni)}\n\n"
+
+        while not ustavljanje.is_set():
+            p = posnetek
+            if od >= p.zgodovina.naslednji_seq:
+                if not pocakaj_na_spremembo(p.verzija, SSE_PING_S):
+                    yield ": ping\n\n"
+                continue
+
+            # Prazen seznam pomeni, da je pisalec dogodke medtem prepisal - nadaljujemo pri najstarejšem ohranjenem
+            zapisi = p.zgodovina.zapisi(od, od + SSE_MAKS_NA_PAKET)
+            if zapisi:
+                deli = []
+                for (seq, _cas_ns, _koda, robot), (cas, stanje, _robot) in zip(zapisi, p.zgodovina.vrstice(zapisi)):
+                    if robot_filter is not None and robot != robot_filter:
+                        continue
+                    podatki = app.json.dumps({"seq": seq, "cas": cas, "robot": robot, "stanje": stanje,
+                                              "trenutno_stanje": p.trenutno_stanje})
+                    deli.append(f"id: {seq}\nevent: stanje\ndata: {podatki}\n\n")
+                od = zapisi[-1][0] + 1
+                if deli:
+                    yield "".join(deli)
+
+    odgovor = Response(generiraj(), mimetype='text/event-stream')
+    odgovor.headers['Cache-Control'] = 'no-cache'
+    odgovor.headers['X-Accel-Buffering'] = 'no'
+    return odgovor
+
+# Statični del strani /zgodovina; {status} se vstavi ob sestavljanju glave
+ZGODOVINA_GLAVA_HTML = """
         <!DOCTYPE html>
         <html>
         <head>
@@ -69,36 +321,145 @@ def get_zgodovina():
                 tr:nth-child(even) {{ background-color: #f9f9f9; }}
                 .status-ok {{ color: #28a745; font-weight: bold; font-size: 1.1em; }}
                 .refresh {{ margin-top: 20px; font-style: italic; color: #6c757d;}}
+                .strani a {{ margin-right: 15px; }}
+                .opozorila {{ width: 75%; margin-top: 15px; padding: 10px 15px; background-color: #fff3cd; border: 1px solid #ffc107; }}
+                .opozorila li {{ margin: 4px 0; }}
             </style>
-            <meta http-equiv="refresh" content="{REFRESH_INTERVAL}"> 
+            <noscript><meta http-equiv="refresh" content="{refresh}"></noscript>
         </head>
         <body>
             <h1>📦 UR5 Nadzorna Plošča in Zgodovina Stanja</h1>
-            <h2>Trenutno stanje: <span class="status-ok">{current_status}</span></h2>
+            <h2>Trenutno stanje: <span class="status-ok" id="trenutno-stanje">{status}</span></h2>
+            <div class="opozorila" id="opozorila" hidden>
+                <strong>⚠️ Opozorila cikla</strong>
+                <ul id="seznam-opozoril"></ul>
+            </div>
             
             <table>
                 <thead>
                     <tr>
                         <th>Čas Dejanja</th>
+                        <th>Robot</th>
                         <th>Stanje Škatle</th>
                     </tr>
                 </thead>
-                <tbody>
+                <tbody id="vrstice">
         """
-        
-        # Dodaj vrstice v tabelo (od najnovejše proti najstarejši)
-        for cas, stanje in reversed(history):
-            html_table += f"<tr><td>{cas}</td><td>{stanje}</td></tr>"
-            
-        html_table += f"""
+
+ZGODOVINA_NA_STRAN = 100  # Privzeto število vrstic na stran (?limit=)
+OPOZORILA_NA_PLOSCI = 10  # Toliko zadnjih opozoril prikaže /zgodovina
+ZGODOVINA_MAKS_NA_STRAN = 1000  # Zgornja meja za ?limit=
+VRSTIC_NA_KOS = 200  # Toliko vrstic združimo v en kos pretočnega odgovora
+
+# Glava se spremeni le, ko se spremeni zgodovina, zato jo hranimo do naslednjega dogodka.
+# Par (ključ, html) se zamenja v celoti, zato ga bralci berejo brez zaklepanja.
+_glava_zgodovine = (None, "")
+
+def _glava_zgodovine_html(verzija, current_status):
+    """Vrne HTML glave strani /zgodovina; ponovno ga sestavi le ob novi verziji zgodovine."""
+    global _glava_zgodovine
+    kljuc = (verzija, current_status)
+    glava = _glava_zgodovine
+    if glava[0] != kljuc:
+        glava = _glava_zgodovine = (kljuc, ZGODOVINA_GLAVA_HTML.format(refresh=REFRESH_INTERVAL, status=current_status))
+    return glava[1]
+
+def _stevilo_iz_poizvedbe(ime, privzeto, najmanj, najvec):
+    """Prebere celoštevilski parameter poizvedbe in ga omeji na [najmanj, najvec]."""
+    try:
+        vrednost = int(request.args.get(ime, privzeto))
+    except ValueError:
+        vrednost = privzeto
+    return max(najmanj, min(najvec, vrednost))
+
+@app.route('/zgodovina', methods=['GET'])
+def get_zgodovina():
+    """Vrne zgodovino akcij v HTML formatu (tabela), po straneh (?page=, ?limit=).
+
+    Vrstice se pošiljajo sproti (generator), zato strežnik nikoli ne sestavi
+    celotne strani v enem nizu. Strani do privzete velikosti se predpomnijo
+    po verziji stanja in podpirajo If-None-Match (304).
+    """
+    try:
+        limit = _stevilo_iz_poizvedbe('limit', ZGODOVINA_NA_STRAN, 1, ZGODOVINA_MAKS_NA_STRAN)
+        page = _stevilo_iz_poizvedbe('page', 1, 1, 1 << 31)
+
+        p = posnetek
+        verzija = p.verzija
+
+        def generiraj():
+            # Stanje in vrstice sta iz istega posnetka; kopiramo samo vrstice izbrane strani
+            zgodovina = p.zgodovina
+            skupaj = len(zgodovina)
+            naslednji_seq = zgodovina.naslednji_seq
+            do_seq = naslednji_seq - (page - 1) * limit
+            zapisi = zgodovina.zapisi(max(zgodovina.prvi_seq, do_seq - limit), do_seq)
+            current_status = p.trenutno_stanje
+
+            strani = max(1, -(-skupaj // limit))
+            yield _glava_zgodovine_html(verzija, current_status)
+
+            # Dodaj vrstice v tabelo (od najnovejše proti najstarejši)
+            kos = []
+            for cas, stanje, robot in zgodovina.vrstice(reversed(zapisi)):
+                kos.append(f"<tr><td>{cas}</td><td>{escape(robot)}</td><td>{stanje}</td></tr>")
+                if len(kos) >= VRSTIC_NA_KOS:
+                    yield "".join(kos)
+                    kos.clear()
+            if kos:
+                yield "".join(kos)
+
+            povezave = []
+            if page > 1:
+                povezave.append(f'<a href="?page={page - 1}&limit={limit}">&laquo; Novejši</a>')
+            if page < strani:
+                povezave.append(f'<a href="?page={page + 1}&limit={limit}">Starejši &raquo;</a>')
+            yield f"""
                 </tbody>
             </table>
-            <p class="refresh">Stran se samodejno osveži vsakih {REFRESH_INTERVAL} sekund.</p>
+            <p class="strani">Stran {page} od {strani} ({skupaj} dogodkov) {" ".join(povezave)}</p>
+            <p class="refresh">Stran se samodejno posodobi ob vsaki spremembi stanja.</p>
+            <script>
+                // Potisni kanal: nova stanja prikažemo takoj, brez ponovnega nalaganja strani
+                const prvaStran = {"true" if page == 1 else "false"};
+                const limit = {limit};
+                const vrstice = document.getElementById("vrstice");
+                const vir = new EventSource("/stream?od={naslednji_seq}");
+                vir.addEventListener("stanje", (e) => {{
+                    const d = JSON.parse(e.data);
+                    document.getElementById("trenutno-stanje").textContent = d.trenutno_stanje;
+                    if (!prvaStran) return;
+                    const tr = vrstice.insertRow(0);
+                    for (const vrednost of [d.cas, d.robot, d.stanje]) tr.insertCell().textContent = vrednost;
+                    while (vrstice.rows.length > limit) vrstice.deleteRow(-1);
+                    osveziOpozorila();
+                }});
+
+                // Opozorila o vrstnem redu in predolgih fazah (prekoračen rok nastane tudi brez novega stanja)
+                function osveziOpozorila() {{
+                    fetch("/api/opozorila?limit={OPOZORILA_NA_PLOSCI}").then((r) => r.json()).then((d) => {{
+                        const seznam = document.getElementById("seznam-opozoril");
+                        seznam.replaceChildren(...d.opozorila.reverse().map((o) => {{
+                            const li = document.createElement("li");
+                            li.textContent = `${{o.cas}} ${{o.robot}}: ${{o.opis}}`;
+                            return li;
+                        }}));
+                        document.getElementById("opozorila").hidden = d.opozorila.length === 0;
+                    }}).catch(() => {{}});
+                }}
+                osveziOpozorila();
+                setInterval(osveziOpozorila, {REFRESH_INTERVAL * 1000});
+            </script>
         </body>
         </html>
         """
-        
-        return Response(html_table, mimetype='text/html; charset=utf-8')
+
+        # Običajne strani (ki jih osvežujejo nadzorne plošče) predpomnimo v celoti, večje pošljemo pretočno
+        if limit <= ZGODOVINA_NA_STRAN:
+            sestavi = lambda: "".join(generiraj()).encode("utf-8")
+        else:
+            sestavi = generiraj
+        return _pogojni_odgovor(verzija, sestavi, 'text/html; charset=utf-8')
 
     except Exception as e:
         # Poročanje o napaki, če sestavljanje HTML-ja ne uspe
@@ -108,68 +469,491 @@ def get_zgodovina():
         error_html = f"""
         <h1>Internal Server Error (500) pri /zgodovina</h1>
         <p>Prišlo je do napake pri generiranju HTML tabele. Preverite konzolo strežnika za podrobnosti.</p>
-        <pre>{error_trace}</pre>
+        <pre>{escape(error_trace)}</pre>
         """
         return Response(error_html, status=500, mimetype='text/html; charset=utf-8')
 
+def _cas_iz_poizvedbe(ime):
+    """Prebere čas iz poizvedbe (sekunde od epohe ali 'YYYY-MM-DD HH:MM:SS' po lokalnem času) v ns."""
+    vrednost = request.args.get(ime)
+    if vrednost is None:
+        return None
+    try:
+        return int(float(vrednost) * 1e9)
+    except ValueError:
+        pass
+    for oblika in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d"):
+        try:
+            return int(time.mktime(time.strptime(vrednost, oblika)) * 1e9)
+        except ValueError:
+            continue
+    raise ValueError(f"Neveljaven čas v parametru '{ime}': '{vrednost}'")
+
+@app.route('/api/zgodovina', methods=['GET'])
+def get_api_zgodovina():
+    """Vrne zgodovino v JSON obliki s filtri.
+
+    Parametri: since=<seq> (le dogodki z večjo zaporedno številko), from=/to=
+    (časovni obseg, to ni vključen), stanje=PRISPELA,ODPRTA (ključi stanj),
+    robot=<id>, limit=<n> in wait=<s> (če ni novih dogodkov, počakaj nanje).
+    Začetek obsega poiščemo z bisekcijo, zato poizvedba ne pregleda cele zgodovine.
+    """
+    try:
+        od_cas = _cas_iz_poizvedbe('from')
+        do_cas = _cas_iz_poizvedbe('to')
+        since = request.args.get('since')
+        od_seq = int(since) + 1 if since is not None else None
+        kode = None
+        if request.args.get('stanje'):
+            kode = {KLJUCI_STANJ.index(k.strip()) for k in request.args['stanje'].split(',')}
+    except ValueError as e:
+        return jsonify({"status": "NAPAKA", "sporocilo": f"Neveljavna poizvedba: {e}"}), 400
+    limit = _stevilo_iz_poizvedbe('limit', API_ZGODOVINA_LIMIT, 1, API_ZGODOVINA_MAKS_LIMIT)
+    robot = request.args.get('robot')
+
+    def poizvedi(zgodovina):
+        od = od_seq
+        if od_cas is not None:
+            od = max(od or 0, zgodovina.seq_od_casa(od_cas))
+        do = zgodovina.seq_od_casa(do_cas) if do_cas is not None else None
+        return zgodovina.poizvedba(od, do, kode, robot, limit + 1)
+
+    p = posnetek
+    zapisi = poizvedi(p.zgodovina)
+    if not zapisi and 'wait' in request.args and do_cas is None:
+        try:
+            cakanje = max(0.0, min(MAKS_CAKANJE_S, float(request.args['wait'])))
+        except ValueError:
+            cakanje = 0.0
+        if pocakaj_na_spremembo(p.verzija, cakanje):
+            p = posnetek
+            zapisi = poizvedi(p.zgodovina)
+    prvi_seq, naslednji_seq = p.zgodovina.prvi_seq, p.zgodovina.naslednji_seq
+
+    vec = len(zapisi) > limit
+    zapisi = zapisi[:limit]
+    return jsonify({
+        "status": "OK",
+        "zapisi": [
+            {"seq": seq, "cas_ns": cas_ns, "cas": oblikuj_cas(cas_ns), "robot": robot_id,
+             "kljuc": KLJUCI_STANJ[koda], "stanje": OPISI_STANJ[koda]}
+            for seq, cas_ns, koda, robot_id in zapisi
+        ],
+        "zadnji_seq": zapisi[-1][0] if zapisi else (od_seq - 1 if od_seq is not None else naslednji_seq - 1),
+        "vec": vec,
+        "prvi_seq": prvi_seq,
+        "naslednji_seq": naslednji_seq
+    })
+
+@app.route('/api/izvoz', methods=['GET'])
+def get_api_izvoz():
+    """Izvozi zgodovino kot datoteko, stisnjeno z gzip, ki se sestavlja in pošilja po kosih.
+
+    Parametri: format=csv|ndjson|stolpci (stolpčna binarna oblika, glej export.py),
+    from=/to= (časovni obseg kot pri /api/zgodovina), robot=<id>, stanje=<ključi>
+    in gzip=0 (brez stiskanja). Izvoz bere objavljeni posnetek, zato ga novi
+    dogodki med pošiljanjem ne spremenijo, poraba pomnilnika pa ni odvisna od obsega.
+    """
+    oblika = request.args.get('format', 'csv')
+    if oblika not in OBLIKE_IZVOZA:
+        return jsonify({"status": "NAPAKA",
+                        "sporocilo": f"Neznan format '{oblika}' (možni: {', '.join(OBLIKE_IZVOZA)})."}), 400
+    try:
+        od_cas = _cas_iz_poizvedbe('from')
+        do_cas = _cas_iz_poizvedbe('to')
+        kode = None
+        if request.args.get('stanje'):
+            kode = {KLJUCI_STANJ.index(k.strip()) for k in request.args['stanje'].split(',')}
+    except ValueError as e:
+        return jsonify({"status": "NAPAKA", "sporocilo": f"Neveljavna poizvedba: {e}"}), 400
+    stisni = request.args.get('gzip', '1') != '0'
+
+    zgodovina = posnetek.zgodovina
+    od_seq = zgodovina.seq_od_casa(od_cas) if od_cas is not None else None
+    do_seq = zgodovina.seq_od_casa(do_cas) if do_cas is not None else None
+    sestavi, vrsta, koncnica = OBLIKE_IZVOZA[oblika]
+    kosi = sestavi(zgodovina, od_seq, do_seq, KLJUCI_STANJ, OPISI_STANJ, kode, request.args.get('robot'),
+                   IZVOZ_VRSTIC_NA_KOS)
+
+    ime = f"zgodovina_{time.strftime('%Y%m%d_%H%M%S')}.{koncnica}"
+    if stisni:
+        kosi, vrsta, ime = gzip_tok(kosi, IZVOZ_STOPNJA_STISKANJA), 'application/gzip', ime + ".gz"
+    odgovor = Response(kosi, content_type=vrsta)
+    odgovor.headers['Content-Disposition'] = f'attachment; filename="{ime}"'
+    odgovor.headers['Cache-Control'] = 'no-cache'
+    return odgovor
+
+@app.route('/api/statistika', methods=['GET'])
+def get_api_statistika():
+    """Vrne trajanja ciklov in faz (povprečja, p50/p95/p99) ter pretok škatel po urah.
+
+    Statistika se računa sproti ob vsakem dogodku, zato zahteva ne pregleduje
+    zgodovine. Z ?robot=<id> vrne podrobnosti za enega robota.
+    """
+    robot = request.args.get('robot')
+    povzetek = analitika.povzetek(robot)
+    if povzetek is None:
+        return jsonify({"status": "NAPAKA", "sporocilo": f"Robot '{robot}' ni znan."}), 404
+    return jsonify({"status": "OK", **povzetek})
+
+@app.route('/api/rollup', methods=['GET'])
+def get_api_rollup():
+    """Vrne število dogodkov vsakega stanja po minutah, urah ali izmenah (?raven=minuta|ura|izmena).
+
+    Števci se posodabljajo sproti, grobejša vedra pa so sestavljena iz finejših,
+    zato zahteva ne pregleduje zgodovine. Z ?limit=<n> vrne le n zadnjih veder.
+    """
+    raven = request.args.get('raven', URA)
+    if raven not in RAVNI:
+        return jsonify({"status": "NAPAKA", "sporocilo": f"Neznana raven '{raven}' (možne: {', '.join(RAVNI)})."}), 400
+    limit = _stevilo_iz_poizvedbe('limit', API_ZGODOVINA_MAKS_LIMIT, 0, API_ZGODOVINA_MAKS_LIMIT)
+    return jsonify({"status": "OK", **rollup.povzetek(raven, limit)})
+
+@app.route('/api/opozorila', methods=['GET'])
+def get_api_opozorila():
+    """Vrne zadnja opozorila preverjanja prehodov (vrstni red, podvojena stanja, prekoračeni roki).
+
+    Parametri: since=<id> (le novejša opozorila), robot=<id> in limit=<n>.
+    Odgovor vsebuje še število opozoril po vrstah in trenutno fazo vsakega robota.
+    """
+    try:
+        since = int(request.args['since']) if 'since' in request.args else None
+    except ValueError:
+        return jsonify({"status": "NAPAKA", "sporocilo": "Parameter since mora biti celo število."}), 400
+    limit = _stevilo_iz_poizvedbe('limit', OPOZORILA_KAPACITETA, 1, OPOZORILA_KAPACITETA)
+    rezultat = preverjanje.opozorila(since, request.args.get('robot'), limit)
+    return jsonify({"status": "OK", **rezultat, "faze": preverjanje.faze()})
+
+@app.route('/api/vodilo', methods=['GET'])
+def get_api_vodilo():
+    """Vrne stanje naročnikov vodila dogodkov: politiko, zasedenost vrste, zamik in zavržene dogodke."""
+    return jsonify({"status": "OK", "narocniki": vodilo.narocniki()})
+
+@app.route('/api/povezave', methods=['GET'])
+def get_api_povezave():
+    """Vrne trenutno povezane robote in zadnje ponovne povezave (s časom prekinitve)."""
+    if tcp_streznik is None:
+        return jsonify({"status": "NAPAKA", "sporocilo": "TCP strežnik ne teče."}), 503
+    return jsonify({"status": "OK", **tcp_streznik.stanje_povezav()})
+
+@app.route('/api/ukaz', methods=['POST'])
+def post_api_ukaz():
+    """Pošlje ukaz (ali več ukazov hkrati) povezanemu robotu in vrne njegove odgovore s časom povratne poti.
+
+    Telo (JSON): {"robot": "<id>", "ukaz": "PAVZA", "argument": 0, "rok_s": 2}
+    ali {"robot": "<id>", "ukazi": [{"ukaz": ..., "argument": ...}, ...], "rok_s": 2}.
+    Več ukazov se pošlje naenkrat, brez čakanja na posamezne odgovore.
+    """
+    if tcp_streznik is None:
+        return jsonify({"status": "NAPAKA", "sporocilo": "TCP strežnik ne teče."}), 503
+    telo = request.get_json(silent=True) or {}
+    robot = telo.get('robot')
+    ukazi = telo.get('ukazi') or [{"ukaz": telo.get('ukaz'), "argument": telo.get('argument', 0)}]
+    try:
+        rok_s = min(max(float(telo.get('rok_s', UKAZ_ROK_S)), 0.0), UKAZ_MAKS_ROK_S)
+        if not robot:
+            raise ValueError("manjka 'robot'")
+        cakajoci = [tcp_streznik.poslji_ukaz(str(robot), u.get('ukaz'), u.get('argument', 0), rok_s) for u in ukazi]
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({"status": "NAPAKA", "sporocilo": f"Neveljaven ukaz: {e}"}), 400
+
+    konec = time.monotonic() + rok_s
+    odgovori = []
+    status = 200
+    for future in cakajoci:
+        try:
+            odgovori.append(future.result(timeout=max(0.0, konec - time.monotonic())))
+        except RobotNiPovezan as e:
+            return jsonify({"status": "NAPAKA", "sporocilo": str(e)}), 404
+        except (FutureTimeout, TimeoutError):
+            odgovori.append({"napaka": "Robot ni odgovoril v roku."})
+            status = 504
+        except PovezavaPrekinjena as e:
+            odgovori.append({"napaka": str(e)})
+            status = 502
+    return jsonify({"status": "OK" if status == 200 else "NAPAKA", "robot": robot, "odgovori": odgovori}), status
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Vrne metrike strežnika v besedilni obliki Prometheus."""
+    if not metrike.omogoceno:
+        return Response("Metrike so izklopljene (METRIKE_OMOGOCENE).\n", status=404, mimetype='text/plain')
+    return Response(metrike.izpis(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+# --- Trajni dnevnik dogodkov ---
+
+def obnovi_iz_dnevnika():
+    """Ob zagonu iz trajnega dnevnika obnovi trenutno stanje in zadnjo zgodovino. Vrne število obnovljenih dogodkov."""
+    global posnetek
+
+    zapisi, zadnji_po_robotih = dnevnik_dogodkov.obnovi(ZGODOVINA_KAPACITETA)
+
+    obnovljeni = []
+    for seq, cas_ns, koda, robot in zapisi:
+        seq, cas_ns = zgodovina_akcij.append(koda, robot, cas_ns, seq=seq)
+        obnovljeni.append((seq, cas_ns, koda, robot))
+
+    # Statistiko ciklov ogrejemo z obnovljeno zgodovino (z enakimi časi, kot jih ima zgodovina)
+    for _seq, cas_ns, koda, robot in obnovljeni:
+        analitika.dodaj(robot, KLJUCI_STANJ[koda], cas_ns)
+        rollup.dodaj(koda, cas_ns)
+        preverjanje.dodaj(robot, KLJUCI_STANJ[koda], cas_ns, obnova=True)
+
+    stanja_robotov = {robot: OPISI_STANJ[koda] for robot, (_seq, _cas, koda, _r) in zadnji_po_robotih.items()}
+    casi_stanj = {robot: cas_ns for robot, (_seq, cas_ns, _koda, _r) in zadnji_po_robotih.items()}
+    trenutno_stanje = posnetek.trenutno_stanje
+    if zadnji_po_robotih:
+        _seq, cas_ns, koda, _robot = max(zadnji_po_robotih.values())
+        trenutno_stanje = OPISI_STANJ[koda]
+        casi_stanj[None] = cas_ns
+    posnetek = Posnetek(posnetek.verzija + 1, trenutno_stanje, stanja_robotov, casi_stanj, zgodovina_akcij.pogled())
+
+    return len(zapisi)
+
 # --- TCP/IP Strežnik (Sprejemanje podatkov od robota) ---
 
-def tcp_server_thread():
-    """Zažene TCP/IP strežnik za sprejemanje podatkov od robota in beleženje zgodovine."""
-    global trenutno_stanje
+def zabelezi_sporocilo(robot_id, sporocilo):
+    """Obdela eno sporočilo robota: posodobi stanje in zgodovino. Vrne potrdilo za robota."""
+    global posnetek
+
+    # Preveri, ali je prejeto sporočilo veljavno stanje
+    if sporocilo in STANJA_SKATLE:
+        novo_stanje = STANJA_SKATLE[sporocilo]
+        zacetek = time.perf_counter() if metrike.omogoceno else 0.0
+
+        # Dodaj novo dejanje v zgodovino; bralci ga vidijo šele z objavo posnetka,
+        # ki stanje in zgodovino zamenja hkrati (ena zamenjava reference, brez locka).
+        # Čas vzamemo iz zgodovine: če se ura sistema premakne nazaj, ga ta zadrži, in posnetek,
+        # vodilo (statistika) in dnevnik morajo imeti enak čas kot /zgodovina
+        seq, cas_ns = zgodovina_akcij.append(KODE_STANJ[sporocilo], robot_id, time.time_ns())
+        posnetek = nov_posnetek(posnetek, zgodovina_akcij, robot_id, novo_stanje, cas_ns)
+        if API_PROCESI:
+            zgodovina_akcij.objavi(posnetek, robot_id)  # Procesom API (seqlock v deljenem pomnilniku)
+        if metrike.omogoceno:
+            m_objava.observe(time.perf_counter() - zacetek)
+        m_sporocila.inc()
+
+        # Statistiko, preverjanje prehodov in obveščanje čakajočih opravijo naročniki vodila
+        vodilo.objavi(Dogodek(seq, cas_ns, robot_id, sporocilo, KODE_STANJ[sporocilo]))
+
+        # Zapis na disk opravi pisalna nit dnevnika - potrdilo robotu ne čaka na fsync
+        dnevnik_dogodkov.dodaj(seq, cas_ns, KODE_STANJ[sporocilo], robot_id)
+            
+        # Izpis opravi pisalna nit async_log (ne dnevnika dogodkov), zato počasna konzola ne zadrži potrdila robotu
+        log.info(f"✅ NOVO STANJE: {novo_stanje}", robot=robot_id, sporocilo=sporocilo, seq=seq)
+    else:
+        m_neveljavna.inc()
+        log.warning("⚠️ Neveljavno sporočilo od robota", robot=robot_id, sporocilo=sporocilo)
     
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+    # Pošlji potrdilo nazaj robotu (eno za vsako sporočilo)
+    return b"OK"
+
+def nadzor_rokov_thread():
+    """Periodično preveri, ali je kateri robot v fazi dlje od njenega roka (ROKI_FAZ_S)."""
+    while True:
+        time.sleep(INTERVAL_PREVERJANJA_ROKOV)
         try:
-            s.bind((HOST, TCP_PORT))
-            s.listen()
-            print(f"🤖 TCP/IP Strežnik čaka na povezavo robota na vratih {TCP_PORT}...")
+            preverjanje.preveri_roke()
+        except Exception as e:
+            log.error("Napaka pri preverjanju rokov faz", napaka=e)
+
+def tcp_server_thread():
+    """Zažene TCP/IP strežnik za sprejemanje podatkov od robotov in beleženje zgodovine.
+
+    Vse povezane robote obdeluje ena nit (glej ingest.py), zato lahko na iste
+    vrata hkrati pošilja več celic.
+    """
+    global tcp_streznik
+
+    while not ustavljanje.is_set():
+        server = IngestServer(HOST, TCP_PORT, zabelezi_sporocilo, FRAMING_MODE, STANJA_SKATLE, metrike, zajem,
+                              KEEPALIVE, ROK_UTRIPA_S, ROK_NEDEJAVNOSTI_S, IZLOCAJ_ZASTARELE_POVEZAVE, UKAZI_ROBOTA)
+        tcp_streznik = server
+        try:
+            server.bind()
+            print(f"🤖 TCP/IP Strežnik čaka na povezave robotov na vratih {TCP_PORT}...")
         except Exception as e:
             print(f"FATALNA NAPAKA: Ne morem zagnati TCP strežnika na vratih {TCP_PORT}. Napaka: {e}")
             return # Izhod iz niti
-        
-        while True:
-            try:
-                conn, addr = s.accept()
-                print(f"Povezava vzpostavljena od: {addr}")
-                
-                with conn:
-                    while True:
-                        # Prejmi podatke (npr. 1024 bajtov)
-                        data = conn.recv(1024)
-                        if not data:
-                            print(f"Povezava z {addr} prekinjena.")
-                            break
-                        
-                        # Dekodiranje in čiščenje prejetih podatkov (String, kot v vaši kodi)
-                        sporocilo = data.decode('utf-8').strip()
-                        
-                        # Preveri, ali je prejeto sporočilo veljavno stanje
-                        if sporocilo in STANJA_SKATLE:
-                            novo_stanje = STANJA_SKATLE[sporocilo]
-                            trenutni_cas = time.strftime("%Y-%m-%d %H:%M:%S")
-                            
-                            # POSODOBI TRENUTNO STANJE IN ZGODOVINO Z LOCKOM
-                            with stanje_lock:
-                                trenutno_stanje = novo_stanje
-                                
-                            with zgodovina_lock:
-                                # Dodaj novo dejanje v zgodovino
-                                zgodovina_akcij.append((trenutni_cas, novo_stanje))
-                                
-                            print(f"✅ NOVO STANJE: {trenutno_stanje} (Sporočilo: '{sporocilo}') ob {trenutni_cas}")
-                        else:
-                            print(f"⚠️ Neveljavno sporočilo od robota: '{sporocilo}'")
-                        
-                        # Pošlji potrdilo nazaj robotu
-                        conn.sendall(b"OK")
-                        
-            except Exception as e:
-                print(f"Napaka v TCP/IP strežniku (med povezavo): {e}")
-                time.sleep(1)
+
+        try:
+            server.serve_forever()
+        except Exception as e:
+            log.error("Napaka v TCP/IP strežniku", napaka=e)
+            time.sleep(1)
+
+# --- Ločeni procesi za REST API ---
+# Proces za sprejem piše zgodovino in posnetek v deljeni pomnilnik (shm.py), procesi API
+# jih berejo neposredno. Ostalo (statistika, opozorila, vodilo, metrike, ukazi) pokličejo
+# v procesu za sprejem (rpc.py). Tako HTTP promet ne tekmuje s sprejemom za isti GIL.
+
+# Objekti procesa za sprejem in metode, ki jih smejo klicati procesi API
+KLICI_API = {
+    "analitika": ("povzetek",),
+    "rollup": ("povzetek",),
+    "preverjanje": ("opozorila", "faze"),
+    "vodilo": ("narocniki",),
+    "tcp_streznik": ("stanje_povezav", "poslji_ukaz"),
+    "metrike": ("izpis",),
+}
+
+def proces_api(ime_zgodovine, vticnica, naslov_rpc, kljuc_rpc, log_nivo, log_format, nacin_streznika):
+    """Proces REST API: posnetek bere iz deljenega pomnilnika, ostalo kliče v procesu za sprejem."""
+    global zgodovina_akcij, posnetek, _OZNAKA_ZAGONA, analitika, rollup, preverjanje, vodilo, tcp_streznik, metrike
+
+    log.nastavi(nivo=log_nivo, format=log_format)
+    zgodovina_akcij = SharedHistoryRing(ime_zgodovine, ZGODOVINA_KAPACITETA, OPISI_STANJ, ZGODOVINA_MAKS_STAROST_S)
+    posnetek = zgodovina_akcij.posnetek()
+    _OZNAKA_ZAGONA = format(zgodovina_akcij.zagon, "x")  # ETag je enak v vseh procesih API
+    oddaljeni = oddaljeni_objekti(naslov_rpc, kljuc_rpc, KLICI_API,
+                                  {"metrike": {"omogoceno": METRIKE_OMOGOCENE}})
+    analitika, preverjanje, vodilo = oddaljeni["analitika"], oddaljeni["preverjanje"], oddaljeni["vodilo"]
+    rollup = oddaljeni["rollup"]
+    tcp_streznik, metrike = oddaljeni["tcp_streznik"], oddaljeni["metrike"]
+
+    threading.Thread(target=osvezuj_posnetek_thread, args=(os.getppid(),), name="osvezevanje", daemon=True).start()
+    if nacin_streznika != "produkcija":
+        make_server("0.0.0.0", 0, app, threaded=True, fd=vticnica.fileno()).serve_forever()
+        return
+
+    # Metrike nabora niti ostanejo lokalne (v /metrics so le metrike procesa za sprejem)
+    streznik = PoolWSGIServer("0.0.0.0", 0, app, HTTP_DELAVCI, HTTP_VRSTA, HTTP_ROK_MIROVANJA_S, fd=vticnica.fileno(),
+                              maks_tokov=HTTP_MAKS_TOKOV)
+    # Zaustavitev usklajuje proces za sprejem: procesom API pošlje SIGTERM, Ctrl+C pa prejme le on
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=ustavi_http, args=(streznik,),
+                                                              name="zaustavitev").start())
+    streznik.serve_forever()
+
+def ustavi_http(streznik):
+    """Konča /stream in čakajoče zahteve ter urejeno ustavi HTTP strežnik (zahteve v teku se dokončajo)."""
+    ustavljanje.set()
+    with obvestilo_stanja:
+        obvestilo_stanja.notify_all()
+    if streznik is not None and not streznik.ustavi(ROK_ZAUSTAVITVE_S):
+        log.warning("⚠️ Nekatere HTTP zahteve se niso končale v roku zaustavitve")
+
+def osvezuj_posnetek_thread(stars):
+    """V procesu API prevzema nove posnetke iz deljenega pomnilnika in zbudi čakajoče (/stream, wait=)."""
+    global posnetek
+
+    while True:
+        time.sleep(INTERVAL_OSVEZEVANJA_API_S)
+        if os.getppid() != stars:
+            os._exit(0)  # Proces za sprejem se je končal - deljeni pomnilnik ni več veljaven
+        p = zgodovina_akcij.posnetek()
+        if p is not posnetek:
+            posnetek = p
+            with obvestilo_stanja:
+                obvestilo_stanja.notify_all()
+
+def zazeni_procese_api(stevilo, nacin_streznika):
+    """V procesu za sprejem odpre vrata REST API-ja, zažene procese API in jih ob izpadu znova zažene.
+
+    Vrne se ob urejeni zaustavitvi (produkcijski način).
+    """
+    kljuc = os.urandom(32)
+    rpc = StreznikRPC(lambda ime: globals()[ime], KLICI_API, kljuc)
+    rpc.start()
+    atexit.register(rpc.zapri)
+
+    vticnica = socket.create_server(("0.0.0.0", FLASK_PORT), backlog=128)
+    kontekst = multiprocessing.get_context("spawn")  # Brez fork: proces za sprejem ima že zagnane niti
+    argumenti = (zgodovina_akcij.ime, vticnica, rpc.naslov, kljuc, log.nivo, log.format, nacin_streznika)
+    procesi = []
+
+    def ustavi():
+        for proces in procesi:
+            proces.terminate()
+        for proces in procesi:
+            proces.join(ROK_ZAUSTAVITVE_S + 1)
+    atexit.register(ustavi)
+    if nacin_streznika == "produkcija":
+        namesti_zaustavitev(ustavi)
+
+    for _ in range(stevilo):
+        proces = kontekst.Process(target=proces_api, args=argumenti, name="api", daemon=True)
+        proces.start()
+        procesi.append(proces)
+    while not ustavljanje.wait(1):
+        for i, proces in enumerate(procesi):
+            if not proces.is_alive():
+                log.error("❌ Proces API se je končal; zaganjam novega", pid=proces.pid, koda=proces.exitcode)
+                procesi[i] = kontekst.Process(target=proces_api, args=argumenti, name="api", daemon=True)
+                procesi[i].start()
+
+# --- Urejena zaustavitev ---
+
+_nit_zaustavitve = None
+
+def zaustavi(ustavi_api):
+    """Urejena zaustavitev: najprej REST API (zahteve v teku, npr. ukazi, še potrebujejo robote),
+    nato sprejem (roboti dobijo potrdila za vse, kar so že poslali), na koncu zapis na disk."""
+    zacetek = time.perf_counter()
+    log.info("🛑 Zaustavljanje ...")
+    ustavljanje.set()
+    ustavi_api()
+    streznik = tcp_streznik
+    if streznik is not None:
+        streznik.stop(ROK_ZAUSTAVITVE_S)
+        tcp_thread.join(ROK_ZAUSTAVITVE_S + 1)
+    vodilo.zapri()
+    dnevnik_dogodkov.zapri()  # Zapiše in sinhronizira (fsync) še nezapisane dogodke
+    if zajem is not None:
+        zajem.zapri()
+    log.info("🛑 Strežnik zaustavljen", trajanje_s=round(time.perf_counter() - zacetek, 3))
+    log.zapri()
+
+def namesti_zaustavitev(ustavi_api):
+    """SIGTERM in Ctrl+C sprožita urejeno zaustavitev v ločeni niti (enkrat)."""
+    def ob_signalu(_signum, _okvir):
+        global _nit_zaustavitve
+        if _nit_zaustavitve is None:
+            _nit_zaustavitve = threading.Thread(target=zaustavi, args=(ustavi_api,), name="zaustavitev")
+            _nit_zaustavitve.start()
+    signal.signal(signal.SIGTERM, ob_signalu)
+    signal.signal(signal.SIGINT, ob_signalu)
 
 # --- Zagon aplikacije ---
 
+def parse_args():
+    """Argumenti ukazne vrstice; privzete vrednosti so iz konfiguracije na vrhu datoteke."""
+    parser = argparse.ArgumentParser(description="Strežnik za sprejem stanj robota UR5 in REST API.")
+    parser.add_argument("--host", default=HOST, help="Naslov, na katerem posluša TCP strežnik za robote")
+    parser.add_argument("--tcp-port", type=int, default=TCP_PORT, help="Vrata za komunikacijo z robotom")
+    parser.add_argument("--http-port", type=int, default=FLASK_PORT, help="Vrata za REST API")
+    parser.add_argument("--dnevnik", default=DNEVNIK_MAPA, help="Mapa trajnega dnevnika dogodkov")
+    parser.add_argument("--log-nivo", default=LOG_NIVO, choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Najnižji nivo zapisov, ki se izpišejo na konzolo")
+    parser.add_argument("--log-format", default=LOG_FORMAT, choices=["besedilo", "json"], help="Oblika izpisa dnevnika")
+    parser.add_argument("--zajem", default=ZAJEM_POT,
+                        help="Zapiši surove seje robotov v datoteko (za ponovitev s test/replay_capture.py)")
+    parser.add_argument("--brez-izlocanja", action="store_true",
+                        help="Nova povezava robota ne zapre prejšnje z istim imenom (ponovitev anonimnih sej z enega naslova)")
+    parser.add_argument("--streznik", default=HTTP_STREZNIK, choices=["razvoj", "produkcija"],
+                        help="HTTP strežnik: razvoj (Flaskov) ali produkcija (nabor niti, keep-alive, 503 ob "
+                             "preobremenitvi, urejena zaustavitev ob SIGTERM/Ctrl+C)")
+    parser.add_argument("--api-procesi", type=int, default=API_PROCESI,
+                        help="REST API poganjaj v toliko ločenih procesih; zgodovino berejo iz deljenega pomnilnika")
+    return parser.parse_args()
+
 if __name__ == '__main__':
+    args = parse_args()
+    HOST, TCP_PORT, FLASK_PORT = args.host, args.tcp_port, args.http_port
+    log.nastavi(nivo=args.log_nivo, format=args.log_format)
+    if args.brez_izlocanja:
+        IZLOCAJ_ZASTARELE_POVEZAVE = False
+    API_PROCESI = max(0, args.api_procesi)
+    HTTP_STREZNIK = args.streznik
+    DNEVNIK_MAPA = args.dnevnik
+    zgodovina = None
+    if API_PROCESI:
+        # Zgodovino (in posnetek) pišemo v deljeni pomnilnik, ki ga berejo procesi API
+        zgodovina = SharedHistoryRing(f"ur5_zgodovina_{os.getpid()}", ZGODOVINA_KAPACITETA, OPISI_STANJ,
+                                      ZGODOVINA_MAKS_STAROST_S, ustvari=True)
+        atexit.register(zgodovina.zapri, unlink=True)
+    pripravi_sprejem(DNEVNIK_MAPA, zgodovina)
+
     # Poskusimo dobiti LAN IP za izpis
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -179,20 +963,50 @@ if __name__ == '__main__':
     except Exception:
         local_ip = "127.0.0.1" 
         
-    # Inicializiraj zgodovino z začetnim stanjem
-    with zgodovina_lock:
-        zgodovina_akcij.append((time.strftime("%Y-%m-%d %H:%M:%S"), trenutno_stanje))
+    # Obnovi stanje iz trajnega dnevnika; če je prazen, inicializiraj zgodovino z začetnim stanjem
+    zacetek = time.perf_counter()
+    obnovljenih = obnovi_iz_dnevnika()
+    if obnovljenih:
+        print(f"💾 Iz dnevnika obnovljenih {obnovljenih} dogodkov v {(time.perf_counter() - zacetek) * 1000:.1f} ms")
+    else:
+        zgodovina_akcij.append(KODA_ZACETNEGA_STANJA, "-")
+        posnetek = posnetek._replace(verzija=posnetek.verzija + 1, zgodovina=zgodovina_akcij.pogled())
+    if API_PROCESI:
+        zgodovina_akcij.objavi(posnetek)
+
+    dnevnik_dogodkov.start()
+    atexit.register(dnevnik_dogodkov.zapri)
+    atexit.register(vodilo.zapri)
+    if args.zajem:
+        zajem = SessionCapture(args.zajem)
+        zajem.start()
+        print(f"🎥 Zajem surovih sej robotov v {args.zajem}")
 
     # 1. Zaženi TCP/IP strežnik v ločeni niti
     tcp_thread = threading.Thread(target=tcp_server_thread)
     tcp_thread.daemon = True
     tcp_thread.start()
+    threading.Thread(target=nadzor_rokov_thread, name="nadzor_rokov", daemon=True).start()
     
     # 2. Zaženi REST API strežnik
     print(f"\n{'='*50}")
     print(f"🤖 STREŽNIK ZA ROBOTA ZAGNAN")
     print(f"  - TCP Poslušanje na vratih: {TCP_PORT}")
     print(f"  - Za ogled ZGODOVINE odpri: http://{local_ip}:{FLASK_PORT}/zgodovina")
+    if API_PROCESI:
+        print(f"  - REST API v {API_PROCESI} ločenih procesih (deljeni pomnilnik {zgodovina_akcij.ime})")
     print(f"{'='*50}\n")
-    
-    app.run(host='0.0.0.0', port=FLASK_PORT)
+
+    if API_PROCESI:
+        zazeni_procese_api(API_PROCESI, HTTP_STREZNIK)
+    elif HTTP_STREZNIK == "produkcija":
+        http_streznik = PoolWSGIServer('0.0.0.0', FLASK_PORT, app, HTTP_DELAVCI, HTTP_VRSTA, HTTP_ROK_MIROVANJA_S, metrike,
+                                      maks_tokov=HTTP_MAKS_TOKOV)
+        print(f"🌐 Produkcijski HTTP strežnik: {HTTP_DELAVCI} niti, vrsta {HTTP_VRSTA}")
+        namesti_zaustavitev(lambda: ustavi_http(http_streznik))
+        http_streznik.serve_forever()
+    else:
+        app.run(host='0.0.0.0', port=FLASK_PORT)
+
+    if _nit_zaustavitve is not None:
+        _nit_zaustavitve.join()
@@ -0,0 +1,177 @@
+import bisect
+import math
+import threading
+
+# --- Metrike v obliki Prometheus (/metrics) ---
+#
+# Števci, merilniki in histogrami z vnaprej določenimi mejami razredov.
+# Posodobitev je en seštevek (pri histogramu še bisekcija), privzeto brez
+# zaklepanja: "+=" ni atomaren, zato je to varno le, če metriko posodablja ena
+# sama nit (npr. metrike sprejema, ki jih piše le nit za sprejem). Metrike, ki
+# jih posodablja več niti (npr. delavci HTTP strežnika), registriramo z
+# vec_pisalcev=True - takrat inc/dec/observe tečejo pod zaklepom metrike.
+# Nastavitev (set) je ena zamenjava vrednosti in ne potrebuje zaklepa. Ko so
+# metrike izklopljene, registry vrača prazne metrike, klicatelji pa s
+# preverjanjem Registry.omogoceno preskočijo še merjenje časa.
+
+# Meje razredov v sekundah - od 10 µs do 1 s, kar pokrije čase na vročem delu
+PRIVZETE_MEJE = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Counter:
+    tip = "counter"
+
+    def __init__(self, ime, opis):
+        self.ime = ime
+        self.opis = opis
+        self.vrednost = 0
+
+    def inc(self, n=1):
+        self.vrednost += n
+
+    def vzorci(self):
+        yield self.ime, "", self.vrednost
+
+
+class Gauge(Counter):
+    tip = "gauge"
+
+    def set(self, vrednost):
+        self.vrednost = vrednost
+
+    def dec(self, n=1):
+        self.vrednost -= n
+
+
+class Histogram:
+    tip = "histogram"
+
+    def __init__(self, ime, opis, meje=PRIVZETE_MEJE):
+        self.ime = ime
+        self.opis = opis
+        self.meje = tuple(meje)
+        self.stevci = [0] * (len(self.meje) + 1)  # Zadnji razred je +Inf
+        self.vsota = 0.0
+
+    def observe(self, vrednost):
+        self.stevci[bisect.bisect_left(self.meje, vrednost)] += 1
+        self.vsota += vrednost
+
+    def vzorci(self):
+        skupaj = 0
+        for meja, stevec in zip(self.meje + (math.inf,), self.stevci):
+            skupaj += stevec
+            le = "+Inf" if meja == math.inf else repr(meja)
+            yield f"{self.ime}_bucket", f'{{le="{le}"}}', skupaj
+        yield f"{self.ime}_sum", "", self.vsota
+        yield f"{self.ime}_count", "", skupaj
+
+
+class _ZaklenjenCounter(Counter):
+    """Counter, ki ga posodablja več niti."""
+
+    def __init__(self, ime, opis):
+        super().__init__(ime, opis)
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.vrednost += n
+
+
+class _ZaklenjenGauge(Gauge, _ZaklenjenCounter):
+    """Gauge, ki ga posodablja več niti."""
+
+    def dec(self, n=1):
+        with self._lock:
+            self.vrednost -= n
+
+
+class _ZaklenjenHistogram(Histogram):
+    """Histogram, ki ga posodablja več niti; izpis prebere razrede in vsoto hkrati."""
+
+    def __init__(self, ime, opis, meje=PRIVZETE_MEJE):
+        super().__init__(ime, opis, meje)
+        self._lock = threading.Lock()
+
+    def observe(self, vrednost):
+        razred = bisect.bisect_left(self.meje, vrednost)
+        with self._lock:
+            self.stevci[razred] += 1
+            self.vsota += vrednost
+
+    def vzorci(self):
+        with self._lock:
+            stevci, vsota = list(self.stevci), self.vsota
+        skupaj = 0
+        for meja, stevec in zip(self.meje + (math.inf,), stevci):
+            skupaj += stevec
+            le = "+Inf" if meja == math.inf else repr(meja)
+            yield f"{self.ime}_bucket", f'{{le="{le}"}}', skupaj
+        yield f"{self.ime}_sum", "", vsota
+        yield f"{self.ime}_count", "", skupaj
+
+
+class _PraznaMetrika:
+    """Nadomestek za vse vrste metrik, ko so metrike izklopljene."""
+
+    def inc(self, n=1):
+        pass
+
+    def dec(self, n=1):
+        pass
+
+    def set(self, vrednost):
+        pass
+
+    def observe(self, vrednost):
+        pass
+
+
+_PRAZNA = _PraznaMetrika()
+
+
+class Registry:
+    """Zbirka metrik, ki jo /metrics izpiše v besedilni obliki Prometheus."""
+
+    def __init__(self, omogoceno=True):
+        self.omogoceno = omogoceno
+        self._metrike = {}
+        self._lock = threading.Lock()
+
+    # vec_pisalcev=True: metriko posodablja več niti (glej opis na vrhu datoteke)
+
+    def counter(self, ime, opis, vec_pisalcev=False):
+        return self._registriraj(_ZaklenjenCounter if vec_pisalcev else Counter, ime, opis)
+
+    def gauge(self, ime, opis, vec_pisalcev=False):
+        return self._registriraj(_ZaklenjenGauge if vec_pisalcev else Gauge, ime, opis)
+
+    def histogram(self, ime, opis, meje=PRIVZETE_MEJE, vec_pisalcev=False):
+        return self._registriraj(_ZaklenjenHistogram if vec_pisalcev else Histogram, ime, opis, meje)
+
+    def _registriraj(self, razred, ime, opis, *args):
+        if not self.omogoceno:
+            return _PRAZNA
+        with self._lock:
+            metrika = self._metrike.get(ime)
+            if metrika is None:
+                metrika = self._metrike[ime] = razred(ime, opis, *args)
+            elif metrika.tip != razred.tip:
+                raise ValueError(f"Metrika '{ime}' je že registrirana kot {metrika.tip}.")
+            elif type(metrika) is not razred:
+                raise ValueError(f"Metrika '{ime}' je že registrirana z drugačnim vec_pisalcev.")
+            return metrika
+
+    def izpis(self):
+        """Vse metrike v besedilni obliki Prometheus (text/plain; version=0.0.4)."""
+        with self._lock:
+            metrike = list(self._metrike.values())
+        vrstice = []
+        for metrika in metrike:
+            vrstice.append(f"# HELP {metrika.ime} {metrika.opis}")
+            vrstice.append(f"# TYPE {metrika.ime} {metrika.tip}")
+            for ime, oznake, vrednost in metrika.vzorci():
+                vrstice.append(f"{ime}{oznake} {vrednost}")
+        return "\n".join(vrstice) + "\n"
@@ -0,0 +1,160 @@
+import threading
+import time
+from collections import deque
+
+from history import oblikuj_cas
+
+# --- Števci stanj po časovnih vedrih (minuta, ura, izmena) ---
+#
+# Za nadzorne plošče (npr. "koliko škatel je bilo odpravljenih po urah te
+# izmene") štejemo dogodke vsakega stanja po vedrih, namesto da bi ob vsaki
+# zahtevi pregledovali zgodovino. Dogodek poveča le števec odprtega (zadnjega)
+# minutnega vedra. Ko se minuta zapre, njene števce prištejemo vedru njene ure,
+# zaprto uro pa vedru njene izmene - grobejša vedra so tako sestavljena iz
+# finejših in dodajanje ostane O(1). Vsaka raven hrani vedra le za svoj čas
+# (hrani_s), zato je pomnilnik omejen, poizvedba pa stane enako ne glede na to,
+# kako dolgo strežnik teče.
+#
+# Shranjeno vedro ravni zato vsebuje le zaprta finejša vedra; pri branju
+# zadnjemu vedru prištejemo še odprta finejša vedra. Zamujen dogodek (starejši
+# od odprte minute, npr. ob obnovi ali pri več robotih z zamikom) prištejemo
+# vsem ravnem, katerih finejše vedro je že zaprto in prišteto.
+#
+# Ure so poravnane na polno uro od epohe, izmene pa se začnejo ob urah iz
+# zacetki_izmen po lokalnem času; pri časovnih pasovih s celournim zamikom se
+# meje ujemajo.
+
+MINUTA = "minuta"
+URA = "ura"
+IZMENA = "izmena"
+
+RAVNI = (MINUTA, URA, IZMENA)
+
+
+class _Raven:
+    __slots__ = ("ime", "zacetek", "hrani_s", "vedra")
+
+    def __init__(self, ime, zacetek, hrani_s):
+        self.ime = ime
+        self.zacetek = zacetek  # Funkcija: čas (s od epohe) -> začetek vedra, ki ga vsebuje
+        self.hrani_s = hrani_s
+        self.vedra = deque()  # [začetek v s, števci po kodah stanj]; zadnje vedro je odprto
+
+
+class StateRollups:
+    """Števci stanj po minutah, urah in izmenah z zlaganjem finejših veder v grobejša.
+
+    kljuci so imena stanj po kodah (koda je indeks); hrani_s preslika raven
+    (MINUTA, URA, IZMENA) v čas, za katerega hranimo njena vedra, zacetki_izmen
+    pa so ure začetkov izmen po lokalnem času (npr. (6, 14, 22)).
+    """
+
+    def __init__(self, kljuci, hrani_s, zacetki_izmen=(6, 14, 22)):
+        if not zacetki_izmen or any(not 0 <= ura < 24 for ura in zacetki_izmen):
+            raise ValueError("Začetki izmen morajo biti ure med 0 in 23.")
+        self.kljuci = list(kljuci)
+        self.zacetki_izmen = tuple(sorted(set(zacetki_izmen)))
+        self._lock = threading.Lock()
+        self._ravni = [_Raven(MINUTA, _minuta, hrani_s[MINUTA]),
+                       _Raven(URA, _ura, hrani_s[URA]),
+                       _Raven(IZMENA, self._izmena, hrani_s[IZMENA])]
+
+    def dodaj(self, koda, cas_ns):
+        """Prešteje en dogodek. Kliče ga naročnik vodila ob vsakem veljavnem stanju."""
+        if not 0 <= koda < len(self.kljuci):
+            return
+        s = cas_ns // 1_000_000_000
+        with self._lock:
+            minute = self._ravni[0].vedra
+            if not minute or _minuta(s) > minute[-1][0]:
+                self._napreduj(s)
+
+            # Dogodek v odprti minuti gre le v minuto; zamujen še v ravni, ki so njegovo vedro že prevzele
+            for raven in self._ravni:
+                zacetek = raven.zacetek(s)
+                vedro = self._vedro(raven, zacetek)
+                if vedro is not None:
+                    vedro[1][koda] += 1
+                if zacetek == raven.vedra[-1][0]:
+                    break
+
+    def _napreduj(self, s):
+        """Odpre nova vedra za čas s; zaprta vedra prišteje grobejši ravni in zavrže prestara."""
+        for i, raven in enumerate(self._ravni):
+            zacetek = raven.zacetek(s)
+            vedra = raven.vedra
+            if vedra and vedra[-1][0] == zacetek:
+                return  # Grobejše ravni imajo vedro za ta čas že odprto
+            if vedra and i + 1 < len(self._ravni):
+                zacetek_zaprtega, stevci = vedra[-1]
+                visja = self._ravni[i + 1]
+                vedro = self._vedro(visja, visja.zacetek(zacetek_zaprtega))
+                if vedro is not None:
+                    for koda, n in enumerate(stevci):
+                        vedro[1][koda] += n
+            vedra.append([zacetek, [0] * len(self.kljuci)])
+            while vedra[0][0] < zacetek - raven.hrani_s:
+                vedra.popleft()
+
+    def _vedro(self, raven, zacetek):
+        """Vedro z danim začetkom (išče od konca - skoraj vedno je zadnje); ustvari manjkajoče starejše."""
+        vedra = raven.vedra
+        for i in range(len(vedra) - 1, -1, -1):
+            if vedra[i][0] == zacetek:
+                return vedra[i]
+            if vedra[i][0] < zacetek:
+                break
+        else:
+            i = -1
+        if i == len(vedra) - 1 or zacetek < vedra[-1][0] - raven.hrani_s:
+            return None  # Novejše od odprtega (odpre ga _napreduj) ali prestaro za hranjenje
+        vedro = [zacetek, [0] * len(self.kljuci)]
+        vedra.insert(i + 1, vedro)
+        return vedro
+
+    def _izmena(self, s):
+        """Začetek izmene (s od epohe), v kateri je čas s."""
+        lokalno = time.localtime(s)
+        zacetki = [ura for ura in self.zacetki_izmen if ura <= lokalno.tm_hour]
+        dan = lokalno.tm_mday
+        if zacetki:
+            ura = zacetki[-1]
+        else:
+            ura, dan = self.zacetki_izmen[-1], dan - 1  # Nočna izmena se je začela prejšnji dan
+        return int(time.mktime((lokalno.tm_year, lokalno.tm_mon, dan, ura, 0, 0, 0, 0, -1)))
+
+    def povzetek(self, raven=URA, limit=None):
+        """Vedra ravni od najstarejšega do najnovejšega (največ limit zadnjih), z odprtimi finejšimi vedri."""
+        if raven not in RAVNI:
+            raise ValueError(f"Neznana raven '{raven}' (možne: {', '.join(RAVNI)}).")
+        indeks = RAVNI.index(raven)
+        with self._lock:
+            vedra = self._ravni[indeks].vedra
+            zacetek = len(vedra) - limit if limit is not None and limit < len(vedra) else 0
+            kopija = [(z, list(stevci)) for z, stevci in list(vedra)[zacetek:]]
+            if kopija:
+                # Zadnjemu vedru prištejemo še odprta vedra finejših ravni
+                for finejsa in self._ravni[:indeks]:
+                    if finejsa.vedra:
+                        for koda, n in enumerate(finejsa.vedra[-1][1]):
+                            kopija[-1][1][koda] += n
+            hrani_s = self._ravni[indeks].hrani_s
+
+        return {
+            "raven": raven,
+            "hrani_s": hrani_s,
+            "vedra": [{
+                "zacetek": oblikuj_cas(z * 1_000_000_000),
+                "zacetek_s": z,
+                "stanja": dict(zip(self.kljuci, stevci)),
+                "skupaj": sum(stevci),
+            } for z, stevci in kopija],
+        }
+
+
+def _minuta(s):
+    return s // 60 * 60
+
+
+def _ura(s):
+    return s // 3600 * 3600
@@ -0,0 +1,180 @@
+import pickle
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from multiprocessing.connection import Client, Listener
+
+from async_log import log
+
+# --- Klici iz procesov API v proces za sprejem ---
+#
+# Stanje in zgodovino procesi API berejo iz deljenega pomnilnika (shm.py);
+# statistika, opozorila, vodilo, metrike in ukazi robotom pa živijo v procesu
+# za sprejem. Do njih procesi API dostopajo z Oddaljeni, ki klic metode pošlje
+# po multiprocessing.connection (privzeta družina platforme: vtičnica AF_UNIX,
+# na Windows poimenovana cev AF_PIPE; povezava je preverjena s ključem) in
+# vrne rezultat ali ponovno sproži izjemo. Klicati je mogoče le metode s
+# seznama dovoljenih.
+#
+# Metoda, ki vrne Future (poslji_ukaz), najprej vrne potrditev, da je bil klic
+# sprejet, izid pa pride po isti povezavi, ko se Future izpolni. Oddaljeni zato
+# takoj vrne OddaljeniFuture in več ukazov je lahko hkrati na poti.
+
+_OK = "ok"
+_NAPAKA = "napaka"
+_FUTURE = "future"
+
+
+class StreznikRPC:
+    """Sprejema klice (objekt, metoda, args, kwargs) procesov API; vsaka povezava ima svojo nit.
+
+    poisci(ime) vrne trenutni objekt z imenom (npr. tcp_streznik, ki se ob
+    ponovnem zagonu zamenja); dovoljeno je slovar ime objekta -> imena metod.
+    """
+
+    def __init__(self, poisci, dovoljeno, kljuc):
+        self.poisci = poisci
+        self.dovoljeno = {ime: frozenset(metode) for ime, metode in dovoljeno.items()}
+        self._listener = Listener(authkey=kljuc)  # Naslov in družino izbere multiprocessing glede na platformo
+        self.naslov = self._listener.address
+
+    def start(self):
+        threading.Thread(target=self._sprejemaj, name="rpc", daemon=True).start()
+
+    def _sprejemaj(self):
+        while True:
+            try:
+                povezava = self._listener.accept()
+            except OSError:
+                return  # Poslušalec je zaprt
+            except Exception as e:
+                log.warning("⚠️ Zavrnjena povezava RPC", napaka=e)
+                continue
+            threading.Thread(target=self._obdelaj, args=(povezava,), name="rpc-povezava", daemon=True).start()
+
+    def _obdelaj(self, povezava):
+        with povezava:
+            while True:
+                try:
+                    ime, metoda, args, kwargs = povezava.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if metoda not in self.dovoljeno.get(ime, ()):
+                        raise PermissionError(f"Klic {ime}.{metoda} ni dovoljen.")
+                    objekt = self.poisci(ime)
+                    if objekt is None:
+                        raise LookupError(f"'{ime}' v procesu za sprejem ne teče.")
+                    rezultat = getattr(objekt, metoda)(*args, **kwargs)
+                except Exception as e:
+                    odgovor = (_NAPAKA, e)
+                else:
+                    odgovor = (_OK, rezultat) if not isinstance(rezultat, Future) else (_FUTURE, None)
+                try:
+                    _poslji(povezava, odgovor)
+                    if odgovor[0] == _FUTURE:
+                        try:
+                            odgovor = (_OK, rezultat.result())
+                        except Exception as e:
+                            odgovor = (_NAPAKA, e)
+                        _poslji(povezava, odgovor)
+                except (OSError, ValueError):
+                    return  # Odjemalec je povezavo zaprl (npr. ni več čakal na odgovor)
+
+    def zapri(self):
+        self._listener.close()
+
+
+def _poslji(povezava, odgovor):
+    try:
+        povezava.send(odgovor)
+    except (pickle.PicklingError, TypeError, AttributeError) as e:
+        povezava.send((_NAPAKA, RuntimeError(f"Rezultata ni mogoče prenesti v proces API: {e}")))
+
+
+class _Povezave:
+    """Proste povezave do StreznikRPC; vsak klic vzame svojo, zato so klici varni iz več niti."""
+
+    def __init__(self, naslov, kljuc):
+        self.naslov = naslov
+        self.kljuc = kljuc
+        self._proste = []
+        self._lock = threading.Lock()
+
+    def vzemi(self):
+        with self._lock:
+            if self._proste:
+                return self._proste.pop()
+        return Client(self.naslov, authkey=self.kljuc)
+
+    def vrni(self, povezava):
+        with self._lock:
+            self._proste.append(povezava)
+
+
+class OddaljeniFuture:
+    """Izid oddaljenega klica, ki vrne Future; result() ima enak pomen kot pri concurrent.futures."""
+
+    def __init__(self, povezave, povezava):
+        self._povezave = povezave
+        self._povezava = povezava
+
+    def result(self, timeout=None):
+        povezava = self._povezava
+        if povezava is None:
+            raise RuntimeError("Izid je že prebran.")
+        if not povezava.poll(timeout):
+            # Odgovor bi lahko prišel kasneje, zato povezave ne vrnemo med proste
+            self._povezava = None
+            povezava.close()
+            raise FutureTimeout()
+        try:
+            vrsta, vrednost = povezava.recv()
+        finally:
+            self._povezava = None
+        self._povezave.vrni(povezava)
+        if vrsta == _NAPAKA:
+            raise vrednost
+        return vrednost
+
+
+class Oddaljeni:
+    """Nadomestek objekta v procesu za sprejem: klic metode se izvede tam.
+
+    Atributi, podani kot lokalni (npr. omogoceno=True), se ne prenašajo.
+    """
+
+    def __init__(self, ime, povezave, **lokalni):
+        self._ime = ime
+        self._povezave = povezave
+        self.__dict__.update(lokalni)
+
+    def __getattr__(self, metoda):
+        if metoda.startswith("_"):
+            raise AttributeError(metoda)
+
+        def klic(*args, **kwargs):
+            return self._poklici(metoda, args, kwargs)
+        return klic
+
+    def _poklici(self, metoda, args, kwargs):
+        povezave = self._povezave
+        povezava = povezave.vzemi()
+        try:
+            povezava.send((self._ime, metoda, args, kwargs))
+            vrsta, vrednost = povezava.recv()
+        except BaseException:
+            povezava.close()
+            raise
+        if vrsta == _FUTURE:
+            return OddaljeniFuture(povezave, povezava)
+        povezave.vrni(povezava)
+        if vrsta == _NAPAKA:
+            raise vrednost
+        return vrednost
+
+
+def oddaljeni_objekti(naslov, kljuc, imena, lokalni=None):
+    """Slovar ime -> Oddaljeni za procese API; vsi si delijo zalogo povezav."""
+    povezave = _Povezave(naslov, kljuc)
+    lokalni = lokalni or {}
+    return {ime: Oddaljeni(ime, povezave, **lokalni.get(ime, {})) for ime in imena}
@@ -0,0 +1,424 @@
+import json
+import queue
+import selectors
+import socket
+import threading
+import time
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from werkzeug.wsgi import LimitedStream
+
+from async_log import log
+from metrics import Registry
+
+# --- Produkcijski HTTP strežnik z omejenim naborom niti ---
+#
+# Razvojni strežnik (app.run) za vsako povezavo zažene novo nit, brez zgornje
+# meje in brez urejene zaustavitve. PoolWSGIServer sprejete povezave da v
+# omejeno vrsto, obdela pa jih stalen nabor delavcev. Povezave ostanejo odprte
+# (HTTP/1.1 keep-alive) do rok_mirovanja_s brez nove zahteve. Ko je vrsta polna,
+# povezavo takoj zavrnemo z 503 in Retry-After, namesto da bi zahteve čakale
+# v nedogled in zadrževale odgovore vsem.
+#
+# Werkzeugov obdelovalec po vsakem odgovoru zapre povezavo, zato ima _Obdelovalec
+# lasten run_wsgi: telo zahteve omeji s Content-Length (in po odgovoru prebere
+# neprebrani ostanek), odgovor brez Content-Length pošlje po kosih (chunked).
+# Izhod obdelovalca je medpomnjen, zato glave in prvi kos odidejo v enem zapisu.
+#
+# Delavca zaseda le zahteva v obdelavi. Mirujočo keep-alive povezavo delavec po
+# odgovoru odda v čakalnico (ena nit s selectors), ki jo ob naslednji zahtevi
+# odjemalca vrne v vrsto, po rok_mirovanja_s brez zahteve pa zapre. Dolgotrajne
+# odgovore (text/event-stream, npr. /stream) do konca pošilja vsakega lastna nit,
+# zato odprte nadzorne plošče ne izčrpajo delavcev; takih odgovorov je največ
+# maks_tokov, naslednji dobijo 503. /stanje?wait= delavca zaseda, dokler čaka.
+#
+# ustavi(rok_s) zapre sprejemanje, počaka, da se končajo zahteve v obdelavi, v
+# vrsti in tokovi, nato zapre še mirujoče povezave in ustavi delavce.
+
+_ODGOVOR_PREOBREMENJEN = json.dumps({
+    "status": "NAPAKA",
+    "sporocilo": "Strežnik je preobremenjen, poskusite znova čez nekaj trenutkov.",
+}).encode("utf-8") + b"\n"
+_ODGOVOR_503 = (b"HTTP/1.1 503 Service Unavailable\r\n"
+                b"Content-Type: application/json\r\n"
+                b"Retry-After: 1\r\n"
+                b"Connection: close\r\n"
+                b"Content-Length: " + str(len(_ODGOVOR_PREOBREMENJEN)).encode() + b"\r\n\r\n" +
+                _ODGOVOR_PREOBREMENJEN)
+
+# Kdo prevzame povezavo, ko delavec konča z obdelovalcem (None: delavec jo zapre)
+_CAKALNICA = "cakalnica"  # Mirujoča keep-alive povezava čaka na naslednjo zahtevo
+_TOK = "tok"  # Dolgotrajni odgovor pošilja lastna nit, ki povezavo tudi zapre
+
+
+class _Obdelovalec(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 64 * 1024  # Medpomnjen izhod: glave in prvi kos v enem zapisu; pisi() ga izprazni
+
+    def setup(self):
+        super().setup()
+        # Odgovori s tokom (SSE) pišejo po kosih; brez tega bi Nagle ob keep-alive čakal na ACK odjemalca
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._prevzeto = False  # Odgovor pošilja nit toka, ki datoteke vtičnice zapre sama
+
+    def finish(self):
+        if not self._prevzeto:
+            super().finish()
+
+    def run_wsgi(self):
+        self.server._zacni_zahtevo()
+        try:
+            self._izvedi()
+        finally:
+            self.server._koncaj_zahtevo()
+        if self.server.ustavljanje:
+            self.close_connection = True  # Med zaustavitvijo povezave ne ohranjamo
+        elif not self.close_connection and not self._naslednja_zahteva_prispela():
+            # Zanka obdelovalca se konča, delavec pa povezavo odda v čakalnico
+            self.close_connection = True
+            self.server._lokalno.predano = _CAKALNICA
+
+    def _naslednja_zahteva_prispela(self):
+        """Ali je odjemalec že poslal naslednjo zahtevo (pipelining); ne blokira."""
+        self.connection.settimeout(0)
+        try:
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            self.connection.settimeout(self.timeout)
+
+    def _izvedi(self):
+        if self.headers.get("Expect", "").lower().strip(" \t") == "100-continue":
+            self.wfile.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            self.wfile.flush()
+        self.environ = environ = self.make_environ()
+        vhod = None
+        if "wsgi.input_terminated" in environ:
+            self.close_connection = True  # Telo po kosih: konca ne iščemo, povezave ne ohranimo
+        else:
+            try:
+                dolzina = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                self.send_error(400, "Neveljaven Content-Length")
+                return
+            environ["wsgi.input"] = vhod = LimitedStream(self.rfile, dolzina)
+
+        odziv = {"status": None, "glave": None}
+        poslano = False
+        po_kosih = False
+
+        def start_response(status, glave, exc_info=None):
+            if exc_info and poslano:
+                raise exc_info[1].with_traceback(exc_info[2])
+            odziv["status"], odziv["glave"] = status, glave
+            return pisi
+
+        def pisi(podatki):
+            nonlocal poslano, po_kosih
+            if not poslano:
+                poslano = True
+                koda, _, sporocilo = odziv["status"].partition(" ")
+                koda = int(koda)
+                self.send_response(koda, sporocilo)
+                kljuci = set()
+                for kljuc, vrednost in odziv["glave"]:
+                    self.send_header(kljuc, vrednost)
+                    kljuci.add(kljuc.lower())
+                if not ("content-length" in kljuci or environ["REQUEST_METHOD"] == "HEAD"
+                        or 100 <= koda < 200 or koda in (204, 304)):
+                    if self.request_version >= "HTTP/1.1":
+                        po_kosih = True
+                        self.send_header("Transfer-Encoding", "chunked")
+                    else:
+                        self.close_connection = True  # HTTP/1.0: konec telesa označi zaprtje povezave
+                if self.close_connection or self.server.ustavljanje:
+                    self.send_header("Connection", "close")
+                self.end_headers()  # Ostanejo v medpomnilniku izhoda do flush() spodaj
+            if podatki:
+                self.wfile.write(_kos(podatki) if po_kosih else podatki)
+            self.wfile.flush()
+
+        def posreduj(odgovor):
+            """Pošlje odgovor aplikacije do konca in ga zapre."""
+            try:
+                for podatki in odgovor:
+                    pisi(podatki)
+                if not poslano:
+                    pisi(b"")
+                if po_kosih:
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                if vhod is not None and not vhod.is_exhausted:
+                    vhod.exhaust()  # Neprebrani ostanek telesa, da je naslednja zahteva na začetku
+            except (ConnectionError, socket.timeout) as e:
+                self.close_connection = True
+                self.connection_dropped(e, environ)
+            except Exception as e:
+                self._napaka(e, poslano)
+            finally:
+                if hasattr(odgovor, "close"):
+                    odgovor.close()
+
+        try:
+            odgovor = self.server.app(environ, start_response)
+        except Exception as e:
+            self._napaka(e, poslano)
+            return
+        if odziv["glave"] is None or not _je_tok(odziv["glave"]):
+            posreduj(odgovor)
+            return
+
+        self.close_connection = True  # Tok se konča z zaprtjem povezave
+        if not self.server._zacni_tok():
+            if hasattr(odgovor, "close"):
+                odgovor.close()
+            self.wfile.write(_ODGOVOR_503)
+            return
+        # Delavca sprostimo: odgovor do konca pošlje lastna nit, ki nato zapre tudi povezavo
+        self._prevzeto = True
+        self.server._lokalno.predano = _TOK
+        threading.Thread(target=self._tok, args=(posreduj, odgovor), name="http-tok", daemon=True).start()
+
+    def _tok(self, posreduj, odgovor):
+        try:
+            posreduj(odgovor)
+        finally:
+            super().finish()
+            self.server._koncaj_tok(self.request)
+
+    def _napaka(self, napaka, poslano):
+        self.close_connection = True
+        log.error("❌ Napaka pri obdelavi HTTP zahteve", pot=self.path, napaka=napaka)
+        if not poslano:
+            self.send_error(500)
+
+    def log_error(self, format, *args):
+        if format.startswith("Request timed out"):
+            return  # Mirujoča keep-alive povezava je presegla rok_mirovanja_s - to ni napaka
+        super().log_error(format, *args)
+
+
+def _kos(podatki):
+    return b"%x\r\n%s\r\n" % (len(podatki), podatki)
+
+
+def _je_tok(glave):
+    """Ali je odgovor dolgotrajen tok dogodkov (SSE), ki ga pošilja lastna nit."""
+    return any(kljuc.lower() == "content-type" and vrednost.partition(";")[0].strip().lower() == "text/event-stream"
+               for kljuc, vrednost in glave)
+
+
+class PoolWSGIServer(BaseWSGIServer):
+    """WSGI strežnik s stalnim naborom delavcev, omejeno vrsto povezav in urejeno zaustavitvijo.
+
+    fd je že odprta poslušajoča vtičnica (npr. deljena med procesi API);
+    brez nje strežnik vrata odpre sam. maks_tokov omeji hkratne dolgotrajne
+    odgovore (SSE), ki jih pošiljajo lastne niti.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, delavcev=32, vrsta=64, rok_mirovanja_s=5.0, metrike=None, fd=None,
+                 maks_tokov=256):
+        obdelovalec = type("Obdelovalec", (_Obdelovalec,), {"timeout": rok_mirovanja_s})
+        super().__init__(host, port, app, obdelovalec, fd=fd)
+        self.delavcev = delavcev
+        self.rok_mirovanja_s = rok_mirovanja_s
+        self.maks_tokov = maks_tokov
+        self.ustavljanje = False
+        self._vrsta = queue.Queue(vrsta)
+        self._povezave = set()  # Povezave, ki jih trenutno drži delavec ali nit toka
+        self._v_obdelavi = 0
+        self._tokov = 0
+        self._lock = threading.Lock()
+        self._lokalno = threading.local()  # predano: kdo prevzame povezavo delavca (_CAKALNICA, _TOK ali None)
+
+        # Čakalnica mirujočih keep-alive povezav; nove ji druge niti oddajo prek vrste in budilke
+        self._cakalnica = selectors.DefaultSelector()
+        self._v_cakalnico_nove = []
+        self._cakalnica_tece = True
+        self._budilka = socket.socketpair()
+        for budilka in self._budilka:
+            budilka.setblocking(False)
+        self._cakalnica.register(self._budilka[0], selectors.EVENT_READ)
+
+        metrike = metrike or Registry(omogoceno=False)
+        self._m_vrsta = metrike.gauge("ur5_http_queue_depth", "Sprejete HTTP povezave, ki čakajo na prostega delavca")
+        self._m_zasedeni = metrike.gauge("ur5_http_busy_workers", "HTTP zahteve, ki so trenutno v obdelavi")
+        # Zavrnjene šteje nit za sprejem povezav in delavci (polno število tokov), čakanje pa vsi delavci
+        self._m_zavrnjene = metrike.counter("ur5_http_rejected_total",
+                                            "HTTP povezave, zavrnjene s 503, ker je bila vrsta ali število tokov polno",
+                                            vec_pisalcev=True)
+        self._m_tokovi = metrike.gauge("ur5_http_streams", "Odprti dolgotrajni odgovori (SSE), ki jih pošiljajo lastne niti")
+        self._m_mirujoce = metrike.gauge("ur5_http_idle_connections", "Mirujoče keep-alive povezave v čakalnici")
+        self._m_cakanje = metrike.histogram("ur5_http_queue_wait_seconds",
+                                            "Čas, ki ga sprejeta HTTP povezava čaka v vrsti na delavca",
+                                            vec_pisalcev=True)
+
+        self._delavci = [threading.Thread(target=self._delavec, name=f"http-{i}", daemon=True)
+                         for i in range(delavcev)]
+        for delavec in self._delavci:
+            delavec.start()
+        self._nit_cakalnice = threading.Thread(target=self._nit_cakalnica, name="http-cakalnica", daemon=True)
+        self._nit_cakalnice.start()
+
+    def process_request(self, request, client_address):
+        try:
+            self._vrsta.put_nowait((request, client_address, time.perf_counter()))
+        except queue.Full:
+            self._zavrni(request)
+            return
+        self._m_vrsta.set(self._vrsta.qsize())
+
+    def _zavrni(self, request):
+        self._m_zavrnjene.inc()
+        try:
+            request.settimeout(0.5)  # Počasen odjemalec ne sme ustaviti sprejemanja
+            request.sendall(_ODGOVOR_503)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _delavec(self):
+        while True:
+            vnos = self._vrsta.get()
+            if vnos is None:
+                return
+            request, client_address, sprejeto = vnos
+            self._m_vrsta.set(self._vrsta.qsize())
+            self._m_cakanje.observe(time.perf_counter() - sprejeto)
+            self._lokalno.predano = None
+            with self._lock:
+                self._povezave.add(request)
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                predano = self._lokalno.predano
+                if predano != _TOK:
+                    with self._lock:
+                        self._povezave.discard(request)
+                if predano == _CAKALNICA:
+                    self._v_cakalnico(request, client_address)
+                elif predano is None:
+                    self.shutdown_request(request)
+
+    # --- Čakalnica mirujočih keep-alive povezav ---
+
+    def _v_cakalnico(self, request, client_address):
+        with self._lock:
+            if self._cakalnica_tece:
+                self._v_cakalnico_nove.append((request, client_address))
+                request = None
+        if request is not None:
+            self.shutdown_request(request)  # Čakalnica je že ustavljena
+            return
+        self._zbudi_cakalnico()
+
+    def _zbudi_cakalnico(self):
+        try:
+            self._budilka[1].send(b"\0")
+        except OSError:
+            pass  # Budilka je polna (čakalnica se bo zbudila) ali že zaprta
+
+    def _nit_cakalnica(self):
+        mirujoce = {}  # request -> (naslov odjemalca, rok v monotonic)
+        while True:
+            for key, _mask in self._cakalnica.select(timeout=0.5):
+                if key.fileobj is self._budilka[0]:
+                    try:
+                        self._budilka[0].recv(4096)
+                    except OSError:
+                        pass
+                    continue
+                # Odjemalec je poslal naslednjo zahtevo (ali zaprl povezavo) - povezava gre nazaj v vrsto
+                request = key.fileobj
+                self._cakalnica.unregister(request)
+                self.process_request(request, mirujoce.pop(request)[0])
+
+            with self._lock:
+                nove, self._v_cakalnico_nove = self._v_cakalnico_nove, []
+                tece = self._cakalnica_tece
+            rok = time.monotonic() + self.rok_mirovanja_s
+            for request, naslov in nove:
+                mirujoce[request] = (naslov, rok)
+                self._cakalnica.register(request, selectors.EVENT_READ)
+            zdaj = time.monotonic()
+            for request, (_naslov, rok) in list(mirujoce.items()):
+                if rok <= zdaj or not tece:
+                    del mirujoce[request]
+                    self._cakalnica.unregister(request)
+                    self.shutdown_request(request)
+            self._m_mirujoce.set(len(mirujoce))
+            if not tece:
+                self._cakalnica.close()
+                for budilka in self._budilka:
+                    budilka.close()
+                return
+
+    # --- Tokovi (dolgotrajni odgovori) ---
+
+    def _zacni_tok(self):
+        with self._lock:
+            if self._tokov >= self.maks_tokov:
+                self._m_zavrnjene.inc()
+                return False
+            self._tokov += 1
+            self._m_tokovi.set(self._tokov)
+            return True
+
+    def _koncaj_tok(self, request):
+        with self._lock:
+            self._tokov -= 1
+            self._m_tokovi.set(self._tokov)
+            self._povezave.discard(request)
+        self.shutdown_request(request)
+
+    def _zacni_zahtevo(self):
+        with self._lock:
+            self._v_obdelavi += 1
+            self._m_zasedeni.set(self._v_obdelavi)
+
+    def _koncaj_zahtevo(self):
+        with self._lock:
+            self._v_obdelavi -= 1
+            self._m_zasedeni.set(self._v_obdelavi)
+
+    def stanje(self):
+        return {"delavcev": self.delavcev, "v_obdelavi": self._v_obdelavi, "v_vrsti": self._vrsta.qsize(),
+                "povezav": len(self._povezave), "tokov": self._tokov, "maks_tokov": self.maks_tokov}
+
+    def ustavi(self, rok_s=10.0):
+        """Urejena zaustavitev; kliče jo druga nit kot serve_forever. Vrne True, če so se vse zahteve končale v roku."""
+        self.ustavljanje = True
+        self.shutdown()  # Ne sprejemamo več novih povezav (serve_forever se vrne)
+        konec = time.monotonic() + rok_s
+        while (self._v_obdelavi or self._tokov or not self._vrsta.empty()) and time.monotonic() < konec:
+            time.sleep(0.05)
+        koncano = not self._v_obdelavi and not self._tokov and self._vrsta.empty()
+
+        # Mirujoče keep-alive povezave zapre čakalnica; zahteve in tokove, ki po roku še tečejo, zapremo tu
+        with self._lock:
+            self._cakalnica_tece = False
+        self._zbudi_cakalnico()
+        self._nit_cakalnice.join(1.0)
+        with self._lock:
+            povezave = list(self._povezave)
+        for request in povezave:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        while True:
+            try:
+                request, _naslov, _cas = self._vrsta.get_nowait()
+            except queue.Empty:
+                break
+            self.shutdown_request(request)
+        for _ in self._delavci:
+            self._vrsta.put(None)
+        for delavec in self._delavci:
+            delavec.join(max(0.1, konec - time.monotonic()))
+        return koncano
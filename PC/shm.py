@@ -0,0 +1,252 @@
+import time
+from array import array
+from multiprocessing import shared_memory
+
+from framing import MAKS_DOLZINA_IMENA
+from history import HistoryRing, MAKS_ROBOTOV, PogledZgodovine
+from snapshot import Posnetek
+
+# --- Zgodovina in posnetek stanja v deljenem pomnilniku (ločeni procesi) ---
+#
+# V načinu z ločenimi procesi (main.py --api-procesi) zgodovino piše le proces
+# za sprejem, procesi API pa jo berejo neposredno iz istega bloka
+# multiprocessing.shared_memory, brez kopiranja in brez skupnega GIL-a.
+#
+# SharedHistoryRing je HistoryRing, katerega polja (čas, koda, robot), meje
+# (prvi_seq, naslednji_seq) in tabela imen robotov so v deljenem pomnilniku;
+# HistoryRing.append in PogledZgodovine zato delujeta nespremenjena, vključno
+# s preverjanjem prepisanih vrstic po branju. Zadnja stanja robotov, trenutno
+# stanje in verzijo objavi pisalec z objavi() pod seqlockom: pred pisanjem
+# števec ZAKLEP poveča na liho, po pisanju na sodo vrednost. Bralec prebere
+# števec, podatke in znova števec; če se je števec vmes spremenil (ali je bil
+# lih), branje ponovi. Pogled bralca sega le do objavljenega naslednji_seq,
+# zato sta stanje in zgodovina v posnetku vedno usklajena.
+
+MAGIC_DELJENO = 0x5552355348_4D0002  # Oznaka in različica razporeditve bloka
+
+# Indeksi polj glave (int64)
+_MAGIC, _ZAKLEP, _PRVI_SEQ, _NASLEDNJI_SEQ, _KAPACITETA, _MAKS_ROBOTOV, _STEVILO_ROBOTOV, \
+    _VERZIJA, _OBJAVLJEN_SEQ, _TRENUTNA_KODA, _TRENUTNI_CAS, _ZAGON = range(12)
+VELIKOST_GLAVE = 16  # Polj int64; ostala so rezervirana
+
+VELIKOST_IMENA = 1 + MAKS_DOLZINA_IMENA  # Bajtov na ime robota (1 bajt dolžine + UTF-8)
+
+
+def _razporeditev(kapaciteta, maks_robotov):
+    """Odmiki polj v bloku; polja int64 so prva, da so poravnana."""
+    odmiki = {}
+    odmik = 0
+    for ime, velikost in (("glava", 8 * VELIKOST_GLAVE),
+                          ("cas", 8 * kapaciteta),
+                          ("stanje_cas", 8 * maks_robotov),
+                          ("robot", 2 * kapaciteta),
+                          ("koda", kapaciteta),
+                          ("stanje_koda", maks_robotov),
+                          ("imena", VELIKOST_IMENA * maks_robotov)):
+        odmiki[ime] = (odmik, velikost)
+        odmik += velikost
+    return odmiki, odmik
+
+
+class SharedHistoryRing(HistoryRing):
+    """HistoryRing v deljenem pomnilniku; ustvari ga pisalec, bralci se priključijo z ime.
+
+    Pisalec (proces za sprejem) kliče append() in objavi(), bralci (procesi API)
+    posnetek(). Ko pisalec konča, pokliče zapri(unlink=True).
+    """
+
+    def __init__(self, ime, kapaciteta, opisi_stanj, maks_starost_s=None, maks_robotov=MAKS_ROBOTOV, ustvari=False):
+        if kapaciteta <= 0:
+            raise ValueError("Kapaciteta zgodovine mora biti pozitivna.")
+        if not 0 < maks_robotov <= MAKS_ROBOTOV:
+            raise ValueError(f"Največ {MAKS_ROBOTOV} robotov.")
+        self.opisi_stanj = list(opisi_stanj)
+        self.maks_starost_ns = int(maks_starost_s * 1e9) if maks_starost_s else None
+        self._kode_opisov = {opis: koda for koda, opis in enumerate(self.opisi_stanj)}
+        self.pisalec = ustvari
+
+        if ustvari:
+            odmiki, velikost = _razporeditev(kapaciteta, maks_robotov)
+            self._shm = shared_memory.SharedMemory(name=ime, create=True, size=velikost)  # Napolnjen z ničlami
+        else:
+            self._shm = _prikljuci(ime)
+            glava = self._shm.buf[:8 * VELIKOST_GLAVE].cast('q')
+            try:
+                if glava[_MAGIC] != MAGIC_DELJENO:
+                    raise ValueError(f"Deljeni pomnilnik '{ime}' ni zgodovina (ali je druge različice).")
+                kapaciteta, maks_robotov = glava[_KAPACITETA], glava[_MAKS_ROBOTOV]
+            finally:
+                glava.release()
+            odmiki, _velikost = _razporeditev(kapaciteta, maks_robotov)
+
+        self.ime = self._shm.name
+        self.kapaciteta = kapaciteta
+        self.maks_robotov = maks_robotov
+        buf = self._shm.buf
+        polje = lambda ime, tip: buf[odmiki[ime][0]:sum(odmiki[ime])].cast(tip)  # noqa: E731
+        self._glava = polje("glava", 'q')
+        self._cas = polje("cas", 'q')
+        self._koda = polje("koda", 'B')
+        self._robot = polje("robot", 'H')
+        self._stanje_cas = polje("stanje_cas", 'q')
+        self._stanje_koda = polje("stanje_koda", 'B')
+        self._imena = polje("imena", 'B')
+
+        self._seznam_robotov = []
+        self._slovar_robotov = {}
+        self._zadnji_posnetek = None
+        if ustvari:
+            self._glava[_KAPACITETA] = kapaciteta
+            self._glava[_MAKS_ROBOTOV] = maks_robotov
+            self._glava[_ZAGON] = time.time_ns() // 1_000_000
+            self._glava[_MAGIC] = MAGIC_DELJENO
+
+    # Meje obsega so v glavi, zato jih HistoryRing.append piše neposredno v deljeni pomnilnik
+    @property
+    def _prvi_seq(self):
+        return self._glava[_PRVI_SEQ]
+
+    @_prvi_seq.setter
+    def _prvi_seq(self, vrednost):
+        self._glava[_PRVI_SEQ] = vrednost
+
+    @property
+    def _naslednji_seq(self):
+        return self._glava[_NASLEDNJI_SEQ]
+
+    @_naslednji_seq.setter
+    def _naslednji_seq(self, vrednost):
+        self._glava[_NASLEDNJI_SEQ] = vrednost
+
+    @property
+    def zagon(self):
+        """Čas zagona pisalca v ms (za oznako ETag, ki je enaka v vseh procesih)."""
+        return self._glava[_ZAGON]
+
+    def _izrez(self, i, j):
+        # Izrezi memoryview bi kazali v deljeni pomnilnik, ki ga pisalec prepisuje - kopiramo jih v polja
+        kos = []
+        for tip, stolpec in (('q', self._cas), ('B', self._koda), ('H', self._robot)):
+            kopija = array(tip)
+            if i < j:
+                kopija.frombytes(stolpec[i:j].cast('B'))
+            else:
+                kopija.frombytes(stolpec[i:].cast('B'))
+                kopija.frombytes(stolpec[:j].cast('B'))
+            kos.append(kopija)
+        return tuple(kos)
+
+    # --- Imena robotov ---
+
+    @property
+    def _roboti(self):
+        n = self._glava[_STEVILO_ROBOTOV]
+        seznam = self._seznam_robotov
+        while len(seznam) < n:
+            i = len(seznam)
+            zacetek = i * VELIKOST_IMENA
+            dolzina = self._imena[zacetek]
+            ime = bytes(self._imena[zacetek + 1:zacetek + 1 + dolzina]).decode("utf-8")
+            seznam.append(ime)
+            self._slovar_robotov[ime] = i
+        return seznam
+
+    @property
+    def _indeksi_robotov(self):
+        self._roboti  # noqa: B018 - osveži slovar z novimi imeni
+        return self._slovar_robotov
+
+    def _indeks_robota(self, robot):
+        indeks = self._slovar_robotov.get(robot)
+        if indeks is not None:
+            return indeks
+        indeks = len(self._seznam_robotov)
+        kodirano = robot.encode("utf-8")
+        if indeks >= self.maks_robotov:
+            raise ValueError(f"Preveč različnih robotov (največ {self.maks_robotov} v deljenem pomnilniku).")
+        if len(kodirano) > MAKS_DOLZINA_IMENA:
+            raise ValueError(f"Ime robota je predolgo (največ {MAKS_DOLZINA_IMENA} bajtov).")
+        zacetek = indeks * VELIKOST_IMENA
+        self._imena[zacetek + 1:zacetek + 1 + len(kodirano)] = kodirano
+        self._imena[zacetek] = len(kodirano)
+        self._seznam_robotov.append(robot)
+        self._slovar_robotov[robot] = indeks
+        # Število povečamo šele, ko je ime zapisano, zato bralec nikoli ne vidi nepopolnega imena
+        self._glava[_STEVILO_ROBOTOV] = indeks + 1
+        return indeks
+
+    # --- Objava posnetka (pisalec) ---
+
+    def objavi(self, posnetek, robot=None):
+        """Objavi posnetek bralcem. Z robot posodobi le stanje tega robota, sicer vsa stanja."""
+        g = self._glava
+        g[_ZAKLEP] += 1  # Liho: pisanje v teku
+        try:
+            roboti = (robot,) if robot is not None else posnetek.stanja_robotov
+            for ime in roboti:
+                indeks = self._indeks_robota(ime)
+                self._stanje_koda[indeks] = self._kode_opisov[posnetek.stanja_robotov[ime]]
+                self._stanje_cas[indeks] = posnetek.casi_stanj[ime]
+            g[_TRENUTNA_KODA] = self._kode_opisov[posnetek.trenutno_stanje]
+            g[_TRENUTNI_CAS] = posnetek.casi_stanj.get(None, 0)
+            g[_OBJAVLJEN_SEQ] = posnetek.zgodovina.naslednji_seq
+            g[_VERZIJA] = posnetek.verzija
+        finally:
+            g[_ZAKLEP] += 1  # Sodo: pisanje končano
+
+    # --- Branje posnetka (bralci) ---
+
+    def posnetek(self):
+        """Zadnji objavljeni posnetek; dokler se verzija ne spremeni, vrača isti objekt."""
+        g = self._glava
+        zadnji = self._zadnji_posnetek
+        if zadnji is not None and g[_VERZIJA] == zadnji.verzija and not g[_ZAKLEP] & 1:
+            return zadnji
+        while True:
+            zaklep = g[_ZAKLEP]
+            if zaklep & 1:
+                time.sleep(0)  # Pisalec je sredi objave
+                continue
+            verzija, objavljen_seq = g[_VERZIJA], g[_OBJAVLJEN_SEQ]
+            koda, cas_ns = g[_TRENUTNA_KODA], g[_TRENUTNI_CAS]
+            n = g[_STEVILO_ROBOTOV]
+            kode = bytes(self._stanje_koda[:n])
+            casi = self._stanje_cas[:n].tolist()
+            if g[_ZAKLEP] == zaklep:
+                break
+
+        roboti = self._roboti
+        opisi = self.opisi_stanj
+        stanja_robotov = {}
+        casi_stanj = {}
+        for i in range(n):
+            if casi[i]:
+                stanja_robotov[roboti[i]] = opisi[kode[i]]
+                casi_stanj[roboti[i]] = casi[i]
+        if cas_ns:
+            casi_stanj[None] = cas_ns
+        zgodovina = PogledZgodovine(self, min(self.prvi_seq, objavljen_seq), objavljen_seq)
+        self._zadnji_posnetek = Posnetek(verzija, opisi[koda], stanja_robotov, casi_stanj, zgodovina)
+        return self._zadnji_posnetek
+
+    def zapri(self, unlink=False):
+        for pogled in (self._glava, self._cas, self._koda, self._robot, self._stanje_cas, self._stanje_koda,
+                       self._imena):
+            pogled.release()
+        self._shm.close()
+        if unlink:
+            self._shm.unlink()
+
+
+def _prikljuci(ime):
+    """Priključi obstoječ blok, ne da bi ga bralec ob izhodu izbrisal.
+
+    Pred Pythonom 3.13 se blok ob priključitvi vedno prijavi sledilniku virov.
+    Procesi API so zagnani z multiprocessing iz procesa za sprejem in si z njim
+    delijo sledilnik, zato ponovna prijava ni škodljiva: sledilnik blok izbriše
+    šele, ko se končajo vsi (tudi če je bil proces za sprejem ubit).
+    """
+    try:
+        return shared_memory.SharedMemory(name=ime, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=ime)
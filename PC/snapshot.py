@@ -0,0 +1,26 @@
+from collections import namedtuple
+
+# --- Objava nespremenljivih posnetkov stanja ---
+#
+# Stanje škatle in zgodovino spreminja samo nit za sprejem (en pisalec). Po
+# vsakem dogodku sestavi nov Posnetek in ga objavi z eno zamenjavo reference,
+# ki je pod GIL atomarna. Bralci (HTTP zahteve) referenco preberejo enkrat in
+# nato uporabljajo le ta posnetek: ne zaklepajo, ne kopirajo zgodovine in
+# vedno vidijo trenutno stanje, ki se ujema z zadnjim dogodkom v zgodovini.
+
+Posnetek = namedtuple("Posnetek", [
+    "verzija",          # Poveča se ob vsaki objavi; določa ETag in veljavnost predpomnjenih odgovorov
+    "trenutno_stanje",  # Opis zadnjega stanja (kateregakoli robota)
+    "stanja_robotov",   # robot_id -> zadnje stanje tega robota
+    "casi_stanj",       # robot_id -> čas zadnjega stanja (ns od epohe); ključ None velja za trenutno_stanje
+    "zgodovina",        # PogledZgodovine z dogodki do vključno zadnjega objavljenega
+])
+
+
+def nov_posnetek(prejsnji, zgodovina, robot, stanje, cas_ns):
+    """Posnetek po novem stanju robota. Slovarja prejšnjega posnetka ostaneta nespremenjena."""
+    stanja_robotov = dict(prejsnji.stanja_robotov)
+    stanja_robotov[robot] = stanje
+    casi_stanj = dict(prejsnji.casi_stanj)
+    casi_stanj[robot] = casi_stanj[None] = cas_ns
+    return Posnetek(prejsnji.verzija + 1, stanje, stanja_robotov, casi_stanj, zgodovina.pogled())
@@ -0,0 +1,295 @@
+#
+# Obremenitveni test za PC/main.py
+#
+# Odpre N navideznih robotov (TCP), ki pošiljajo stanja z nastavljivo hitrostjo,
+# hkrati pa M HTTP odjemalcev obremenjuje /stanje in /zgodovina. Na koncu
+# izpiše rezultate v JSON obliki, da jih lahko primerjamo med različicami.
+#
+# Primer:
+#   python main.py                      (strežnik, HOST nastavljen na 127.0.0.1)
+#   python test/ingest_benchmark.py --roboti 50 --hitrost 20 --http-odjemalci 8 --trajanje 30
+#   python test/ingest_benchmark.py --protokol binarno --cevovod 16   (binarni protokol s kumulativnimi potrdili)
+#
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Binarni protokol uvozimo iz strežnika (glej PC/framing.py), da test ne odstopa od protokola;
+# kode so indeksi v STANJA_SKATLE
+from config import KODE_STANJ  # noqa: E402
+from framing import MAGIC_BINARNO, OKVIR as BIN_OKVIR, POTRDILO as BIN_POTRDILO, POZDRAV as BIN_POZDRAV  # noqa: E402
+
+ZAPOREDJE_CIKLA = ["PRISPELA", "ODKLENJENA", "ODPRTA", "ZAPRTA", "ZAKLENJENA", "ODPRAVLJENA"]
+HTTP_POTI = ["/stanje", "/zgodovina"]
+POTRDILO = b"OK"
+
+
+def percentili(vrednosti):
+    """p50/p95/p99/max v milisekundah."""
+    if not vrednosti:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    urejeni = sorted(vrednosti)
+    def p(x):
+        return round(urejeni[min(len(urejeni) - 1, int(x * len(urejeni)))] * 1000, 3)
+    return {"p50": p(0.50), "p95": p(0.95), "p99": p(0.99), "max": round(urejeni[-1] * 1000, 3)}
+
+
+# --- Navidezni roboti (asyncio) ---
+
+class RobotStats:
+    def __init__(self):
+        self.poslanih = 0
+        self.potrjenih = 0
+        self.rtt = []
+        self.napake = 0
+
+
+def ime_robota(args, i):
+    """Ime, pod katerim strežnik beleži i-tega navideznega robota."""
+    if args.protokol == "binarno":
+        return str(args.binarna_stevilka + i)
+    return f"{args.predpona}{i}"
+
+
+async def navidezni_robot(i, args, konec, stats):
+    try:
+        reader, writer = await asyncio.open_connection(args.host, args.tcp_port)
+    except OSError:
+        stats.napake += 1
+        return
+    if args.protokol == "binarno":
+        await binarni_robot(i, args, konec, stats, reader, writer)
+        return
+    writer.write(f"ROBOT={ime_robota(args, i)}\n".encode())
+    await reader.readexactly(len(POTRDILO))
+
+    interval = 1.0 / args.hitrost
+    cakajoci = []  # Časi pošiljanja sporočil, ki še čakajo na potrdilo
+    naslednje = time.perf_counter()
+    i = 0
+
+    async def beri_potrdila():
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                return
+            zdaj = time.perf_counter()
+            for _ in range(data.count(POTRDILO)):
+                if cakajoci:
+                    stats.rtt.append(zdaj - cakajoci.pop(0))
+                stats.potrjenih += 1
+
+    bralec = asyncio.create_task(beri_potrdila())
+    try:
+        while time.perf_counter() < konec:
+            if len(cakajoci) >= args.cevovod:
+                await asyncio.sleep(0.0005)
+                continue
+            # Brez ločila, kot pošilja pravi robot - tako preverimo tudi razčlenjevanje zlepljenih sporočil
+            writer.write(ZAPOREDJE_CIKLA[i % len(ZAPOREDJE_CIKLA)].encode())
+            cakajoci.append(time.perf_counter())
+            stats.poslanih += 1
+            i += 1
+            naslednje += interval
+            await asyncio.sleep(max(0.0, naslednje - time.perf_counter()))
+
+        # Počakaj na zadnja potrdila
+        rok = time.perf_counter() + 2.0
+        while cakajoci and time.perf_counter() < rok:
+            await asyncio.sleep(0.01)
+    except (ConnectionError, OSError):
+        stats.napake += 1
+    finally:
+        bralec.cancel()
+        writer.close()
+
+
+async def binarni_robot(i, args, konec, stats, reader, writer):
+    """Navidezni robot z binarnim protokolom: okvirji s seq in kumulativna potrdila."""
+    writer.write(BIN_POZDRAV.pack(MAGIC_BINARNO, args.binarna_stevilka + i))
+    _magic, seq = BIN_POZDRAV.unpack(await reader.readexactly(BIN_POZDRAV.size))
+
+    interval = 1.0 / args.hitrost
+    cakajoci = []  # (seq, čas pošiljanja) nepotrjenih okvirjev
+    naslednje = time.perf_counter()
+
+    async def beri_potrdila():
+        ostanek = b""
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                return
+            zdaj = time.perf_counter()
+            data = ostanek + data
+            celih = len(data) - len(data) % BIN_POTRDILO.size
+            ostanek = data[celih:]
+            for (potrjen,) in BIN_POTRDILO.iter_unpack(data[:celih]):
+                while cakajoci and cakajoci[0][0] <= potrjen:
+                    stats.rtt.append(zdaj - cakajoci.pop(0)[1])
+                    stats.potrjenih += 1
+
+    bralec = asyncio.create_task(beri_potrdila())
+    try:
+        while time.perf_counter() < konec:
+            if len(cakajoci) >= args.cevovod:
+                await asyncio.sleep(0.0005)
+                continue
+            seq += 1
+            kljuc = ZAPOREDJE_CIKLA[seq % len(ZAPOREDJE_CIKLA)]
+            writer.write(BIN_OKVIR.pack(KODE_STANJ[kljuc], seq, int(time.monotonic() * 1000) & 0x7FFFFFFF))
+            cakajoci.append((seq, time.perf_counter()))
+            stats.poslanih += 1
+            naslednje += interval
+            await asyncio.sleep(max(0.0, naslednje - time.perf_counter()))
+
+        rok = time.perf_counter() + 2.0
+        while cakajoci and time.perf_counter() < rok:
+            await asyncio.sleep(0.01)
+    except (ConnectionError, OSError):
+        stats.napake += 1
+    finally:
+        bralec.cancel()
+        writer.close()
+
+
+async def zazeni_robote(args, konec):
+    stats = [RobotStats() for _ in range(args.roboti)]
+    await asyncio.gather(*(navidezni_robot(i, args, konec, stats[i]) for i in range(args.roboti)))
+    return stats
+
+
+# --- HTTP odjemalci (niti) ---
+
+class HttpStats:
+    def __init__(self):
+        self.casi = {pot: [] for pot in HTTP_POTI}
+        self.napake = {pot: 0 for pot in HTTP_POTI}
+
+
+def http_odjemalec(args, konec, stats):
+    conn = http.client.HTTPConnection(args.host, args.http_port, timeout=10)
+    i = 0
+    while time.perf_counter() < konec:
+        pot = HTTP_POTI[i % len(HTTP_POTI)]
+        i += 1
+        zacetek = time.perf_counter()
+        try:
+            conn.request("GET", pot)
+            odgovor = conn.getresponse()
+            odgovor.read()
+            if odgovor.status >= 400:
+                stats.napake[pot] += 1
+            else:
+                stats.casi[pot].append(time.perf_counter() - zacetek)
+        except (OSError, http.client.HTTPException):
+            stats.napake[pot] += 1
+            conn.close()
+            conn = http.client.HTTPConnection(args.host, args.http_port, timeout=10)
+    conn.close()
+
+
+def zabelezenih_na_strezniku(args, ime, od_seq):
+    """Prešteje dogodke robota, ki jih je strežnik zabeležil po od_seq (prek /api/zgodovina)."""
+    conn = http.client.HTTPConnection(args.host, args.http_port, timeout=10)
+    skupaj = 0
+    since = od_seq
+    try:
+        while True:
+            conn.request("GET", f"/api/zgodovina?robot={ime}&since={since}&limit=10000")
+            odgovor = json.loads(conn.getresponse().read())
+            skupaj += len(odgovor["zapisi"])
+            if not odgovor["vec"]:
+                return skupaj
+            since = odgovor["zadnji_seq"]
+    finally:
+        conn.close()
+
+
+def trenutni_seq(args):
+    conn = http.client.HTTPConnection(args.host, args.http_port, timeout=10)
+    try:
+        conn.request("GET", "/api/zgodovina?limit=1&from=9999999999")
+        return json.loads(conn.getresponse().read())["naslednji_seq"] - 1
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Obremenitveni test sprejema stanj in REST API-ja.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--tcp-port", type=int, default=50000)
+    parser.add_argument("--http-port", type=int, default=5000)
+    parser.add_argument("--roboti", type=int, default=10, help="Število navideznih robotov")
+    parser.add_argument("--hitrost", type=float, default=10.0, help="Sporočil na sekundo na robota")
+    parser.add_argument("--cevovod", type=int, default=1, help="Največ nepotrjenih sporočil na robota")
+    parser.add_argument("--http-odjemalci", type=int, default=4, help="Število sočasnih HTTP odjemalcev")
+    parser.add_argument("--trajanje", type=float, default=10.0, help="Trajanje testa v sekundah")
+    parser.add_argument("--predpona", default="bench-", help="Predpona imen navideznih robotov")
+    parser.add_argument("--protokol", default="nizi", choices=["nizi", "binarno"],
+                        help="Protokol navideznih robotov (binarno: okvirji s kumulativnim potrdilom)")
+    parser.add_argument("--binarna-stevilka", type=int, default=9000,
+                        help="Številka prvega robota v binarnem protokolu (ime robota na strežniku)")
+    parser.add_argument("--izhod", help="Datoteka za rezultate (JSON); privzeto standardni izhod")
+    args = parser.parse_args()
+
+    od_seq = trenutni_seq(args)
+    zacetek = time.perf_counter()
+    konec = zacetek + args.trajanje
+
+    http_stats = HttpStats()
+    niti = [threading.Thread(target=http_odjemalec, args=(args, konec, http_stats), daemon=True)
+            for _ in range(args.http_odjemalci)]
+    for nit in niti:
+        nit.start()
+    robot_stats = asyncio.run(zazeni_robote(args, konec))
+    for nit in niti:
+        nit.join()
+    trajanje = time.perf_counter() - zacetek
+
+    poslanih = sum(s.poslanih for s in robot_stats)
+    potrjenih = sum(s.potrjenih for s in robot_stats)
+    zabelezenih = sum(zabelezenih_na_strezniku(args, ime_robota(args, i), od_seq) for i in range(args.roboti))
+    rtt = [x for s in robot_stats for x in s.rtt]
+
+    rezultat = {
+        "konfiguracija": vars(args),
+        "okolje": {"python": platform.python_version(), "sistem": platform.platform()},
+        "trajanje_s": round(trajanje, 3),
+        "ingest": {
+            "poslanih": poslanih,
+            "potrjenih": potrjenih,
+            "zabelezenih": zabelezenih,
+            "izgubljenih_ali_zlepljenih": poslanih - zabelezenih,
+            "napak_povezave": sum(s.napake for s in robot_stats),
+            "dogodkov_na_s": round(zabelezenih / trajanje, 1),
+            "rtt_potrdila_ms": percentili(rtt),
+        },
+        "http": {
+            pot: {
+                "zahtev": len(http_stats.casi[pot]),
+                "napak": http_stats.napake[pot],
+                "zahtev_na_s": round(len(http_stats.casi[pot]) / trajanje, 1),
+                "cas_odgovora_ms": percentili(http_stats.casi[pot]),
+            }
+            for pot in HTTP_POTI
+        },
+    }
+
+    izpis = json.dumps(rezultat, indent=2, ensure_ascii=False)
+    if args.izhod:
+        with open(args.izhod, "w", encoding="utf-8") as f:
+            f.write(izpis + "\n")
+    print(izpis)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+#
+# Ponovitev zajetih sej robotov (python main.py --zajem seja.ur5zajem)
+#
+# Zajem pošlje strežniku po enakih povezavah in v enakih kosih, kot jih je
+# prejel strežnik ob zajemu: v realnem času (--hitrost 1), N-krat hitreje ali
+# brez čakanja (--hitrost 0). Nato preveri, ali je zgodovina strežnika enaka
+# pričakovani, in izpiše hitrost razčlenjevanja ter zapisovanja. Z --v-procesu
+# tekočega strežnika ne potrebujemo: sprejem se zažene v tem procesu s pravim
+# IngestServer in zabelezi_sporocilo iz main.py, zato je zajem tudi ponovljiv
+# test zmogljivosti.
+#
+# Primer:
+#   python test/replay_capture.py seja.ur5zajem --v-procesu --hitrost 0
+#   python test/replay_capture.py seja.ur5zajem --tcp-port 50000 --http-port 5000 --hitrost 10
+#
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main as streznik  # noqa: E402
+from capture import TIP_POVEZAVA, TIP_PODATKI, TIP_ZAPRTO, preberi_zajem  # noqa: E402
+from framing import BinaryFramer, MessageFramer, POZDRAV, je_binarni_pozdrav  # noqa: E402
+from ingest import IngestServer, PREDPONA_ID, PREDPONE_VRSTIC, SPOROCILO_UTRIP  # noqa: E402
+
+
+class Seja:
+    """Ena zajeta povezava: naslov robota, kosi (cas_ns, bajti) in čas zaprtja."""
+
+    def __init__(self, stevilka, addr, zacetek_ns):
+        self.stevilka = stevilka
+        self.addr = addr
+        self.zacetek_ns = zacetek_ns
+        self.kosi = []
+        self.konec_ns = None
+
+
+def nalozi_seje(pot):
+    seje = {}
+    for cas_ns, stevilka, tip, vsebina in preberi_zajem(pot):
+        if tip == TIP_POVEZAVA:
+            seje[stevilka] = Seja(stevilka, vsebina.decode("utf-8"), cas_ns)
+        elif stevilka not in seje:
+            continue  # Zajem se je začel sredi povezave
+        elif tip == TIP_PODATKI:
+            seje[stevilka].kosi.append((cas_ns, vsebina))
+        elif tip == TIP_ZAPRTO:
+            seje[stevilka].konec_ns = cas_ns
+    return sorted(seje.values(), key=lambda s: s.zacetek_ns)
+
+
+def razcleni_sejo(seja, privzeti_robot, zadnji_seq_robotov):
+    """Razčleni sejo enako kot IngestServer in vrne zabeležena stanja kot seznam (robot_id, kljuc).
+
+    zadnji_seq_robotov (robot_id -> zadnja zabeležena seq binarnega protokola) se prenaša med sejami
+    v vrstnem redu povezav, kot IngestServer._zadnji_seq_robotov: okvirje, ki jih robot po ponovni
+    povezavi pošlje znova, strežnik zavrže.
+    """
+    kljucne_besede = list(streznik.STANJA_SKATLE)
+    kljuci_framerja = kljucne_besede + [SPOROCILO_UTRIP]
+    robot = privzeti_robot
+    dogodki = []
+    zacetek = bytearray()
+    framer = None
+    for _cas_ns, data in seja.kosi:
+        if framer is None:
+            zacetek += data
+            binarno = je_binarni_pozdrav(zacetek)
+            if binarno is None:
+                continue
+            if binarno:
+                _magic, stevilka = POZDRAV.unpack_from(zacetek)
+                robot = str(stevilka) if stevilka else robot
+                framer = BinaryFramer()
+                data = bytes(zacetek[POZDRAV.size:])
+                zadnji_seq = zadnji_seq_robotov.get(robot, 0)
+            else:
+                framer = MessageFramer(streznik.FRAMING_MODE, kljuci_framerja, predpone_vrstic=PREDPONE_VRSTIC)
+                data = bytes(zacetek)
+
+        if isinstance(framer, BinaryFramer):
+            for koda, seq, _cas in framer.feed(data):
+                if koda < 0 or seq <= zadnji_seq:  # Utrip ali odgovor na ukaz (glej framing.py)
+                    continue
+                zadnji_seq = zadnji_seq_robotov[robot] = seq
+                if 0 <= koda < len(kljucne_besede):
+                    dogodki.append((robot, kljucne_besede[koda]))
+            continue
+
+        try:
+            sporocila = framer.feed(data)
+        except ValueError:
+            break  # Strežnik ob napaki razčlenjevanja zapre povezavo
+        for sporocilo in sporocila:
+            if sporocilo.startswith(PREDPONA_ID):
+                robot = sporocilo[len(PREDPONA_ID):] or privzeti_robot
+            elif sporocilo in streznik.STANJA_SKATLE:
+                dogodki.append((robot, sporocilo))
+    return dogodki
+
+
+# --- Ponovitev ---
+
+async def ponovi_sejo(seja, args, t0_ns, zacetek):
+    """Odpre povezavo ob (relativnem) času zajema in pošlje kose v enakih razmikih."""
+    async def pocakaj_do(cas_ns):
+        if args.hitrost > 0:
+            await asyncio.sleep(max(0.0, zacetek + (cas_ns - t0_ns) / 1e9 / args.hitrost - time.perf_counter()))
+
+    await pocakaj_do(seja.zacetek_ns)
+    reader, writer = await asyncio.open_connection(args.host, args.tcp_port)
+
+    async def zavrzi_odgovore():
+        while await reader.read(65536):
+            pass
+
+    bralec = asyncio.create_task(zavrzi_odgovore())
+    try:
+        for cas_ns, data in seja.kosi:
+            await pocakaj_do(cas_ns)
+            writer.write(data)
+            await writer.drain()
+        if seja.konec_ns is not None:
+            await pocakaj_do(seja.konec_ns)
+        # Polovično zapiranje: strežnik prebere vse do konca in šele nato zapre povezavo
+        writer.write_eof()
+        await asyncio.wait_for(bralec, timeout=10)
+    except (ConnectionError, asyncio.TimeoutError):
+        bralec.cancel()
+    finally:
+        writer.close()
+
+
+async def ponovi(seje, args):
+    t0_ns = seje[0].zacetek_ns
+    zacetek = time.perf_counter()
+    await asyncio.gather(*(ponovi_sejo(seja, args, t0_ns, zacetek) for seja in seje))
+    return zacetek
+
+
+# --- Branje zgodovine strežnika ---
+
+class VProcesu:
+    """Sprejem v tem procesu: IngestServer z zabelezi_sporocilo iz main.py in začasnim dnevnikom."""
+
+    def __init__(self, args):
+        streznik.log.nastavi(nivo="WARNING")
+        self._mapa = tempfile.TemporaryDirectory(prefix="ur5_ponovitev_")
+        streznik.pripravi_sprejem(self._mapa.name)
+        streznik.dnevnik_dogodkov.start()
+        # Anonimne seje z različnih robotov se ob ponovitvi vse povežejo z 127.0.0.1
+        self.server = IngestServer("127.0.0.1", 0, streznik.zabelezi_sporocilo, streznik.FRAMING_MODE,
+                                   streznik.STANJA_SKATLE, streznik.metrike, izlocaj_zastarele=False)
+        self.server.bind()
+        args.host, args.tcp_port = self.server.naslov
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+
+    def naslednji_seq(self):
+        return streznik.posnetek.zgodovina.naslednji_seq
+
+    def dogodki(self, od_seq):
+        return [(robot, streznik.KLJUCI_STANJ[koda])
+                for _seq, _cas, koda, robot in streznik.posnetek.zgodovina.zapisi(od_seq)]
+
+    def zapri(self):
+        self.server.stop()
+        streznik.dnevnik_dogodkov.zapri()
+        self._mapa.cleanup()
+
+
+class PrekoHttp:
+    """Zunanji strežnik: zgodovino beremo prek /api/zgodovina."""
+
+    def __init__(self, args):
+        self.args = args
+
+    def _api(self, poizvedba):
+        conn = http.client.HTTPConnection(self.args.host, self.args.http_port, timeout=10)
+        try:
+            conn.request("GET", f"/api/zgodovina?{poizvedba}")
+            return json.loads(conn.getresponse().read())
+        finally:
+            conn.close()
+
+    def naslednji_seq(self):
+        return self._api("limit=1&from=9999999999")["naslednji_seq"]
+
+    def dogodki(self, od_seq):
+        dogodki = []
+        since = od_seq - 1
+        while True:
+            odgovor = self._api(f"since={since}&limit=10000")
+            dogodki.extend((z["robot"], z["kljuc"]) for z in odgovor["zapisi"])
+            if not odgovor["vec"]:
+                return dogodki
+            since = odgovor["zadnji_seq"]
+
+    def zapri(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ponovitev zajetih sej robotov in preverjanje zgodovine.")
+    parser.add_argument("zajem", help="Datoteka zajema (main.py --zajem)")
+    parser.add_argument("--hitrost", type=float, default=1.0, help="1 = realni čas, N = N-krat hitreje, 0 = brez čakanja")
+    parser.add_argument("--v-procesu", action="store_true", help="Zaženi sprejem v tem procesu (brez tekočega strežnika)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--tcp-port", type=int, default=50000)
+    parser.add_argument("--http-port", type=int, default=5000)
+    parser.add_argument("--rok", type=float, default=30.0, help="Največ toliko sekund čakamo na zapis vseh dogodkov")
+    parser.add_argument("--izhod", help="Datoteka za rezultate (JSON); privzeto standardni izhod")
+    args = parser.parse_args()
+
+    seje = nalozi_seje(args.zajem)
+    if not seje:
+        parser.error(f"V zajemu '{args.zajem}' ni nobene povezave.")
+    bajtov = sum(len(data) for seja in seje for _cas, data in seja.kosi)
+    kosov = sum(len(seja.kosi) for seja in seje)
+    zadnji_ns = max(max((cas for cas, _data in seja.kosi), default=seja.zacetek_ns) for seja in seje)
+
+    cilj = VProcesu(args) if args.v_procesu else PrekoHttp(args)
+    try:
+        # Robot brez imena dobi ime po IP naslovu, ki ga strežnik vidi ob ponovitvi
+        privzeti_robot = "127.0.0.1" if args.host in ("127.0.0.1", "localhost") else args.host
+
+        # Razčlenjevanje brez omrežja: pričakovani dogodki in hitrost razčlenjevalnika
+        zacetek = time.perf_counter()
+        zadnji_seq_robotov = {}
+        pricakovani = [d for seja in seje for d in razcleni_sejo(seja, privzeti_robot, zadnji_seq_robotov)]
+        cas_razclenjevanja = time.perf_counter() - zacetek
+
+        od_seq = cilj.naslednji_seq()
+        zacetek = asyncio.run(ponovi(seje, args))
+        poslano = time.perf_counter()
+        rok = poslano + args.rok
+        while cilj.naslednji_seq() - od_seq < len(pricakovani) and time.perf_counter() < rok:
+            time.sleep(0.001)
+        zabelezeno = time.perf_counter()
+
+        roboti = {robot for robot, _kljuc in pricakovani}
+        dejanski = [d for d in cilj.dogodki(od_seq) if d[0] in roboti]
+    finally:
+        cilj.zapri()
+
+    razlike = {}
+    pricakovani_po_robotih, dejanski_po_robotih = Counter(pricakovani), Counter(dejanski)
+    for kljuc in set(pricakovani_po_robotih) | set(dejanski_po_robotih):
+        if pricakovani_po_robotih[kljuc] != dejanski_po_robotih[kljuc]:
+            robot, stanje = kljuc
+            razlike[f"{robot}/{stanje}"] = {"pricakovano": pricakovani_po_robotih[kljuc],
+                                            "zabelezeno": dejanski_po_robotih[kljuc]}
+
+    trajanje = zabelezeno - zacetek
+    rezultat = {
+        "konfiguracija": vars(args),
+        "zajem": {
+            "sej": len(seje),
+            "kosov": kosov,
+            "bajtov": bajtov,
+            "trajanje_s": round((zadnji_ns - seje[0].zacetek_ns) / 1e9, 3),
+        },
+        "razclenjevanje": {
+            "cas_s": round(cas_razclenjevanja, 4),
+            "bajtov_na_s": round(bajtov / cas_razclenjevanja) if cas_razclenjevanja else None,
+            "sporocil_na_s": round(len(pricakovani) / cas_razclenjevanja) if cas_razclenjevanja else None,
+        },
+        "ponovitev": {
+            "trajanje_s": round(trajanje, 3),
+            "posiljanje_s": round(poslano - zacetek, 3),
+            "dogodkov_na_s": round(len(dejanski) / trajanje, 1) if trajanje else None,
+        },
+        "preverjanje": {
+            "ujema": not razlike,
+            "pricakovanih": len(pricakovani),
+            "zabelezenih": len(dejanski),
+            "razlike": razlike,
+        },
+    }
+
+    izpis = json.dumps(rezultat, indent=2, ensure_ascii=False)
+    if args.izhod:
+        with open(args.izhod, "w", encoding="utf-8") as f:
+            f.write(izpis + "\n")
+    print(izpis)
+    sys.exit(0 if not razlike else 1)
+
+
+if __name__ == "__main__":
+    main()
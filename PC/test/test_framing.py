@@ -0,0 +1,60 @@
+#
+# Testi razčlenjevanja toka bajtov v sporočila (framing.py)
+#
+# Primer:
+#   python test/test_framing.py
+#
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import STANJA_SKATLE  # noqa: E402
+from framing import MessageFramer, NACIN_KLJUCNE_BESEDE  # noqa: E402
+from ingest import PREDPONE_VRSTIC, SPOROCILO_UTRIP  # noqa: E402
+
+
+def nov_framer():
+    """Razčlenjevalnik z enakimi nastavitvami, kot ga za nizovno povezavo ustvari IngestServer."""
+    return MessageFramer(NACIN_KLJUCNE_BESEDE, list(STANJA_SKATLE) + [SPOROCILO_UTRIP],
+                         predpone_vrstic=PREDPONE_VRSTIC)
+
+
+def razcleni(*kosi):
+    """Sporočila, ki jih razčlenjevalnik vrne za zaporedne kose recv(), po kosih."""
+    framer = nov_framer()
+    return [framer.feed(kos) for kos in kosi]
+
+
+class TestOdgovorNaUkaz(unittest.TestCase):
+    def test_odgovor_s_kljucno_besedo(self):
+        self.assertEqual(razcleni(b"ODGOVOR=3;ZAPRTA\n"), [["ODGOVOR=3;ZAPRTA"]])
+
+    def test_odgovor_razdeljen_na_kose(self):
+        self.assertEqual(razcleni(b"ODGOVOR=5;", b"Z", b"X\n"), [[], [], ["ODGOVOR=5;ZX"]])
+        self.assertEqual(razcleni(b"ODG", b"OVOR=7;ODPRTA", b"\nPRISPELA"),
+                         [[], [], ["ODGOVOR=7;ODPRTA", "PRISPELA"]])
+
+    def test_stanja_okoli_odgovora(self):
+        self.assertEqual(razcleni(b"ODKLENJENAODGOVOR=1;OK\nODPRTA"),
+                         [["ODKLENJENA", "ODGOVOR=1;OK", "ODPRTA"]])
+
+    def test_nedokoncan_odgovor_ob_zaprtju(self):
+        framer = nov_framer()
+        self.assertEqual(framer.feed(b"ODGOVOR=2;ZAPRTA"), [])
+        self.assertEqual(framer.flush(), ["ODGOVOR=2;ZAPRTA"])
+
+
+class TestImeRobota(unittest.TestCase):
+    def test_ime_razdeljeno_na_kose(self):
+        self.assertEqual(razcleni(b"ROBOT=cel", b"ica-2\n"), [[], ["ROBOT=celica-2"]])
+        self.assertEqual(razcleni(b"ROB", b"OT=celica-3", b"\nPRISPELA"), [[], [], ["ROBOT=celica-3", "PRISPELA"]])
+
+    def test_ime_s_kljucno_besedo(self):
+        self.assertEqual(razcleni(b"ROBOT=ZAPRTA-1\nZAPRTA"), [["ROBOT=ZAPRTA-1", "ZAPRTA"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,284 @@
+#
+# Navidezne celice UR5 za preizkus PC/main.py brez robota
+#
+# Vsaka celica izvaja zaporedje programa UR5/David.txt: počaka, da trak
+# pripelje škatlo (digital_in[5]), nato pošlje PRISPELA, ODKLENJENA, ODPRTA,
+# ZAPRTA, ZAKLENJENA in ODPRAVLJENA z zamiki, ki ustrezajo gibom robota.
+# ODPRAVLJENA pošlje le, če je škatla še pri senzorju (If digital_in[5]); z
+# verjetnostjo --brez-odpravljene je ni več, zato za ZAKLENJENA pride PRISPELA.
+# Kot pravi program po vsaki škatli zapre vtičnico (socket_close, Halt) in se
+# ob ponovnem zagonu znova poveže, razen z --ena-povezava.
+#
+# Z --protokol binarno --ponovno-poslji N celica po vsaki ponovni povezavi
+# znova pošlje zadnjih N že potrjenih okvirjev (kot robot, ki potrdila ni
+# prejel); strežnik jih mora zavreči kot podvojene
+# (ur5_ingest_duplicate_frames_total), zgodovina pa ostati brez dvojnikov.
+#
+# Primer:
+#   python main.py                      (strežnik, HOST nastavljen na 127.0.0.1)
+#   python test/ur5_fleet_simulator.py --celice 300 --faktor 20 --trajanje 60
+#
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import KODE_STANJ  # noqa: E402
+from framing import KODA_ODGOVOR, KODA_UTRIP, MAGIC_BINARNO, OKVIR, OZNAKA_UKAZA, POTRDILO, POZDRAV, UKAZ  # noqa: E402
+from ingest import SPOROCILO_UTRIP  # noqa: E402
+
+ZAPOREDJE_CIKLA = ["PRISPELA", "ODKLENJENA", "ODPRTA", "ZAPRTA", "ZAKLENJENA", "ODPRAVLJENA"]
+
+# Čas (s) od posameznega stanja do naslednjega pri realni hitrosti, ocenjen iz gibov v David.txt
+TRAJANJA_FAZ = {
+    "PRISPELA": 3.0,     # MoveL do pokrova (Waypoint_14), zapiranje prijemala, vklop ključavnice
+    "ODKLENJENA": 1.5,   # Dvig pokrova (Waypoint_5)
+    "ODPRTA": 14.0,      # Odlaganje pokrova, umik domov, Wait 2.0, vrnitev pokrova na škatlo
+    "ZAPRTA": 2.0,       # Odpiranje prijemala, napajanje ključavnice 1 s
+    "ZAKLENJENA": 2.0,   # Vrnitev domov (Waypoint_13), preverjanje digital_in[5]
+}
+PRIHOD_SKATLE_S = 5.0   # Trak pripelje naslednjo škatlo do senzorja digital_in[5]
+ODHOD_SKATLE_S = 1.0    # Loop digital_in[5]: škatla zapusti senzor
+ZAGON_PROGRAMA_S = 0.5  # Od Halt do ponovnega zagona programa in socket_open
+PONOVNI_POSKUS_S = 0.5  # Loop not open_socket
+
+# Binarni protokol in kode stanj uvozimo iz PC/framing.py in PC/config.py, da se ne razideta s strežnikom
+UTRIP = SPOROCILO_UTRIP.encode()  # Srčni utrip v nizovnem protokolu
+
+
+class CelicaStats:
+    def __init__(self):
+        self.povezav = 0
+        self.ciklov = 0
+        self.poslanih = 0
+        self.napake = 0
+        self.ukazov = 0
+        self.ponovljenih = 0
+        self.brez_odpravljene = 0
+
+
+class Celica:
+    """Ena navidezna robotska celica (robot, trak in senzor škatle)."""
+
+    def __init__(self, i, args, stats):
+        self.i = i
+        self.args = args
+        self.stats = stats
+        self.ime = str(args.binarna_stevilka + i) if args.protokol == "binarno" else f"{args.predpona}{i}"
+        self._seq = 0
+        self._poslani = deque(maxlen=max(0, args.ponovno_poslji))  # Zadnji binarni okvirji za --ponovno-poslji
+        self._zacetek = time.monotonic()
+        self._reader = None
+        self._writer = None
+        self._bralec = None
+        self._utrip = None
+
+    async def _cakaj(self, sekunde):
+        raztros = self.args.raztros
+        await asyncio.sleep(sekunde * random.uniform(1 - raztros, 1 + raztros) / self.args.faktor)
+
+    async def _povezi(self, konec):
+        """BeforeStart: socket_open, ponavljaj do uspeha."""
+        while time.monotonic() < konec:
+            try:
+                self._reader, self._writer = await asyncio.open_connection(self.args.host, self.args.tcp_port)
+            except OSError:
+                self.stats.napake += 1
+                await asyncio.sleep(PONOVNI_POSKUS_S / self.args.faktor)
+                continue
+            self.stats.povezav += 1
+            if self.args.protokol == "binarno":
+                self._writer.write(POZDRAV.pack(MAGIC_BINARNO, self.args.binarna_stevilka + self.i))
+                _magic, zadnji = POZDRAV.unpack(await self._reader.readexactly(POZDRAV.size))
+                self._seq = max(self._seq, zadnji)
+                # Robot, ki odgovora na pozdrav ne upošteva, po prekinitvi znova pošlje zadnje okvirje
+                for okvir in self._poslani:
+                    self._writer.write(okvir)
+                    self.stats.ponovljenih += 1
+            else:
+                # Pravi robot se ne predstavi; na enem računalniku bi imele vse celice enak IP
+                self._writer.write(f"ROBOT={self.ime}\n".encode())
+            # Program robota odgovorov ne bere; mi jih sproti zavržemo, da ne napolnijo medpomnilnika.
+            # Z --ukazi celica kot ločena nit programa robota bere ukaze PC in nanje odgovori.
+            if self.args.ukazi:
+                self._bralec = asyncio.create_task(self._odgovarjaj_na_ukaze(self._reader, self._writer))
+            else:
+                self._bralec = asyncio.create_task(self._zavrzi_odgovore(self._reader))
+            if self.args.utrip:
+                self._utrip = asyncio.create_task(self._posiljaj_utrip())
+            return True
+        return False
+
+    @staticmethod
+    async def _zavrzi_odgovore(reader):
+        while await reader.read(4096):
+            pass
+
+    async def _odgovarjaj_na_ukaze(self, reader, writer):
+        try:
+            if self.args.protokol == "binarno":
+                while True:
+                    # Potrdilo in ukaz se začneta z enakim številom; ukaz ima oznako OZNAKA_UKAZA
+                    zacetek = await reader.readexactly(POTRDILO.size)
+                    if POTRDILO.unpack(zacetek)[0] != OZNAKA_UKAZA:
+                        continue  # Potrdilo
+                    _oznaka, id_ukaza, _koda, _argument = UKAZ.unpack(
+                        zacetek + await reader.readexactly(UKAZ.size - POTRDILO.size))
+                    self.stats.ukazov += 1
+                    writer.write(OKVIR.pack(KODA_ODGOVOR, id_ukaza, 1))
+            # socket_read_string(prefix="UKAZ;", suffix="\n"): vse pred predpono (potrdila "OK") se zavrže
+            buf = b""
+            while data := await reader.read(4096):
+                buf += data
+                while True:
+                    zacetek = buf.find(b"UKAZ;")
+                    if zacetek < 0:
+                        buf = buf[-4:]
+                        break
+                    konec = buf.find(b"\n", zacetek)
+                    if konec < 0:
+                        buf = buf[zacetek:]
+                        break
+                    id_ukaza, ime, _argument = buf[zacetek + 5:konec].decode().split(";")
+                    buf = buf[konec + 1:]
+                    self.stats.ukazov += 1
+                    writer.write(f"ODGOVOR={id_ukaza};{ime}_OK\n".encode())
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    async def _posiljaj_utrip(self):
+        """Ločena nit programa robota, ki na --utrip sekund pošlje utrip."""
+        while self._writer is not None:
+            await asyncio.sleep(self.args.utrip / self.args.faktor)
+            if self._writer is None:
+                return
+            if self.args.protokol == "binarno":
+                self._writer.write(OKVIR.pack(KODA_UTRIP, self._seq, 0))
+            else:
+                self._writer.write(UTRIP)
+
+    async def _zapri(self):
+        if self._utrip is not None:
+            self._utrip.cancel()
+            self._utrip = None
+        if self._bralec is not None:
+            self._bralec.cancel()
+            self._bralec = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    async def _poslji(self, kljuc):
+        if self.args.protokol == "binarno":
+            self._seq += 1
+            cas_ms = int((time.monotonic() - self._zacetek) * 1000) & 0x7FFFFFFF
+            okvir = OKVIR.pack(KODE_STANJ[kljuc], self._seq, cas_ms)
+            self._writer.write(okvir)
+            self._poslani.append(okvir)
+        else:
+            # socket_send_string pošlje goli niz, brez ločila
+            self._writer.write(kljuc.encode())
+        await self._writer.drain()
+        self.stats.poslanih += 1
+
+    async def zazeni(self, konec):
+        # Celice ne začnejo hkrati, kot tudi škatle ne prispejo hkrati na vse trakove
+        await asyncio.sleep(random.uniform(0, PRIHOD_SKATLE_S) / self.args.faktor)
+        try:
+            while time.monotonic() < konec and (not self.args.cikli or self.stats.ciklov < self.args.cikli):
+                if self._writer is None and not await self._povezi(konec):
+                    return
+                await self._cakaj(PRIHOD_SKATLE_S)
+                for kljuc in ZAPOREDJE_CIKLA:
+                    if kljuc == "ODPRAVLJENA" and random.random() < self.args.brez_odpravljene:
+                        # If digital_in[5]: škatle ni več pri senzorju, zato robot ODPRAVLJENA ne pošlje
+                        self.stats.brez_odpravljene += 1
+                        continue
+                    await self._poslji(kljuc)
+                    if kljuc in TRAJANJA_FAZ:
+                        await self._cakaj(TRAJANJA_FAZ[kljuc])
+                self.stats.ciklov += 1
+                await self._cakaj(ODHOD_SKATLE_S)
+                if not self.args.ena_povezava:
+                    await self._zapri()
+                    await self._cakaj(ZAGON_PROGRAMA_S)
+        except (ConnectionError, OSError, asyncio.IncompleteReadError):
+            self.stats.napake += 1
+        finally:
+            await self._zapri()
+
+
+async def zazeni_celice(args, konec):
+    stats = [CelicaStats() for _ in range(args.celice)]
+    celice = [Celica(i, args, stats[i]) for i in range(args.celice)]
+    await asyncio.gather(*(celica.zazeni(konec) for celica in celice))
+    return celice
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Navidezne celice UR5, ki izvajajo cikel škatle iz David.txt.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--tcp-port", type=int, default=50000)
+    parser.add_argument("--celice", type=int, default=10, help="Število sočasnih navideznih celic")
+    parser.add_argument("--faktor", type=float, default=1.0, help="Pospešek časa (10 = desetkrat hitreje od robota)")
+    parser.add_argument("--raztros", type=float, default=0.1, help="Naključni raztros trajanj (0.1 = ±10 %%)")
+    parser.add_argument("--trajanje", type=float, default=60.0, help="Trajanje simulacije v sekundah")
+    parser.add_argument("--cikli", type=int, default=0, help="Največ ciklov na celico (0 = do konca trajanja)")
+    parser.add_argument("--ena-povezava", action="store_true",
+                        help="Celica ostane povezana med cikli (pravi program se po vsaki škatli odklopi)")
+    parser.add_argument("--predpona", default="celica-", help="Predpona imen celic (ROBOT=<ime>)")
+    parser.add_argument("--protokol", default="nizi", choices=["nizi", "binarno"], help="Protokol celic")
+    parser.add_argument("--binarna-stevilka", type=int, default=1000,
+                        help="Številka prve celice v binarnem protokolu (ime robota na strežniku)")
+    parser.add_argument("--utrip", type=float, default=0.0,
+                        help="Na toliko sekund (v času robota) pošlji srčni utrip (0 = brez)")
+    parser.add_argument("--ukazi", action="store_true", help="Beri ukaze PC (/api/ukaz) in nanje odgovori")
+    parser.add_argument("--ponovno-poslji", type=int, default=0,
+                        help="Binarno: po ponovni povezavi znova pošlji toliko zadnjih okvirjev (strežnik jih zavrže)")
+    parser.add_argument("--brez-odpravljene", type=float, default=0.05,
+                        help="Verjetnost, da škatle po zaklepanju ni več pri senzorju in ODPRAVLJENA izostane")
+    parser.add_argument("--seme", type=int, help="Seme generatorja naključnih števil (ponovljivi zamiki)")
+    parser.add_argument("--izhod", help="Datoteka za rezultate (JSON); privzeto standardni izhod")
+    args = parser.parse_args()
+    if args.faktor <= 0:
+        parser.error("--faktor mora biti pozitiven")
+    if not 0 <= args.brez_odpravljene <= 1:
+        parser.error("--brez-odpravljene mora biti med 0 in 1")
+    random.seed(args.seme)
+
+    zacetek = time.monotonic()
+    celice = asyncio.run(zazeni_celice(args, zacetek + args.trajanje))
+    trajanje = time.monotonic() - zacetek
+
+    poslanih = sum(c.stats.poslanih for c in celice)
+    rezultat = {
+        "konfiguracija": vars(args),
+        "trajanje_s": round(trajanje, 3),
+        "simuliran_cas_s": round(trajanje * args.faktor, 1),
+        "celic": args.celice,
+        "povezav": sum(c.stats.povezav for c in celice),
+        "ciklov": sum(c.stats.ciklov for c in celice),
+        "poslanih": poslanih,
+        "dogodkov_na_s": round(poslanih / trajanje, 1),
+        "napak": sum(c.stats.napake for c in celice),
+        "ukazov": sum(c.stats.ukazov for c in celice),
+        "ponovljenih": sum(c.stats.ponovljenih for c in celice),
+        "brez_odpravljene": sum(c.stats.brez_odpravljene for c in celice),
+    }
+
+    izpis = json.dumps(rezultat, indent=2, ensure_ascii=False)
+    if args.izhod:
+        with open(args.izhod, "w", encoding="utf-8") as f:
+            f.write(izpis + "\n")
+    print(izpis)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import threading
+import time
+from collections import deque
+
+from async_log import log
+from history import oblikuj_cas
+
+# --- Preverjanje prehodov med stanji škatle ---
+#
+# Za vsakega robota hranimo le zadnje stanje in njegov čas. Vsak dogodek
+# preverimo v tabeli dovoljenih prehodov (en vpogled v slovar), zato je cena
+# O(1) ne glede na dolžino zgodovine. Za faze z omejenim trajanjem si zapomnimo
+# rok v vrsti tistega stanja: ker ima vsako stanje en sam rok, so roki v vrsti
+# urejeni po času in preverjanje poteklih rokov pregleda le začetke vrst.
+# Dogodkov ne zavračamo - neveljaven prehod se zabeleži kot opozorilo.
+#
+# Roki tečejo po monotoni uri (time.monotonic_ns), zato premik sistemske ure
+# (NTP, ročna nastavitev) ne sproži ali zadrži opozoril. Ob obnovi iz dnevnika
+# roke znova nastavimo: starost obnovljenega stanja (po uri sistema) odštejemo
+# od monotonega časa, tako da robot, ki obtiči čez ponovni zagon, še dobi opozorilo.
+
+VRSTA_VRSTNI_RED = "vrstni_red"          # Prehod, ki ga tabela ne dovoli (npr. ODPRTA pred ODKLENJENA)
+VRSTA_PODVOJENO = "podvojeno"            # Isto stanje dvakrat zapored
+VRSTA_PREKORACEN_CAS = "prekoracen_cas"  # Robot je v stanju dlje, kot dovoljuje rok faze
+
+VRSTE_OPOZORIL = (VRSTA_VRSTNI_RED, VRSTA_PODVOJENO, VRSTA_PREKORACEN_CAS)
+
+
+class _RobotFaza:
+    __slots__ = ("kljuc", "cas_ns", "vstop_ns", "generacija")
+
+    def __init__(self):
+        self.kljuc = None
+        self.cas_ns = None
+        self.vstop_ns = None  # Vstop v stanje po monotoni uri (za roke)
+        self.generacija = 0  # Poveča se ob vsakem dogodku; zastareli roki imajo staro generacijo
+
+
+class TransitionValidator:
+    """Končni avtomat cikla škatle, podan s tabelo prehodov, z omejenim medpomnilnikom opozoril.
+
+    prehodi preslika zadnje stanje (None = robot še ni poslal ničesar) v množico
+    dovoljenih naslednjih stanj, roki_s pa stanje v najdaljše dovoljeno trajanje
+    faze v sekundah.
+    """
+
+    def __init__(self, prehodi, roki_s=None, kapaciteta=1000, metrike=None):
+        self.prehodi = {stanje: frozenset(naslednja) for stanje, naslednja in prehodi.items()}
+        self.roki_ns = {stanje: int(s * 1e9) for stanje, s in (roki_s or {}).items()}
+        self.kapaciteta = kapaciteta
+
+        self._lock = threading.Lock()
+        self._roboti = {}
+        self._roki = {stanje: deque() for stanje in self.roki_ns}  # stanje -> (monotoni rok_ns, robot, generacija)
+        self._opozorila = deque(maxlen=kapaciteta)
+        self._naslednji_id = 1
+        self._stevila = dict.fromkeys(VRSTE_OPOZORIL, 0)
+        self._m_opozorila = {}
+        if metrike is not None:
+            for vrsta in VRSTE_OPOZORIL:
+                self._m_opozorila[vrsta] = metrike.counter(f"ur5_alerts_{vrsta}_total",
+                                                           f"Opozorila preverjanja prehodov vrste '{vrsta}'")
+
+    def dodaj(self, robot, kljuc, cas_ns, obnova=False):
+        """Preveri en dogodek robota. Z obnova=True le nastavi stanje in rok (ob zagonu iz dnevnika)."""
+        vstop_ns = time.monotonic_ns()
+        if obnova:
+            vstop_ns -= max(0, time.time_ns() - cas_ns)
+        with self._lock:
+            r = self._roboti.get(robot)
+            if r is None:
+                r = self._roboti[robot] = _RobotFaza()
+            prejsnje = r.kljuc
+            r.kljuc = kljuc
+            r.cas_ns = cas_ns
+            r.vstop_ns = vstop_ns
+            r.generacija += 1
+            rok = self.roki_ns.get(kljuc)
+            if rok is not None:
+                self._roki[kljuc].append((vstop_ns + rok, robot, r.generacija))
+            if obnova:
+                return
+
+            if kljuc == prejsnje:
+                self._opozori(VRSTA_PODVOJENO, robot, kljuc, prejsnje, cas_ns, f"Stanje {kljuc} je prispelo dvakrat zapored.")
+            else:
+                dovoljena = self.prehodi.get(prejsnje)
+                if dovoljena is not None and kljuc not in dovoljena:
+                    self._opozori(VRSTA_VRSTNI_RED, robot, kljuc, prejsnje, cas_ns,
+                                  f"Za {prejsnje or 'začetkom'} je prispelo {kljuc}, pričakovano {' ali '.join(sorted(dovoljena))}.",
+                                  pricakovano=sorted(dovoljena))
+
+    def preveri_roke(self, zdaj_ns=None):
+        """Zabeleži opozorila za faze, ki trajajo dlje od roka. Vrne število novih opozoril.
+
+        zdaj_ns je čas po monotoni uri (privzeto time.monotonic_ns()).
+        """
+        if zdaj_ns is None:
+            zdaj_ns = time.monotonic_ns()
+        cas_ns = time.time_ns()  # Čas opozorila za prikaz
+        novih = 0
+        with self._lock:
+            for kljuc, vrsta in self._roki.items():
+                while vrsta and vrsta[0][0] <= zdaj_ns:
+                    _rok, robot, generacija = vrsta.popleft()
+                    r = self._roboti[robot]
+                    if r.generacija != generacija:
+                        continue  # Robot je medtem nadaljeval
+                    trajanje = (zdaj_ns - r.vstop_ns) / 1e9
+                    self._opozori(VRSTA_PREKORACEN_CAS, robot, kljuc, None, cas_ns,
+                                  f"Robot je v stanju {kljuc} že {trajanje:.0f} s (rok {self.roki_ns[kljuc] / 1e9:g} s).")
+                    novih += 1
+        return novih
+
+    def _opozori(self, vrsta, robot, kljuc, prejsnje, cas_ns, opis, pricakovano=None):
+        self._opozorila.append({
+            "id": self._naslednji_id,
+            "cas_ns": cas_ns,
+            "cas": oblikuj_cas(cas_ns),
+            "robot": robot,
+            "vrsta": vrsta,
+            "stanje": kljuc,
+            "prejsnje": prejsnje,
+            "pricakovano": pricakovano,
+            "opis": opis,
+        })
+        self._naslednji_id += 1
+        self._stevila[vrsta] += 1
+        log.warning(f"⚠️ {opis}", robot=robot, vrsta=vrsta)
+        if vrsta in self._m_opozorila:
+            self._m_opozorila[vrsta].inc()
+
+    def opozorila(self, od_id=None, robot=None, limit=None):
+        """Opozorila z id > od_id (od najstarejšega ohranjenega naprej), po želji le za enega robota."""
+        with self._lock:
+            opozorila = list(self._opozorila)
+            zadnji_id = self._naslednji_id - 1
+            stevila = dict(self._stevila)
+        if od_id is not None:
+            # Id-ji v medpomnilniku so zaporedni, zato začetek izračunamo namesto iskanja
+            opozorila = opozorila[max(0, len(opozorila) - (zadnji_id - od_id)):] if od_id < zadnji_id else []
+        if robot is not None:
+            opozorila = [o for o in opozorila if o["robot"] == robot]
+        if limit is not None:
+            opozorila = opozorila[-limit:]
+        return {"opozorila": opozorila, "zadnji_id": zadnji_id, "stevila": stevila}
+
+    def faze(self):
+        """Trenutno stanje in čas vstopa vanj za vsakega robota."""
+        with self._lock:
+            return {robot: {"stanje": r.kljuc, "od": oblikuj_cas(r.cas_ns) if r.cas_ns else None}
+                    for robot, r in self._roboti.items()}